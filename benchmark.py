@@ -0,0 +1,451 @@
+'''
+Benchmarks for the box packing algorithm
+
+Run from this directory:
+    python benchmark.py item_pool 1000 10000 100000
+
+Each benchmark prints one line per size with the time taken in seconds.
+'''
+from core import dim_to_cm, mass_to_g, normalize_items
+from packing_algorithm import (best_fit_cache, does_it_fit, group_items,
+                               pack_boxes, ItemGroup, ItemPool, ItemTuple,
+                               _best_fit_blocks, _get_side_2_side_3)
+import packing_algorithm
+from quantize import quantize_dims
+
+from random import Random
+from time import time
+import gc
+import os
+import subprocess
+import sys
+
+
+BOX_DIMS = [30, 40, 50]
+
+
+def random_items(num_items, seed=0):
+    '''
+    builds num_items distinct items sorted by longest dimension, the way
+    packing_algorithm hands them to pack_boxes
+
+    Args:
+        num_items (int)
+        seed (int)
+
+    Returns:
+        List[ItemTuple]
+    '''
+    random = Random(seed)
+    items = []
+    for i in xrange(num_items):
+        dimensions = sorted([random.randint(1, 25), random.randint(1, 25),
+                             random.randint(1, 25)])
+        items.append(ItemTuple(i, dimensions, random.randint(1, 500)))
+    return sorted(items, key=lambda item: item.dimensions[2], reverse=True)
+
+
+class LinearItemPool(object):
+    '''
+    the list scan pack_boxes used before ItemPool, kept to compare against.
+    It keeps the same ItemGroups and indices as ItemPool, but finds what fits
+    by scanning every group
+    '''
+
+    def __init__(self, items):
+        self.groups = group_items(items)
+        self.table = [group.item for group in self.groups]
+        self.quantities = [group.quantity for group in self.groups]
+
+    def __len__(self):
+        return sum(self.quantities)
+
+    def first_fit(self, box_dims, max_weight=None):
+        for i, group in enumerate(self.groups):
+            if (self.quantities[i] > 0 and
+                    does_it_fit(group.item.dimensions, box_dims) and
+                    (max_weight is None or
+                     float(group.item.weight) <= max_weight)):
+                return i
+        return None
+
+    def lightest(self):
+        return min([float(group.item.weight)
+                    for group, quantity in zip(self.groups, self.quantities)
+                    if quantity > 0] or [float('inf')])
+
+    def something_fits(self, box_dims):
+        return self.first_fit(box_dims) is not None
+
+    def take(self, index):
+        self.quantities[index] -= 1
+        return self.groups[index].item
+
+    def items(self):
+        return [group._replace(quantity=quantity)
+                for group, quantity in zip(self.groups, self.quantities)
+                if quantity > 0]
+
+
+def _time_pack_boxes(items):
+    start = time()
+    packed_items = pack_boxes(BOX_DIMS, items)
+    return time() - start, packed_items
+
+
+def bench_item_pool(sizes, baseline_limit=10000):
+    '''
+    times pack_boxes with the indexed ItemPool against the linear list scan
+    it replaced. The list scan is quadratic, so it is skipped above
+    baseline_limit items.
+    '''
+    for size in sizes:
+        items = random_items(size)
+        pool_time, packed_items = _time_pack_boxes(items)
+        if size <= baseline_limit:
+            packing_algorithm.ItemPool = LinearItemPool
+            try:
+                linear_time, linear_packed_items = _time_pack_boxes(items)
+            finally:
+                packing_algorithm.ItemPool = ItemPool
+            assert linear_packed_items == packed_items
+            linear = '{:.3f}s'.format(linear_time)
+        else:
+            linear = 'skipped'
+        print ('{:>7} items  parcels {:>6}  item pool {:.3f}s  list scan {}'
+               .format(size, len(packed_items), pool_time, linear))
+
+
+class TreeScanItemPool(ItemPool):
+    '''
+    an ItemPool that answers something_fits by searching its tree rather
+    than its DimensionFrontier
+    '''
+
+    def something_fits(self, box_dims):
+        return self.first_fit(box_dims) is not None
+
+
+def bench_frontier(sizes):
+    '''
+    times pack_boxes checking left over blocks against the DimensionFrontier
+    against searching the whole ItemPool for something that fits
+    '''
+    for size in sizes:
+        items = random_items(size)
+        frontier_time, packed_items = _time_pack_boxes(items)
+        packing_algorithm.ItemPool = TreeScanItemPool
+        try:
+            tree_time, tree_packed_items = _time_pack_boxes(items)
+        finally:
+            packing_algorithm.ItemPool = ItemPool
+        assert tree_packed_items == packed_items
+        print ('{:>7} items  frontier {:.3f}s  item search {:.3f}s'
+               .format(size, frontier_time, tree_time))
+
+
+def pop_last_split(packed_items, box_weight, max_weight):
+    '''
+    the weight post-pass pack_box used before pack_boxes took a max_weight,
+    kept to compare against. It adds up the weight of a parcel again after
+    every item it moves, and stacks the items moved without checking they fit
+    '''
+    additional_boxes = []
+    additional_box = []
+    packed_items = [list(parcel) for parcel in packed_items]
+    for items in packed_items:
+        while sum(item.weight for item in items) + box_weight > max_weight:
+            popped_item = items.pop()
+            if ((sum(item.weight for item in additional_box) +
+                    float(popped_item.weight) + box_weight) > max_weight):
+                additional_boxes.append(additional_box)
+                additional_box = []
+            additional_box.append(popped_item)
+    if len(additional_box) > 0:
+        additional_boxes.append(additional_box)
+    return packed_items + additional_boxes
+
+
+def bench_max_weight(sizes):
+    '''
+    times pack_boxes with a max_weight against packing by dimensions alone
+    followed by the pop the last item post-pass it replaced, on unit cubes
+    weighing four times max_weight
+    '''
+    random = Random(0)
+    for size in sizes:
+        items = [ItemTuple(i, [1, 1, 1], random.randint(1, 500))
+                 for i in xrange(size)]
+        box_dims = [1, 1, size]
+        max_weight = sum(item.weight for item in items) / 4
+        start = time()
+        parcels = pack_boxes(box_dims, items, max_weight=max_weight)
+        max_weight_time = time() - start
+        start = time()
+        pop_last_parcels = pop_last_split(pack_boxes(box_dims, items), 0,
+                                          max_weight)
+        pop_last_time = time() - start
+        print ('{:>7} items  parcels {:>3} / {:>3}  max weight {:.3f}s  '
+               'pop last {:.3f}s'.format(size, len(parcels),
+                                         len(pop_last_parcels),
+                                         max_weight_time, pop_last_time))
+
+
+def _parcel_bytes(parcels):
+    return sum(sys.getsizeof(parcel) +
+               (sys.getsizeof(parcel.indices) if hasattr(parcel, 'indices')
+                else 0)
+               for parcel in parcels)
+
+
+def bench_parcels(sizes):
+    '''
+    compares the memory taken by the parcels pack_boxes returns with the same
+    parcels as lists of ItemTuples, for bulk orders of ten small SKUs
+    '''
+    random = Random(0)
+    skus = sorted((ItemTuple(i, sorted([random.randint(1, 10),
+                                        random.randint(1, 10),
+                                        random.randint(1, 10)]), 1)
+                   for i in xrange(10)),
+                  key=lambda item: item.dimensions[2], reverse=True)
+    for size in sizes:
+        items = sorted((skus[i % 10] for i in xrange(size)),
+                       key=lambda item: item.dimensions[2], reverse=True)
+        parcels = pack_boxes(BOX_DIMS, items)
+        lists = [list(parcel) for parcel in parcels]
+        print ('{:>7} items  parcels {:>5}  parcels {:>9} bytes  '
+               'lists {:>9} bytes'.format(size, len(parcels),
+                                          _parcel_bytes(parcels),
+                                          _parcel_bytes(lists)))
+
+
+def sorted_list_best_fit(item_dims, box_dims):
+    '''
+    the best_fit used before it was written out on tuples, kept to compare
+    against. It sorts a new list for every block it might leave and sorts
+    the blocks by volume with a key function
+    '''
+    def list_volume(dimensions):
+        return reduce(lambda x, y: x * y, dimensions)
+
+    side_1 = None
+    blocks = []
+    box_dims = list(box_dims)
+    for i, b_dim in enumerate(box_dims):
+        if b_dim >= item_dims[2] * 2:
+            side_1 = i
+            blocks.append(sorted([box_dims[side_1] - item_dims[2],
+                                  box_dims[i - 1], box_dims[i - 2]]))
+            box_dims[i] = item_dims[2]
+            break
+        elif b_dim == item_dims[2]:
+            side_1 = i
+            break
+    if side_1 is None:
+        for i, b_dim in enumerate(box_dims):
+            if b_dim >= item_dims[2]:
+                side_1 = i
+                blocks.append(sorted([box_dims[side_1] - item_dims[2],
+                                      item_dims[1], item_dims[0]]))
+                break
+    side_2, side_3 = _get_side_2_side_3(item_dims, box_dims, side_1)
+    block_2a = sorted([box_dims[side_1], box_dims[side_2],
+                       box_dims[side_3] - item_dims[0]])
+    block_3a = sorted([box_dims[side_1], box_dims[side_2] - item_dims[1],
+                       item_dims[0]])
+    block_2b = sorted([box_dims[side_1], box_dims[side_2] - item_dims[1],
+                       box_dims[side_3]])
+    block_3b = sorted([box_dims[side_1], box_dims[side_3] - item_dims[0],
+                       item_dims[1]])
+    if list_volume(block_2a) < list_volume(block_2b):
+        blocks.extend([block_2a, block_3a])
+    else:
+        blocks.extend([block_2b, block_3b])
+    return sorted([block for block in blocks if block[0] != 0],
+                  key=lambda block: list_volume(block))
+
+
+def bench_best_fit(sizes):
+    '''
+    times the tuple best_fit pack_boxes calls against the sorted list
+    best_fit it replaced, on random items placed into random blocks they fit
+    into, and checks both leave the same blocks
+    '''
+    random = Random(0)
+    for size in sizes:
+        pairs = []
+        while len(pairs) < size:
+            item_dims = sorted([random.randint(1, 2500),
+                                random.randint(1, 2500),
+                                random.randint(1, 2500)])
+            box_dims = sorted([random.randint(1, 5000),
+                               random.randint(1, 5000),
+                               random.randint(1, 5000)])
+            if does_it_fit(item_dims, box_dims):
+                pairs.append((item_dims, box_dims))
+        start = time()
+        blocks = [_best_fit_blocks(item, box) for item, box in pairs]
+        tuple_time = time() - start
+        start = time()
+        list_blocks = [sorted_list_best_fit(item, box) for item, box in pairs]
+        list_time = time() - start
+        assert blocks == [[tuple(block) for block in fit_blocks]
+                          for fit_blocks in list_blocks]
+        print ('{:>7} calls  best_fit {:.3f}s  sorted lists {:.3f}s'
+               .format(size, tuple_time, list_time))
+
+
+def cached_best_fit_blocks(item_dims, box_dims):
+    '''
+    the best_fit_cache lookup pack_boxes made for every item packed before it
+    called _best_fit_blocks directly, kept to compare against
+    '''
+    key = (tuple(item_dims), tuple(box_dims))
+    blocks = best_fit_cache.get(key)
+    if blocks is None:
+        blocks = tuple(_best_fit_blocks(item_dims, box_dims))
+        best_fit_cache.put(key, blocks)
+    return blocks
+
+
+def bench_best_fit_cache(sizes, skus=50):
+    '''
+    times pack_boxes working out the blocks left by every item against
+    looking them up in best_fit_cache, on items of all different sizes and on
+    items of a few SKUs, where nearly every lookup is a hit
+    '''
+    random = Random(0)
+    kinds = [sorted([random.randint(1, 25), random.randint(1, 25),
+                     random.randint(1, 25)]) for _ in xrange(skus)]
+    for size in sizes:
+        few_skus = sorted([ItemTuple(i, kinds[i % skus], 10)
+                           for i in xrange(size)],
+                          key=lambda item: item.dimensions[2], reverse=True)
+        for name, items in (('distinct', random_items(size)),
+                            ('{} skus'.format(skus), few_skus)):
+            direct_time, packed_items = _time_pack_boxes(items)
+            best_fit_cache.clear()
+            packing_algorithm._best_fit_blocks = cached_best_fit_blocks
+            try:
+                cached_time, cached_packed_items = _time_pack_boxes(items)
+            finally:
+                packing_algorithm._best_fit_blocks = _best_fit_blocks
+            assert cached_packed_items == packed_items
+            print ('{:>7} items  {:>8}  best_fit {:.3f}s  cached {:.3f}s  '
+                   'hits {}'.format(size, name, direct_time, cached_time,
+                                    best_fit_cache.hits))
+
+
+def per_field_items(items_info):
+    '''
+    the products of a request converted the way pre_pack_boxes did before
+    normalize_items, one conversion per field, writing weight_g into the
+    dicts
+    '''
+    items = []
+    for item in items_info:
+        dimension_units = item['dimension_units']
+        dimensions = quantize_dims([
+            dim_to_cm(item['height'], dimension_units),
+            dim_to_cm(item['length'], dimension_units),
+            dim_to_cm(item['width'], dimension_units)])
+        item['weight_g'] = mass_to_g(item['weight'], item['weight_units'])
+        items.append(ItemGroup(
+            ItemTuple(item['product_name'], dimensions, item['weight_g']),
+            int(item['quantity'])))
+    return items
+
+
+def bench_normalize(sizes):
+    '''
+    compares normalize_items with converting every field on its own, for
+    requests of size products in inches and pounds
+    '''
+    random = Random(0)
+    for size in sizes:
+        items_info = [{
+            'product_name': 'SKU-{}'.format(i),
+            'width': random.uniform(1, 10), 'height': random.uniform(1, 10),
+            'length': random.uniform(1, 10), 'dimension_units': 'inches',
+            'weight': random.uniform(0.1, 5), 'weight_units': 'pounds',
+            'quantity': random.randint(1, 5)
+        } for i in xrange(size)]
+        # the collector would charge whichever runs first for the products
+        gc.disable()
+        start = time()
+        items = normalize_items(items_info)
+        normalize_time = time() - start
+        start = time()
+        field_items = per_field_items(items_info)
+        field_time = time() - start
+        gc.enable()
+        # normalize_items keeps the dimensions as tuples
+        assert items == [ItemGroup(group.item._replace(
+            dimensions=tuple(group.item.dimensions)), group.quantity)
+            for group in field_items]
+        print ('{:>7} products  normalize_items {:.3f}s  per field {:.3f}s'
+               .format(size, normalize_time, field_time))
+
+
+# run in a fresh interpreter, prints the seconds the import took and the
+# number of modules it loaded
+IMPORT_TIMER = '''
+import sys, time
+loaded = len(sys.modules)
+start = time.time()
+import {}
+print time.time() - start, len(sys.modules) - loaded
+'''
+
+
+def _import_time(module, cwd):
+    process = subprocess.Popen(
+        [sys.executable, '-c', IMPORT_TIMER.format(module)], cwd=cwd,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = process.communicate()
+    if process.returncode != 0:
+        return None, None
+    seconds, modules = out.split()
+    return float(seconds), int(modules)
+
+
+def bench_import_time(sizes):
+    '''
+    compares the time to import core, the packing without the application,
+    with the time to import helper and with it flask, sqlalchemy and the rest
+    of fulfillment_api, each in size fresh interpreters. helper is only timed
+    where fulfillment_api can be imported
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(os.path.dirname(here))
+    for size in sizes:
+        timings = []
+        for module, cwd in (('core', here),
+                            ('fulfillment_api.box_packing.helper', root)):
+            runs = [_import_time(module, cwd) for _ in xrange(size)]
+            if any(seconds is None for seconds, _ in runs):
+                timings.append('{} unavailable'.format(module))
+                continue
+            timings.append('{} {:.3f}s {} modules'.format(
+                module, sum(seconds for seconds, _ in runs) / size,
+                runs[0][1]))
+        print '{:>7} runs  {}'.format(size, '  '.join(timings))
+
+
+BENCHMARKS = {
+    'best_fit': bench_best_fit,
+    'best_fit_cache': bench_best_fit_cache,
+    'frontier': bench_frontier,
+    'import_time': bench_import_time,
+    'item_pool': bench_item_pool,
+    'max_weight': bench_max_weight,
+    'normalize': bench_normalize,
+    'parcels': bench_parcels,
+}
+
+
+if __name__ == '__main__':
+    name = sys.argv[1] if len(sys.argv) > 1 else 'item_pool'
+    sizes = [int(size) for size in sys.argv[2:]] or [1000, 10000, 100000]
+    BENCHMARKS[name](sizes)
@@ -0,0 +1,233 @@
+'''
+This module keeps the shipping boxes available to each team in memory
+
+select_useable_boxes is called for every order, but a team's boxes change
+maybe once a week. Reading them once and keeping them, already sorted by
+volume with their dimensions sorted, means picking the boxes for an order
+needs no query.
+
+data path:
+--- the first time a team's boxes are needed, every available box of the team
+    and every shared box is read with query_useable_boxes, smallest volume
+    first, in a session of its own on the connection of the caller. They are
+    kept detached with their quantized dimensions, volume and whether they are
+    usps flat or regional rate boxes. The boxes the caller's session already
+    holds are left attached to it
+--- the boxes are read again once they are older than the ttl, or as soon as
+    any ShippingBox is inserted, updated or deleted through this process.
+    Other processes see the change when their ttl runs out
+--- the boxes are merged back into the session of each caller without
+    loading them, so every caller gets boxes attached to its own session
+'''
+from fulfillment_api.authentication.shipping_box import ShippingBox
+from fulfillment_api.constants import usps_shipping
+
+from .fit_matrix import dims_array
+from .quantize import quantize_dims, unquantized_lower_bound
+
+from collections import namedtuple
+from sqlalchemy import and_, case, event, Index, or_
+from sqlalchemy.orm import Session
+from threading import Lock
+from time import time
+
+
+# seconds a team's boxes are kept before they are read again
+CATALOG_TTL = 15 * 60
+
+TeamCatalog = namedtuple('TeamCatalog',
+                         'boxes, dimensions, fit_dimensions, volumes, '
+                         'flat_rate, expires')
+
+
+def sorted_box_dimensions():
+    '''
+    the dimensions of a ShippingBox sorted smallest to largest, as sql
+    expressions, so the fit test can run in the database. They are built
+    from CASE alone, SQLite has no least or greatest
+
+    Returns:
+        Tuple[sqlalchemy expression, sqlalchemy expression,
+              sqlalchemy expression]
+    '''
+    width, height, length = (ShippingBox.width_cm, ShippingBox.height_cm,
+                             ShippingBox.length_cm)
+    smallest = case([(and_(width <= height, width <= length), width),
+                     (height <= length, height)], else_=length)
+    largest = case([(and_(width >= height, width >= length), width),
+                    (height >= length, height)], else_=length)
+    # the median of three, without adding floats together
+    middle = case([(or_(and_(height <= width, width <= length),
+                        and_(length <= width, width <= height)), width),
+                   (or_(and_(width <= height, height <= length),
+                        and_(length <= height, height <= width)), height)],
+                  else_=length)
+    return smallest, middle, largest
+
+
+# lets the database find the boxes an order fits into from the sorted
+# dimensions, it is created with the shipping box table
+sorted_dimensions_index = Index('ix_shipping_box_sorted_dimensions',
+                                *sorted_box_dimensions())
+
+
+def query_useable_boxes(session, team_id, min_box_dimensions=None,
+                        flat_rate_okay=True):
+    '''
+    queries the database for the boxes a team can use, its own available
+    boxes and the available shared ones, in one query with the whole fit
+    test and the flat rate exclusion
+
+    Args:
+        session (sqlalchemy.orm.session.Session)
+        team_id (int)
+        min_box_dimensions (List[int, int, int]): quantized, the boxes of
+            every size when not given
+        flat_rate_okay (Boolean): False to leave out usps flat and regional
+            rate boxes
+
+    Returns:
+        sqlalchemy.orm.query.Query: of ShippingBox, smallest volume first
+    '''
+    shipping_query = session.query(ShippingBox).filter(
+        ShippingBox.is_available.is_(True),
+        or_(ShippingBox.team_id == team_id,
+            ShippingBox.team_id.is_(None)))
+    if min_box_dimensions is not None:
+        # the boxes are kept in centimeters, take the same boxes fits_into
+        # would once their dimensions are quantized
+        shipping_query = shipping_query.filter(*[
+            dimension >= unquantized_lower_bound(min_dim)
+            for dimension, min_dim in zip(sorted_box_dimensions(),
+                                          min_box_dimensions)])
+    if not flat_rate_okay:
+        # only select boxes that are not flat or regional rate
+        shipping_query = shipping_query.filter(
+            ~ShippingBox.description.in_(usps_shipping.USPS_BOXES))
+    return shipping_query.order_by(ShippingBox.total_cubic_cm)
+
+
+class BoxCatalogCache(object):
+    '''
+    the available boxes of each team, sorted by volume
+
+    Args:
+        ttl (int): seconds a team's boxes are kept
+
+    Example:
+        >>> catalog = box_catalog.get(session, team.id)
+        >>> catalog.boxes[0].total_cubic_cm == catalog.volumes[0]
+        True
+    '''
+
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._catalogs = {}
+        # bumped on every invalidate, so boxes read while a box was changing
+        # are not kept
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, session, team_id):
+        '''
+        returns the boxes of a team, reading them if they are not kept or are
+        too old
+
+        Args:
+            session (sqlalchemy.orm.session.Session): used to read the boxes
+            team_id (int)
+
+        Returns:
+            TeamCatalog: the boxes are detached, merge them into a session
+                before use
+        '''
+        with self._lock:
+            catalog = self._catalogs.get(team_id)
+            if catalog is not None and catalog.expires > time():
+                self.hits += 1
+                return catalog
+            self.misses += 1
+            generation = self._generation
+        catalog = self.read(session, team_id)
+        with self._lock:
+            if generation == self._generation:
+                self._catalogs[team_id] = catalog
+        return catalog
+
+    def read(self, session, team_id):
+        '''
+        reads the boxes of a team from the database, without keeping them
+
+        Args:
+            session (sqlalchemy.orm.session.Session): its connection is used
+                to read the boxes, the boxes it holds are left attached
+            team_id (int)
+
+        Returns:
+            TeamCatalog: the boxes are detached, merge them into a session
+                before use
+        '''
+        # a session of its own keeps the boxes of the caller's session
+        # attached, sharing its connection still sees what it has not
+        # committed
+        load_session = Session(bind=session.connection())
+        try:
+            boxes = query_useable_boxes(load_session, team_id).all()
+        finally:
+            # detaches the boxes, the connection stays with session
+            load_session.close()
+        dimensions = [quantize_dims([box.width_cm, box.height_cm,
+                                     box.length_cm])
+                      for box in boxes]
+        return TeamCatalog(
+            boxes=boxes,
+            dimensions=dimensions,
+            fit_dimensions=dims_array(dimensions),
+            volumes=[box.total_cubic_cm for box in boxes],
+            flat_rate=[box.description in usps_shipping.USPS_BOXES
+                       for box in boxes],
+            expires=time() + self.ttl)
+
+    def invalidate(self, team_id=None):
+        '''
+        forgets the boxes of a team, or of every team when no team is given
+
+        Args:
+            team_id (int)
+        '''
+        with self._lock:
+            self._generation += 1
+            if team_id is None:
+                self._catalogs.clear()
+            else:
+                self._catalogs.pop(team_id, None)
+
+    def info(self):
+        '''
+        Returns:
+            Dict[{
+                'hits': int,
+                'misses': int,
+                'teams': int
+            }]
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'teams': len(self._catalogs)
+            }
+
+
+box_catalog = BoxCatalogCache()
+
+
+@event.listens_for(ShippingBox, 'after_insert')
+@event.listens_for(ShippingBox, 'after_update')
+@event.listens_for(ShippingBox, 'after_delete')
+def _box_changed(mapper, connection, box):
+    # a shared box belongs to every team, and a box can move between teams,
+    # so every team's boxes are read again
+    box_catalog.invalidate()
@@ -0,0 +1,63 @@
+'''
+Plain values carried through the packing algorithm
+'''
+import collections
+
+
+class Box(collections.namedtuple(
+    'Box', (
+        'name', 'description', 'width_cm', 'height_cm', 'length_cm',
+        'weight_g', 'total_cubic_cm', 'box_id',
+    ))):
+    '''
+    a shipping box as packing_algorithm and setup_packages use it, with the
+    same attribute names as a ShippingBox but none of the database behind
+    one. Building one costs as little as building a tuple, and two boxes
+    with the same values are the same box, so boxes can key the packings of
+    packing_algorithm
+
+    Args:
+        name (str)
+        description (str): compared against the usps flat rate boxes
+        width_cm, height_cm, length_cm (float)
+        weight_g (float): weight of the empty box
+        total_cubic_cm (float)
+        box_id (int): id of the ShippingBox it was made from, None when it
+            did not come from the database
+
+    Example:
+        >>> box = Box.from_dimensions('Box-1', [10, 20, 30], 250)
+        >>> box.total_cubic_cm
+        6000
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_dimensions(cls, name, dimensions, weight_g, description=''):
+        '''
+        Args:
+            name (str)
+            dimensions (List[float, float, float]): in centimeters
+            weight_g (float)
+            description (str)
+
+        Returns:
+            Box
+        '''
+        width, height, length = dimensions
+        return cls(name, description, width, height, length, weight_g,
+                   width * height * length, None)
+
+    @classmethod
+    def from_shipping_box(cls, shipping_box):
+        '''
+        Args:
+            shipping_box (ShippingBox)
+
+        Returns:
+            Box: with the values the ShippingBox has now
+        '''
+        return cls(shipping_box.name, shipping_box.description,
+                   shipping_box.width_cm, shipping_box.height_cm,
+                   shipping_box.length_cm, shipping_box.weight_g,
+                   shipping_box.total_cubic_cm, shipping_box.id)
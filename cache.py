@@ -0,0 +1,501 @@
+'''
+This module holds the caches used by box packing
+
+Packing results can be cached in memory with ResultCache, or on disk with
+SQLiteResultCache. Both have the same get, put, flush and info methods.
+'''
+from collections import defaultdict, OrderedDict
+from threading import local, Lock
+from time import time
+import hashlib
+import json
+import os
+import sqlite3
+
+
+class LRUCache(object):
+    '''
+    a dictionary that holds at most maxsize entries, dropping the least
+    recently used entry when it is full
+
+    counts its hits and misses so the hit rate can be checked
+
+    Args:
+        maxsize (int)
+
+    Example:
+        >>> cache = LRUCache(2)
+        >>> cache.put('a', 1)
+        >>> cache.put('b', 2)
+        >>> cache.get('a')
+        1
+        >>> cache.put('c', 3)
+        >>> cache.get('b')
+        None
+        >>> cache.info()
+        {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2}
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        '''
+        returns the value cached for key, marking it as recently used
+
+        Args:
+            key (hashable)
+            default: returned when nothing is cached for key
+        '''
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        '''
+        caches value for key, dropping the least recently used entries if the
+        cache is full
+
+        Args:
+            key (hashable)
+            value
+        '''
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def resize(self, maxsize):
+        '''
+        changes the number of entries the cache holds, dropping the least
+        recently used entries if it now holds too many
+
+        Args:
+            maxsize (int)
+        '''
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        drops every entry and resets the hit and miss counts
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        '''
+        Returns:
+            Dict[{
+                'hits': int,
+                'misses': int,
+                'size': int,
+                'maxsize': int
+            }]
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+
+class ResultCache(object):
+    '''
+    a cache of packing results keyed by order fingerprint
+
+    entries are dropped least recently used first once there are more than
+    maxsize of them or they take up more than max_bytes, and are not
+    returned once they are older than ttl seconds. Entries are kept per
+    namespace, usually a team, so one team's entries can be flushed when its
+    boxes change. Values must be json serializable, their size is measured
+    as json
+
+    Args:
+        maxsize (int)
+        ttl (int): seconds an entry is good for, None for no limit
+        max_bytes (int): None for no limit
+
+    Example:
+        >>> cache = ResultCache(maxsize=100, ttl=60)
+        >>> cache.put(team.id, fingerprint(order), packing)
+        >>> cache.get(team.id, fingerprint(order))
+        packing
+        >>> cache.flush(team.id)
+    '''
+
+    def __init__(self, maxsize=10000, ttl=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        # (namespace, key): (expires, size, value)
+        self._entries = OrderedDict()
+        self._namespaces = defaultdict(set)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, namespace, key):
+        '''
+        returns the value cached for key, or None if there is none or it has
+        expired
+
+        Args:
+            namespace (hashable)
+            key (str)
+        '''
+        with self._lock:
+            try:
+                expires, size, value = self._entries.pop((namespace, key))
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires < time():
+                self._forget(namespace, key, size)
+                self.misses += 1
+                return None
+            self._entries[(namespace, key)] = (expires, size, value)
+            self.hits += 1
+            return value
+
+    def put(self, namespace, key, value):
+        '''
+        caches value for key, dropping the least recently used entries if the
+        cache is full. Values bigger than max_bytes are not cached
+
+        Args:
+            namespace (hashable)
+            key (str)
+            value: json serializable
+        '''
+        size = len(json.dumps(value))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old_entry = self._entries.pop((namespace, key), None)
+            if old_entry is not None:
+                self.bytes -= old_entry[1]
+            self._entries[(namespace, key)] = (expires, size, value)
+            self._namespaces[namespace].add(key)
+            self.bytes += size
+            while (len(self._entries) > self.maxsize or
+                    (self.max_bytes is not None and
+                     self.bytes > self.max_bytes)):
+                (old_namespace, old_key), (_, old_size, _) = (
+                    self._entries.popitem(last=False))
+                self._forget(old_namespace, old_key, old_size)
+
+    def flush(self, namespace=None):
+        '''
+        drops every entry of a namespace, or every entry when no namespace is
+        given
+
+        Args:
+            namespace (hashable)
+        '''
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                self._namespaces.clear()
+                self.bytes = 0
+                return
+            for key in self._namespaces.pop(namespace, ()):
+                _, size, _ = self._entries.pop((namespace, key))
+                self.bytes -= size
+
+    def info(self):
+        '''
+        Returns:
+            Dict[{
+                'hits': int,
+                'misses': int,
+                'hit_rate': float,
+                'size': int,
+                'bytes': int
+            }]
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'bytes': self.bytes
+        }
+
+    def _forget(self, namespace, key, size):
+        # the entry has already been popped from _entries
+        self.bytes -= size
+        keys = self._namespaces[namespace]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self._namespaces[namespace]
+
+
+def fingerprint(value):
+    '''
+    a stable hash of a json serializable value, for use as a cache key
+
+    Args:
+        value: json serializable, lists and dictionaries should already be in
+            a canonical order
+
+    Returns:
+        str
+    '''
+    return hashlib.sha1(json.dumps(value, sort_keys=True,
+                                   separators=(',', ':'))).hexdigest()
+
+
+# errors from the file behind an SQLiteResultCache, treated as misses
+_STORE_ERRORS = (sqlite3.Error, OSError)
+
+
+class SQLiteResultCache(object):
+    '''
+    a ResultCache kept in an SQLite file, so it is shared by every worker
+    process on a host and survives restarts
+
+    nothing is read or written until the cache is first used. Every entry is
+    stamped with the version of the packing algorithm that made it, entries
+    from any other version are dropped when the file is opened and never
+    returned. Entries are dropped least recently used first once they take
+    up more than max_bytes. Errors reading or writing the file are treated
+    as misses, so a broken cache never breaks packing
+
+    Args:
+        path (str): the SQLite file, its directory is created if needed,
+            readable by this user only
+        version (int|str): version of the packing algorithm
+        ttl (int): seconds an entry is good for, None for no limit
+        max_bytes (int): None for no limit
+
+    Example:
+        >>> cache = SQLiteResultCache('/var/cache/box_packing.sqlite',
+                                      PACKING_VERSION, ttl=ONE_DAY)
+        >>> cache.put(team.id, fingerprint(order), packing)
+        >>> cache.get(team.id, fingerprint(order))
+        packing
+    '''
+
+    # only record that an entry was used again once it has been this many
+    # seconds, so most hits do not have to write
+    USED_RESOLUTION = 60
+    # other processes write to the file too, so the bytes in it are counted
+    # again at least this many seconds apart
+    RECOUNT_INTERVAL = 60
+
+    def __init__(self, path, version, ttl=None, max_bytes=None):
+        self.path = path
+        self.version = str(version)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        # the bytes in the file when they were last counted, at _counted,
+        # plus those put by this process since
+        self._bytes = None
+        self._counted = None
+        self._local = local()
+
+    def _connection(self):
+        # sqlite connections cannot be shared across threads or forks
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                # cached packings are read back as they are, no one else
+                # should be able to plant them
+                os.makedirs(directory, 0o700)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' namespace TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' version TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' expires REAL,'
+                ' used REAL NOT NULL,'
+                ' PRIMARY KEY (namespace, key))')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_used'
+                               ' ON results (used)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_expires'
+                               ' ON results (expires)')
+            with connection:
+                connection.execute('DELETE FROM results WHERE version != ?',
+                                   (self.version,))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, namespace, key):
+        '''
+        returns the value cached for key, or None if there is none, it has
+        expired or it was made by another version
+
+        Args:
+            namespace (hashable): json serializable
+            key (str)
+        '''
+        now = time()
+        try:
+            with self._connection() as connection:
+                row = connection.execute(
+                    'SELECT value, expires, used FROM results'
+                    ' WHERE namespace = ? AND key = ? AND version = ?',
+                    (json.dumps(namespace), key, self.version)).fetchone()
+                if row is not None and row[1] is not None and row[1] < now:
+                    connection.execute(
+                        'DELETE FROM results WHERE namespace = ? AND key = ?',
+                        (json.dumps(namespace), key))
+                    row = None
+                elif (row is not None and
+                        row[2] < now - self.USED_RESOLUTION):
+                    connection.execute(
+                        'UPDATE results SET used = ?'
+                        ' WHERE namespace = ? AND key = ?',
+                        (now, json.dumps(namespace), key))
+        except _STORE_ERRORS:
+            self.errors += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, namespace, key, value):
+        '''
+        caches value for key, dropping expired entries and then the least
+        recently used entries if the cache is over max_bytes. The bytes in
+        the file are only counted again once the puts of this process take
+        it over max_bytes, or RECOUNT_INTERVAL after the last count. Values
+        bigger than max_bytes are not cached
+
+        Args:
+            namespace (hashable): json serializable
+            key (str)
+            value: json serializable
+        '''
+        value = json.dumps(value)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        now = time()
+        expires = now + self.ttl if self.ttl is not None else None
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO results'
+                    ' (namespace, key, version, value, size, expires, used)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (json.dumps(namespace), key, self.version, value,
+                     len(value), expires, now))
+                if self.max_bytes is not None:
+                    if self._bytes is not None:
+                        self._bytes += len(value)
+                    if (self._bytes is None or
+                            self._bytes > self.max_bytes or
+                            now - self._counted > self.RECOUNT_INTERVAL):
+                        self._evict(connection, now)
+        except _STORE_ERRORS:
+            self.errors += 1
+
+    def _evict(self, connection, now):
+        connection.execute('DELETE FROM results WHERE expires < ?', (now,))
+        total_bytes = connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        self._bytes = total_bytes
+        self._counted = now
+        excess = total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        rows = connection.execute(
+            'SELECT rowid, size FROM results ORDER BY used')
+        evicted = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        connection.executemany('DELETE FROM results WHERE rowid = ?',
+                               evicted)
+        self._bytes = self.max_bytes + excess
+
+    def flush(self, namespace=None):
+        '''
+        drops every entry of a namespace, or every entry when no namespace is
+        given
+
+        Args:
+            namespace (hashable): json serializable
+        '''
+        try:
+            with self._connection() as connection:
+                if namespace is None:
+                    connection.execute('DELETE FROM results')
+                else:
+                    connection.execute(
+                        'DELETE FROM results WHERE namespace = ?',
+                        (json.dumps(namespace),))
+        except _STORE_ERRORS:
+            self.errors += 1
+
+    def info(self):
+        '''
+        hits, misses and errors are counted for this process only, size and
+        bytes are for the whole file
+
+        Returns:
+            Dict[{
+                'hits': int,
+                'misses': int,
+                'hit_rate': float,
+                'errors': int,
+                'size': int,
+                'bytes': int
+            }]
+        '''
+        try:
+            size, total_bytes = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results'
+            ).fetchone()
+        except _STORE_ERRORS:
+            self.errors += 1
+            size, total_bytes = None, None
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'errors': self.errors,
+            'size': size,
+            'bytes': total_bytes
+        }
@@ -0,0 +1,112 @@
+'''
+This module reads and writes the bodies of packing requests
+
+JSON goes through ujson when it is installed and through the json module
+otherwise, ujson reads and writes it several times quicker. Bodies can also be
+MessagePack, application/msgpack, when msgpack is installed, which is
+smaller than JSON and quicker to read and write for orders of thousands of
+products.
+
+data path:
+--- loads decodes the bytes of a request straight into the dicts and lists
+    normalize_boxes and normalize_items read, without decoding them to
+    unicode first
+--- dumps encodes an answer in the mimetype the client asked for
+'''
+import json
+
+try:
+    import ujson
+except ImportError:  # ujson is optional
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional
+    msgpack = None
+
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# the mimetypes bodies can be read and written in, preferred first
+MIMETYPES = [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack else [])
+
+
+def json_loads(data):
+    '''
+    Args:
+        data (str): json
+
+    Returns:
+        the value of data
+
+    Raises:
+        ValueError when data is not json
+    '''
+    if ujson is not None:
+        # precise_float reads floats the way the json module does
+        return ujson.loads(data, precise_float=True)
+    return json.loads(data)
+
+
+def json_dumps(value):
+    '''
+    Args:
+        value: anything json can hold
+
+    Returns:
+        str: value as compact json
+    '''
+    if ujson is not None:
+        # the most digits ujson will write, weights in grams keep their
+        # fractions of a milligram
+        return ujson.dumps(value, double_precision=15,
+                           escape_forward_slashes=False)
+    return json.dumps(value, separators=(',', ':'))
+
+
+def loads(data, mimetype=JSON_MIMETYPE):
+    '''
+    Args:
+        data (str): the body of a request
+        mimetype (str): its Content-Type, anything but application/msgpack
+            is read as json
+
+    Returns:
+        the value of data
+
+    Raises:
+        ValueError when data cannot be read as mimetype, or when mimetype is
+            application/msgpack and msgpack is not installed
+
+    Example:
+        >>> loads('{"boxes_info": []}')
+        {u'boxes_info': []}
+    '''
+    if mimetype != MSGPACK_MIMETYPE:
+        return json_loads(data)
+    if msgpack is None:
+        raise ValueError('Unsupported mimetype {}'.format(mimetype))
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        # msgpack raises an error of its own for every way a body is broken
+        raise ValueError('Invalid MessagePack: {}'.format(e))
+
+
+def dumps(value, mimetype=JSON_MIMETYPE):
+    '''
+    Args:
+        value: anything json can hold
+        mimetype (str): one of MIMETYPES
+
+    Returns:
+        str: value encoded as mimetype
+    '''
+    if mimetype == MSGPACK_MIMETYPE:
+        # every str is bytes on python 2, packed as bin the keys and names
+        # would reach other clients as byte strings rather than strings
+        return msgpack.packb(value, use_bin_type=False)
+    return json_dumps(value)
@@ -0,0 +1,687 @@
+'''
+The packing endpoints without the web application around them
+
+Nothing here imports flask, sqlalchemy or the rest of fulfillment_api, only
+the standard library and this package, so a script or a worker can pack
+orders without starting up the application, with this directory on
+sys.path:
+
+    >>> from core import api_packing_algorithm
+
+helper puts the errors and messages of fulfillment_api over these
+functions for the views, and internal_helper the database.
+
+data path:
+--- normalize_boxes and normalize_items convert a request into centimeters
+    and grams in one pass, with the factors of units, and quantize the
+    dimensions into sorted integers. The dicts of the request are not changed
+--- packing_algorithm or pack_boxes packs them, through packing_cache
+--- the parcels are counted back into products per box
+
+Raises the errors of the errors module, not those of fulfillment_api.
+'''
+from boxes import Box
+from cache import fingerprint, ResultCache, SQLiteResultCache
+from errors import BoxError
+from fit_matrix import fits_into
+from packing_algorithm import (cached_best_fit, does_it_fit,
+                               insert_items_into_dimensions, pack_boxes,
+                               packing_algorithm, ItemGroup, ItemPool,
+                               ItemTuple, Parcel, volume, PACKING_VERSION)
+from quantize import dequantize, dequantize_volume, quantize_dims
+import units
+
+from collections import Counter, namedtuple
+from itertools import izip
+import os
+from time import time
+
+
+# directory the on disk packing cache is kept in, shared by every worker on
+# the host. Without one packings are only cached in each process
+PACKING_CACHE_DIR = os.environ.get('BOX_PACKING_CACHE_DIR')
+
+
+def make_packing_cache(backend=None):
+    '''
+    builds a cache for packing results, nothing is written until it is used
+
+    Args:
+        backend (str): 'sqlite' for a file in PACKING_CACHE_DIR shared by
+            every process on the host, 'memory' for a cache in this process
+            only. Defaults to 'sqlite' when PACKING_CACHE_DIR is set and
+            'memory' otherwise
+
+    Returns:
+        ResultCache|SQLiteResultCache
+
+    Raises:
+        ValueError for an unknown backend, or 'sqlite' without a
+            PACKING_CACHE_DIR
+    '''
+    if backend is None:
+        backend = 'sqlite' if PACKING_CACHE_DIR else 'memory'
+    if backend == 'sqlite':
+        if not PACKING_CACHE_DIR:
+            raise ValueError('BOX_PACKING_CACHE_DIR is needed for the sqlite'
+                             ' packing cache')
+        return SQLiteResultCache(
+            os.path.join(PACKING_CACHE_DIR, 'packing_cache.sqlite'),
+            PACKING_VERSION, ttl=units.HALF_DAY,
+            max_bytes=256 * 1024 * 1024)
+    elif backend == 'memory':
+        return ResultCache(maxsize=10000, ttl=units.HALF_DAY,
+                           max_bytes=64 * 1024 * 1024)
+    raise ValueError('Unknown packing cache backend: {}'.format(backend))
+
+
+def set_packing_cache(cache):
+    '''
+    replaces the cache packing results are kept in
+
+    Args:
+        cache (ResultCache|SQLiteResultCache): anything with get, put, flush
+            and info
+    '''
+    global packing_cache
+    packing_cache = cache
+
+
+# packing results by order fingerprint, flushed per team with
+# packing_cache.flush(team_id)
+packing_cache = make_packing_cache(
+    os.environ.get('BOX_PACKING_CACHE_BACKEND'))
+
+
+def space_after_packing(item_info, box_info):
+    '''
+    returns the remaining space in a box after packing a item and
+        the remaining block sizes within the box after an ideal fit
+    assumes item and box dimensions are in the same units
+
+    Args:
+
+        product_info (Dict[{
+                width: float
+                height: float
+                length: float
+                weight: float
+            }])
+        box_info (Dict[{
+                width: float
+                height: float
+                length: float
+                weight: float
+            }])
+
+    Returns
+        Dict[{
+            'remaining_volume': float
+            'remaining_dimensional_blocks': List[List[int, int, int]]
+        }]
+    '''
+
+    item_dims = normalize_dims(item_info)
+    box_dims = normalize_dims(box_info)
+
+    if not does_it_fit(item_dims, box_dims):
+        raise BoxError('Product with dimensions {} does not fit into a box with'
+                       ' dimensions {}'
+                       .format('X'.join(str(dequantize(dim))
+                                        for dim in item_dims),
+                               'X'.join(str(dequantize(dim))
+                                        for dim in item_dims)))
+    remaining_dimensions = cached_best_fit(item_dims, box_dims)
+    blocks = [{
+        'width': dequantize(block[0]),
+        'height': dequantize(block[1]),
+        'length': dequantize(block[2])
+    } for block in remaining_dimensions]
+    remaining_volume = dequantize_volume(
+        sum(volume(block) for block in remaining_dimensions))
+
+    return {
+        'remaining_volume': remaining_volume,
+        'remaining_dimensional_blocks': blocks
+    }
+
+
+def how_many_items_fit(item_info, box_info, max_packed=None):
+    '''
+    returns the number of of items of a certain size can fit in a box, as well
+        as the remaining volume
+    assumes item and box dimensions are on in the same units
+
+    Args:
+
+        item_info (Dict[{
+                width: float
+                height: float
+                length: float
+                weight: float
+            }])
+        box_info (Dict[{
+                width: float
+                height: float
+                length: float
+                weight: float
+            }])
+        max_packed (int)
+
+    Returns:
+        Dict[{
+            total_packed: int
+            remaining_volume: float
+        }]
+    '''
+    item_dims = normalize_dims(item_info)
+    box_dims = normalize_dims(box_info)
+    remaining_dimensions = [box_dims]
+    remaining_volume = volume(box_dims)
+    item = ItemTuple(None, item_dims, item_info.get('weight', 0))
+    # a list of parcels. every pool below holds the one item at index 0
+    items_packed = [Parcel([item])]
+    while remaining_dimensions != []:
+        for block in remaining_dimensions:
+            # items_to_pack is of length 4 at every loop because
+            # insert_items_into_dimensions will pack up to 3 items at any given
+            # time and then check that there are more items to pack before
+            # continuing
+            items_to_pack = ItemPool([ItemGroup(item, 4)])
+            remaining_dimensions, items_packed = insert_items_into_dimensions(
+                remaining_dimensions, items_to_pack, items_packed)
+            # items_to_pack updates, insert items into dimensions may pack more
+            # than one item and therefore we find the difference between the
+            # length of the remaining items to pack and the original (4)
+            remaining_volume -= volume(item_dims) * (4 - len(items_to_pack))
+            if (max_packed is not None and
+                    len(items_packed[0]) == int(max_packed)):
+                # set remaining dimensions to empty to break from the while loop
+                remaining_dimensions = []
+                break
+    return {
+        'total_packed': len(items_packed[0]),
+        'remaining_volume': dequantize_volume(remaining_volume)
+    }
+
+
+def dim_to_cm(dim, dimension_units):
+    return float(dim) * _factor(units.CENTIMETERS_PER_UNIT, dimension_units)
+
+
+def mass_to_g(mass, weight_units):
+    return float(mass) * _factor(units.GRAMS_PER_UNIT, weight_units)
+
+
+def _factor(factors, unit):
+    try:
+        return factors[unit]
+    except KeyError:
+        raise ValueError('Unknown unit {}'.format(unit))
+
+
+# a box of a request, as given and as it is packed
+CatalogBox = namedtuple('CatalogBox', 'info, dimensions, box')
+# the boxes of a request, in the order given and by name
+Catalog = namedtuple('Catalog', 'boxes, by_name')
+
+
+def normalize_dims(line, centimeters_per_unit=1.0):
+    '''
+    Args:
+        line (Dict): a box or product of a request, with a width, height and
+            length
+        centimeters_per_unit (float): of the units of line, 1.0 to keep them
+
+    Returns:
+        Tuple[int, int, int]: quantized by quantize_dims
+    '''
+    return tuple(quantize_dims([float(line['width']) * centimeters_per_unit,
+                                float(line['height']) * centimeters_per_unit,
+                                float(line['length']) * centimeters_per_unit]))
+
+
+def normalize_box(box_info):
+    '''
+    converts one box of a request to centimeters and grams
+
+    Args:
+        box_info (Dict): as an entry of boxes_info for api_packing_algorithm,
+            dimension_units defaults to centimeters
+
+    Returns:
+        CatalogBox[
+            info: Tuple[Tuple[key, value]], the items of box_info, answers
+                hand back a dict of them
+            dimensions: Tuple[int, int, int], sorted, in centimeters
+                quantized by quantize_dims
+            box: Box, the box as it is packed
+        ]
+    '''
+    dimensions = normalize_dims(box_info, _factor(
+        units.CENTIMETERS_PER_UNIT,
+        box_info.get('dimension_units', units.CENTIMETERS)))
+    weight_g = mass_to_g(box_info['weight'], box_info['weight_units'])
+    box = Box.from_dimensions(
+        box_info.get('name'), [dequantize(dim) for dim in dimensions],
+        weight_g, box_info.get('description', ''))
+    # a copy, so neither the request nor the answers can change the catalog
+    return CatalogBox(tuple(box_info.iteritems()), dimensions, box)
+
+
+def normalize_items(items_info):
+    '''
+    converts the products of a request to centimeters and grams, without
+    changing the dicts of items_info
+
+    Args:
+        items_info (List[Dict]): as for api_packing_algorithm,
+            dimension_units defaults to centimeters
+
+    Returns:
+        List[ItemGroup]: one per product, in the order of items_info, with
+            the product_name as item_number and the dimensions as a tuple
+    '''
+    items = []
+    for item in items_info:
+        # one lookup per unit and product, not per field
+        centimeters_per_unit = _factor(
+            units.CENTIMETERS_PER_UNIT,
+            item.get('dimension_units', units.CENTIMETERS))
+        grams_per_unit = _factor(units.GRAMS_PER_UNIT, item['weight_units'])
+        dimensions = quantize_dims([
+            float(item['width']) * centimeters_per_unit,
+            float(item['height']) * centimeters_per_unit,
+            float(item['length']) * centimeters_per_unit])
+        items.append(ItemGroup(ItemTuple(
+            item['product_name'], tuple(dimensions),
+            float(item['weight']) * grams_per_unit), int(item['quantity'])))
+    return items
+
+
+def weight_of_box_contents(box_contents):
+    '''
+    returns the weight of the package contents
+
+    Args:
+        box_contents (List[item_number])
+        item_info (Dict[Dict[{
+                'weight_g': int/float
+            }]])
+    Returns:
+        float
+    '''
+    return sum(float(item.weight) for item in box_contents)
+
+
+def api_packing_algorithm(boxes_info, items_info, options, team_id=None):
+    '''
+    non-database calling method which allows checking multiple boxes
+    for packing efficiency
+
+    Args:
+        session (sqlalchemy.orm.session.Session)
+        boxes_info (List[Dict(
+                weight: float
+                height: float
+                length: float
+                width: float
+                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                name: String
+            )])
+        items_info (List[Dict(
+                weight: float
+                height: float
+                length: float
+                width: float
+                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                product_name: String
+            )])
+        options (Dict(
+                max_weight: float
+                parallel: bool, pack the boxes in a pool of processes
+                use_cache: bool, look the packing up in packing_cache,
+                    defaults to True
+                deadline_ms: int, stop packing more boxes after this many
+                    milliseconds and return the best box so far
+                compact: bool, answer in the compact form below, defaults
+                    to False
+            ))
+        team_id (int): the packing_cache namespace the result is cached in
+
+    Returns:
+        Dict[
+            'package_contents': List[Dict[
+                items_packed: Dict[item, quantity]
+                total_weight: float
+                'best_box': Dict[
+                    weight: float
+                    height: float
+                    length: float
+                    width: float
+                    dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                    weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                    name: String
+                ]
+            ]
+            'boxes_pruned': int, boxes skipped because they could not need
+                fewer parcels than the best box
+            'boxes_evaluated': int, boxes packed or given up on
+            'timed_out': bool, whether the deadline stopped the packing
+                before every box was evaluated
+        ]
+
+        or with the compact option, each box used listed once and identical
+        parcels in a row given once, as compact_parcels does:
+        Dict[
+            'boxes': List[Dict], the boxes used, as given, in the order they
+                are first used
+            'packages': List[Dict[
+                count: int
+                packed_products: Dict[item, quantity]
+                total_weight: float
+                box: String, name of the box
+            ]]
+            'boxes_pruned', 'boxes_evaluated', 'timed_out': as above
+        ]
+    '''
+    return _pack_order(normalize_boxes(boxes_info), items_info, options,
+                       team_id)
+
+
+def normalize_boxes(boxes_info):
+    '''
+    converts the boxes of a request to centimeters and grams, so a catalog
+    shared by many orders is only converted once
+
+    Args:
+        boxes_info (List[Dict(
+                weight: float
+                height: float
+                length: float
+                width: float
+                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                name: String
+            )])
+
+    Raises:
+        BoxError when two boxes have the same name
+
+    Returns:
+        Catalog[
+            boxes: Tuple[CatalogBox], in the order of boxes_info
+            by_name: Dict[name, CatalogBox]
+        ]
+    '''
+    if len(set(box['name'] for box in boxes_info)) < len(boxes_info):
+        # non-unique names for the boxes have been used.
+        raise BoxError('Please use unique boxes with unique names')
+    boxes = tuple(normalize_box(box) for box in boxes_info)
+    return Catalog(boxes, dict((box.box.name, box) for box in boxes))
+
+
+def _pack_order(catalog, items_info, options, team_id):
+    '''
+    packs the items of one order into the best of the boxes of a catalog
+
+    Args:
+        catalog (Catalog): as returned by normalize_boxes
+        items_info, options, team_id: as for api_packing_algorithm
+
+    Returns:
+        Dict: as for api_packing_algorithm
+    '''
+    boxes = []
+    items = normalize_items(items_info)
+    min_box_dimensions = [None, None, None]
+    for group in items:
+        min_box_dimensions = [max(a, b) for a, b in
+                              izip(group.item.dimensions, min_box_dimensions)]
+    if options is not None:
+        max_weight = int(options.get('max_weight', 31710))
+        parallel = bool(options.get('parallel', False))
+        use_cache = bool(options.get('use_cache', True))
+        deadline_ms = options.get('deadline_ms')
+        compact = bool(options.get('compact', False))
+    else:
+        max_weight = 31710
+        parallel = False
+        use_cache = True
+        deadline_ms = None
+        compact = False
+    deadline = (time() + float(deadline_ms) / 1000
+                if deadline_ms is not None else None)
+    fitting_boxes = fits_into(min_box_dimensions,
+                              [box.dimensions for box in catalog.boxes])
+    for box, fits in izip(catalog.boxes, fitting_boxes):
+        if fits:
+            boxes.append({
+                'box': box.box,
+                'dimensions': box.dimensions
+            })
+    if len(boxes) == 0:
+        raise BoxError('Some of your products are too big for your boxes. '
+                       'Please provide larger boxes.')
+    # sort boxes by volume
+    boxes = sorted(boxes, key=lambda box: volume(box['dimensions']))
+    # the same order against the same boxes packs the same way
+    order_key = fingerprint([
+        sorted([group.item.item_number, group.item.dimensions,
+                group.item.weight, group.quantity] for group in items),
+        sorted([box_dict['box'].name, box_dict['dimensions'],
+                box_dict['box'].weight_g] for box_dict in boxes),
+        max_weight])
+    packing = packing_cache.get(team_id, order_key) if use_cache else None
+    if packing is None:
+        packing = _api_pack(items, boxes, max_weight, parallel, deadline)
+        # a packing cut short by its deadline may not be the best one
+        if use_cache and not packing['timed_out']:
+            packing_cache.put(team_id, order_key, packing)
+
+    if compact:
+        package_contents = compact_parcels(packing['packages'])
+    else:
+        package_contents = [{
+            'packed_products': dict(parcel['packed_products']),
+            'total_weight': parcel['total_weight'],
+            'box': dict(catalog.by_name[parcel['box']].info)
+        } for parcel in packing['packages']]
+
+    result = {
+        'packages': package_contents,
+        'boxes_pruned': packing['boxes_pruned'],
+        'boxes_evaluated': packing['boxes_evaluated'],
+        'timed_out': packing['timed_out']
+    }
+    if compact:
+        box_names = []
+        for parcel in package_contents:
+            if parcel['box'] not in box_names:
+                box_names.append(parcel['box'])
+        result['boxes'] = [dict(catalog.by_name[name].info)
+                           for name in box_names]
+    return result
+
+
+def compact_parcels(parcels):
+    '''
+    gives identical parcels in a row once, with how many of them there are.
+    Bulk orders of one product are mostly the same parcel over and over
+
+    Args:
+        parcels (List[Dict]): json serializable parcels, as packed
+
+    Returns:
+        List[Dict]: each parcel with a count, in order
+
+    Example:
+        >>> runs = compact_parcels([{'packed_products': {'A': 2}},
+        ...                         {'packed_products': {'A': 2}},
+        ...                         {'packed_products': {'A': 1}}])
+        >>> [(run['count'], run['packed_products']) for run in runs]
+        [(2, {'A': 2}), (1, {'A': 1})]
+    '''
+    runs = []
+    previous = None
+    for parcel in parcels:
+        if parcel == previous:
+            runs[-1]['count'] += 1
+        else:
+            runs.append(dict(parcel, count=1,
+                             packed_products=dict(parcel['packed_products'])))
+            previous = parcel
+    return runs
+
+
+def _api_pack(items, boxes, max_weight, parallel, deadline):
+    '''
+    sends the items and boxes of api_packing_algorithm through the packing
+    algorithm
+
+    Returns:
+        Dict[{
+            'packages': List[Dict[{
+                'packed_products': Dict[item, quantity],
+                'total_weight': float,
+                'box': str, name of the box
+            }]],
+            'boxes_pruned': int,
+            'boxes_evaluated': int,
+            'timed_out': bool
+        }]: json serializable, so it can be cached
+    '''
+    box_dictionary = packing_algorithm(items, boxes, max_weight,
+                                       parallel=parallel, deadline=deadline)
+    # only return the package, because these boxes don't have description so
+    # flat_rate boxes won't be a thing - at least for now
+    package_info = box_dictionary['package']
+    parcels = package_info.items_per_box
+    package_contents = []
+    for i, parcel in enumerate(parcels):
+        if i == len(parcels) - 1 and package_info.last_parcel is not None:
+            selected_box = package_info.last_parcel
+        else:
+            selected_box = package_info.box
+        total_weight = selected_box.weight_g
+        items_packed = Counter()
+        for item, quantity in parcel.quantities():
+            items_packed[item.item_number] += quantity
+            total_weight += quantity * item.weight
+        package_contents.append({
+            'packed_products': dict(items_packed),
+            'total_weight': total_weight,
+            'box': selected_box.name
+        })
+
+    return {
+        'packages': package_contents,
+        'boxes_pruned': box_dictionary['boxes_pruned'],
+        'boxes_evaluated': box_dictionary['boxes_evaluated'],
+        'timed_out': box_dictionary['timed_out']
+    }
+
+
+def pre_pack_boxes(box_info, items_info, options, team_id=None):
+    '''
+    returns the packed items of one specific box based on item_info
+    the item info input does not require a db call
+
+    Args
+        boxes_info (Dict[
+                weight: float
+                height: float
+                length: float
+                width: float
+                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                name: String
+            ])
+        products_info (List[Dict[
+                weight: float
+                height: float
+                length: float
+                width: float
+                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
+                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
+                product_name: String
+            ])
+        options (Dict[
+                max_weight: float
+                use_cache: bool, look the packing up in packing_cache,
+                    defaults to True
+                compact: bool, give identical parcels in a row once, with a
+                    count, as compact_parcels does. Defaults to False
+            ])
+        team_id (int): the packing_cache namespace the result is cached in
+
+    Raises
+        BoxError when an item does not fit into the box
+        APIError when a single SKU is heavier than max_weight
+
+    Returns
+        List[Dict[{
+            packed_products: Dict[item, qty],
+            total_weight: float
+        }]], with count: int in each with the compact option
+    '''
+    box = normalize_box(box_info)
+    box_dims = box.dimensions
+    box_weight = box.box.weight_g
+    total_weight = box_weight
+    max_weight = options.get('max_weight', 31710)  # given max weight or 70lbs
+    items_to_pack = normalize_items(items_info)
+    for group in items_to_pack:
+        if not does_it_fit(group.item.dimensions, box_dims):
+            raise BoxError('Some of your items are too big for the box you\'ve'
+                           ' selected. Please select a bigger box or contact'
+                           ' ops@shotput.com.')
+        total_weight += group.item.weight * group.quantity
+    items_to_pack = sorted(items_to_pack,
+                           key=lambda group: group.item.dimensions[2],
+                           reverse=True)
+    # the same items in the same box packs the same way
+    order_key = fingerprint([
+        sorted([group.item.item_number, group.item.dimensions,
+                group.item.weight, group.quantity] for group in items_to_pack),
+        box_dims, box_weight, total_weight, max_weight])
+    use_cache = bool(options.get('use_cache', True))
+    parcel_shipments = (packing_cache.get(team_id, order_key)
+                        if use_cache else None)
+    if parcel_shipments is None:
+        parcel_shipments = _pre_pack(box_dims, box_weight, items_to_pack,
+                                     max_weight)
+        if use_cache:
+            packing_cache.put(team_id, order_key, parcel_shipments)
+    if bool(options.get('compact', False)):
+        return compact_parcels(parcel_shipments)
+    return [{'packed_products': dict(parcel['packed_products']),
+             'total_weight': parcel['total_weight']}
+            for parcel in parcel_shipments]
+
+
+def _pre_pack(box_dims, box_weight, items_to_pack, max_weight):
+    '''
+    packs the items of pre_pack_boxes into as many of the box as needed
+
+    Returns:
+        List[Dict[{
+            packed_products: Dict[item, qty],
+            total_weight: float
+        }]]: json serializable, so it can be cached
+    '''
+    items_packed = pack_boxes(box_dims, items_to_pack, max_weight=max_weight,
+                              box_weight=box_weight)
+
+    parcel_shipments = []
+    for parcel in items_packed:
+        item_qty = Counter()
+        parcel_weight = box_weight
+        for item, quantity in parcel.quantities():
+            item_qty[item.item_number] += quantity
+            parcel_weight += quantity * item.weight
+        parcel_shipments.append({'packed_products': dict(item_qty),
+                                 'total_weight': parcel_weight})
+    return parcel_shipments
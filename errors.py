@@ -4,3 +4,44 @@ class BoxError(Exception):
 
 class APIError(Exception):
     pass
+
+
+class ItemTooHeavyError(APIError):
+    '''
+    raised when an item alone is heavier than a parcel may weigh
+
+    Args:
+        item_number: the item that is too heavy
+    '''
+
+    def __init__(self, item_number):
+        self.item_number = item_number
+        super(ItemTooHeavyError, self).__init__(
+            'SKU is too heavy: {}'.format(item_number))
+
+    def __reduce__(self):
+        # pickled by its arguments, to cross from the pool processes
+        return (ItemTooHeavyError, (self.item_number,))
+
+
+class UnpackableItemsError(BoxError):
+    '''
+    raised when some items do not fit into an empty box, packing them would
+    never finish
+
+    Args:
+        item_numbers (List[item_number]): the items that do not fit
+        box_dimensions (List[float, float, float]): in centimeters, not
+            quantized
+    '''
+
+    def __init__(self, item_numbers, box_dimensions):
+        self.item_numbers = item_numbers
+        self.box_dimensions = box_dimensions
+        super(UnpackableItemsError, self).__init__(
+            'Items do not fit in a {} box: {}'.format(
+                'x'.join(str(dim) for dim in box_dimensions),
+                ', '.join(str(item_number) for item_number in item_numbers)))
+
+    def __reduce__(self):
+        return (UnpackableItemsError, (self.item_numbers, self.box_dimensions))
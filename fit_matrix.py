@@ -0,0 +1,122 @@
+'''
+This module checks many items against many boxes or blocks at once
+
+When NumPy is installed the checks are made on (N, 3) arrays of sorted
+dimensions in one go, otherwise every pair is checked in python the same way
+does_it_fit does. Either way the answers are the same.
+
+data path:
+--- dims_array turns a list of sorted dimensions into an array, once, so the
+    same items can be checked against many boxes without building it again.
+    Short lists are left as lists, building an array costs more than checking
+    a handful of shapes in python
+--- fit_matrix checks every item against every box
+--- fits_into checks one item against every box, to filter a catalog
+--- anything_fits checks every item against one box or block
+'''
+try:
+    import numpy
+except ImportError:  # NumPy is optional
+    numpy = None
+
+
+# fewest dimensions worth building an array for
+MIN_ARRAY_SIZE = 32
+
+
+def _fits(item_dims, box_dims):
+    return (item_dims[0] <= box_dims[0] and item_dims[1] <= box_dims[1] and
+            item_dims[2] <= box_dims[2])
+
+
+def _is_array(dimensions):
+    return numpy is not None and isinstance(dimensions, numpy.ndarray)
+
+
+def dims_array(dimensions):
+    '''
+    prepares sorted dimensions to be checked over and over
+
+    Args:
+        dimensions (List[List[int, int, int]])
+
+    Returns:
+        numpy.ndarray: of shape (N, 3), when NumPy is installed and there are
+            at least MIN_ARRAY_SIZE dimensions
+        List[List[int, int, int]]: the dimensions as given otherwise
+    '''
+    if (numpy is None or _is_array(dimensions) or
+            len(dimensions) < MIN_ARRAY_SIZE):
+        return dimensions
+    return numpy.array(dimensions, dtype=float).reshape(-1, 3)
+
+
+def fit_matrix(item_dims, box_dims):
+    '''
+    checks which items fit into which boxes
+
+    Args:
+        item_dims (List[List[int, int, int]]|numpy.ndarray): sorted
+            dimensions of N items
+        box_dims (List[List[int, int, int]]|numpy.ndarray): sorted
+            dimensions of M boxes or blocks
+
+    Returns:
+        numpy.ndarray: N x M of bool when NumPy is installed
+        List[List[bool]]: N x M otherwise
+
+    Example:
+        >>> fit_matrix([[1, 1, 1], [2, 2, 5]], [[2, 2, 2], [3, 3, 3]])
+        [[True, True], [False, False]]
+    '''
+    if numpy is None:
+        return [[_fits(item, box) for box in box_dims] for item in item_dims]
+    items = numpy.asarray(item_dims, dtype=float).reshape(-1, 3)
+    boxes = numpy.asarray(box_dims, dtype=float).reshape(-1, 3)
+    return (items[:, numpy.newaxis, :] <= boxes[numpy.newaxis, :, :]).all(
+        axis=2)
+
+
+def fits_into(item_dims, box_dims):
+    '''
+    checks which boxes a single item fits into
+
+    Args:
+        item_dims (List[int, int, int]): sorted
+        box_dims (List[List[int, int, int]]|numpy.ndarray): sorted
+            dimensions of M boxes
+
+    Returns:
+        List[bool]: one for each box
+
+    Example:
+        >>> fits_into([2, 2, 5], [[2, 2, 2], [3, 3, 6]])
+        [False, True]
+    '''
+    box_dims = dims_array(box_dims)
+    if not _is_array(box_dims):
+        return [_fits(item_dims, box) for box in box_dims]
+    return (numpy.asarray(item_dims, dtype=float) <= box_dims).all(
+        axis=1).tolist()
+
+
+def anything_fits(item_dims, box_dims):
+    '''
+    checks if any of the items fits into a box or block
+
+    Args:
+        item_dims (Iterable[List[int, int, int]]|numpy.ndarray): sorted
+            dimensions of N items, as returned by dims_array
+        box_dims (List[int, int, int]): sorted
+
+    Returns:
+        bool
+
+    Example:
+        >>> anything_fits([[1, 1, 6], [2, 2, 5]], [3, 3, 5])
+        True
+    '''
+    if not _is_array(item_dims):
+        return any(_fits(item, box_dims) for item in item_dims)
+    return bool((item_dims <= numpy.asarray(box_dims, dtype=float)).all(
+        axis=1).any())
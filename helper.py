@@ -1,362 +1,227 @@
-from fulfillment_api.authentication.products.simple_item import (
-    get_item_dictionary_from_list)
-from fulfillment_api.authentication.shipping_box import ShippingBox
-from fulfillment_api.constants import units
-from fulfillment_api.errors import BoxError
-from fulfillment_api.util.unit_conversion import (convert_dimensional_units,
-                                                  convert_mass_units)
-
-from .packing_algorithm import (best_fit, does_it_fit,
-                                insert_items_into_dimensions, pack_boxes,
-                                packing_algorithm, ItemTuple, volume)
-
-from collections import Counter
-from itertools import izip
+'''
+The packing endpoints as the views call them
+
+The packing itself is in core, which imports nothing of fulfillment_api.
+This module raises the errors of fulfillment_api in place of those of core,
+so the views answer them, and adds the batch and stream endpoints, whose
+per order errors are the messages of fulfillment_api.
+'''
+from fulfillment_api.errors import APIError, BoxError
+import fulfillment_api.messages as msg
+
+from .codec import json_dumps, json_loads
+from . import core
+from .core import (_pack_order, dim_to_cm, make_packing_cache,
+                   set_packing_cache, weight_of_box_contents)
+from . import errors as packing_errors
+from .packing_algorithm import pack_boxes, ItemTuple, volume
+from .parallel import get_pool
+
+from functools import wraps
+import logging
 import math
 
 
-def space_after_packing(item_info, box_info):
-    '''
-    returns the remaining space in a box after packing a item and
-        the remaining block sizes within the box after an ideal fit
-    assumes item and box dimensions are in the same units
+logger = logging.getLogger(__name__)
 
-    Args:
 
-        product_info (Dict[{
-                width: float
-                height: float
-                length: float
-                weight: float
-            }])
-        box_info (Dict[{
-                width: float
-                height: float
-                length: float
-                weight: float
-            }])
-
-    Returns
-        Dict[{
-            'remaining_volume': float
-            'remaining_dimensional_blocks': List[List[int, int, int]]
-        }]
+def _api_error(error_class, error):
     '''
+    Args:
+        error_class (type): BoxError or APIError of fulfillment_api
+        error (Exception): an error of the errors module
 
-    item_dims = sorted([item_info['width'], item_info['height'],
-                       item_info['length']])
-    box_dims = sorted([box_info['width'], box_info['height'],
-                       box_info['length']])
-
-    if not does_it_fit(item_dims, box_dims):
-        raise BoxError('Product with dimensions {} does not fit into a box with'
-                       ' dimensions {}'
-                       .format('X'.join(map(str, item_dims)),
-                               'X'.join(map(str, item_dims))))
-    remaining_dimensions = best_fit(item_dims, box_dims)
-    blocks = [{
-        'width': block[0],
-        'height': block[1],
-        'length': block[2]
-    } for block in remaining_dimensions]
-    remaining_volume = sum(volume(block) for block in remaining_dimensions)
-
-    return {
-        'remaining_volume': remaining_volume,
-        'remaining_dimensional_blocks': blocks
-    }
+    Returns:
+        error_class: with the message of error, and what error holds about
+            the items, such as the item_numbers of an UnpackableItemsError
+    '''
+    api_error = error_class(error.message)
+    api_error.__dict__.update(vars(error))
+    return api_error
 
 
-def how_many_items_fit(item_info, box_info, max_packed=None):
+def _raise_api_errors(function):
+    '''
+    wraps a function of core to raise the errors of fulfillment_api in place
+    of those of the errors module, with the same message and attributes
     '''
-    returns the number of of items of a certain size can fit in a box, as well
-        as the remaining volume
-    assumes item and box dimensions are on in the same units
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except packing_errors.BoxError as e:
+            raise _api_error(BoxError, e)
+        except packing_errors.APIError as e:
+            raise _api_error(APIError, e)
+    return wrapper
 
-    Args:
 
-        item_info (Dict[{
-                width: float
-                height: float
-                length: float
-                weight: float
-            }])
-        box_info (Dict[{
-                width: float
-                height: float
-                length: float
-                weight: float
-            }])
-        max_packed (int)
+api_packing_algorithm = _raise_api_errors(core.api_packing_algorithm)
+how_many_items_fit = _raise_api_errors(core.how_many_items_fit)
+normalize_boxes = _raise_api_errors(core.normalize_boxes)
+pre_pack_boxes = _raise_api_errors(core.pre_pack_boxes)
+space_after_packing = _raise_api_errors(core.space_after_packing)
 
-    Returns:
-        Dict[{
-            total_packed: int
-            remaining_volume: float
-        }]
-    '''
-    item_dims = sorted([item_info['width'], item_info['height'],
-                       item_info['length']])
-    box_dims = sorted([box_info['width'], box_info['height'],
-                       box_info['length']])
-    remaining_dimensions = [box_dims]
-    remaining_volume = volume(box_dims)
-    item = ItemTuple(None, item_dims, item_info.get('weight', 0))
-    # a list of lists. each nested list is representative of a package
-    items_packed = [[]]
-    while remaining_dimensions != []:
-        for block in remaining_dimensions:
-            # items_to_pack is of length 4 at every loop because
-            # insert_items_into_dimensions will pack up to 3 items at any given
-            # time and then check that there are more items to pack before
-            # continuing
-            items_to_pack = [item, item, item, item]
-            remaining_dimensions, items_packed = insert_items_into_dimensions(
-                remaining_dimensions, items_to_pack, items_packed)
-            # items_to_pack updates, insert items into dimensions may pack more
-            # than one item and therefore we find the difference between the
-            # length of the remaining items to pack and the original (4)
-            remaining_volume -= volume(item_dims) * (4 - len(items_to_pack))
-            if (max_packed is not None and
-                    len(items_packed[0]) == int(max_packed)):
-                # set remaining dimensions to empty to break from the while loop
-                remaining_dimensions = []
-                break
-    return {
-        'total_packed': len(items_packed[0]),
-        'remaining_volume': remaining_volume
-    }
 
+# fewest orders in a batch worth sending to the process pool
+MIN_POOL_ORDERS = 4
 
-def dim_to_cm(dim, dimension_units):
-    return convert_dimensional_units(float(dim), dimension_units,
-                                     to_unit=units.CENTIMETERS)
 
-
-def weight_of_box_contents(box_contents):
+def batch_packing_algorithm(boxes_info, orders, options, team_id=None):
     '''
-    returns the weight of the package contents
+    packs many orders against one catalog of boxes, in the process pool of
+    the parallel module when there are at least MIN_POOL_ORDERS orders
+
+    an order that cannot be packed gets an error of its own, the other
+    orders of the batch are still packed. That includes an order that is not
+    a dict, or has no order_id or products_info, an order without an
+    order_id gets an entry with an order_id of None
 
     Args:
-        box_contents (List[item_number])
-        item_info (Dict[Dict[{
-                'weight_g': int/float
-            }]])
-    Returns:
-        float
-    '''
-    return sum(float(item.weight) for item in box_contents)
+        boxes_info (List[Dict]): as for api_packing_algorithm
+        orders (List[Dict(
+                order_id: String, unique within the batch
+                products_info: List[Dict], as items_info for
+                    api_packing_algorithm
+                options: Dict, overrides the options of the batch for this
+                    order
+            )])
+        options (Dict): as for api_packing_algorithm, for every order
+        team_id (int): the packing_cache namespace the results are cached in
 
+    Raises:
+        BoxError when two boxes have the same name, or two orders the same
+            order_id
 
-def api_packing_algorithm(boxes_info, items_info, options):
+    Returns:
+        List[Dict[{
+            'order_id': String,
+            'packages': as for api_packing_algorithm,
+            'boxes_pruned': int,
+            'boxes_evaluated': int,
+            'timed_out': bool
+        }|{
+            'order_id': String,
+            'error': String
+        }]]: in the order of orders
+    '''
+    catalog = normalize_boxes(boxes_info)
+    order_ids = [order['order_id'] for order in orders
+                 if isinstance(order, dict) and 'order_id' in order]
+    if len(set(order_ids)) < len(order_ids):
+        raise BoxError('Please use unique order ids')
+    # pool processes cannot start pools of their own
+    in_pool = len(orders) >= MIN_POOL_ORDERS
+    jobs = [(catalog, order, options, team_id, in_pool) for order in orders]
+    if not in_pool:
+        return map(_pack_batch_order, jobs)
+    return get_pool().map(_pack_batch_order, jobs)
+
+
+def _pack_batch_order(args):
     '''
-    non-database calling method which allows checking multiple boxes
-    for packing efficiency
+    packs one order of a batch, turning any error it raises into the error
+    entry of this order, so one malformed order never fails the batch or
+    ends a stream
 
     Args:
-        session (sqlalchemy.orm.session.Session)
-        boxes_info (List[Dict(
-                weight: float
-                height: float
-                length: float
-                width: float
-                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
-                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
-                name: String
-            )])
-        items_info (List[Dict(
-                weight: float
-                height: float
-                length: float
-                width: float
-                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
-                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
-                product_name: String
-            )])
-        options (Dict(
-                max_weight: float
-            ))
+        args (Tuple[catalog, order, options, team_id, in_pool]): order as an
+            entry of orders for batch_packing_algorithm, options those of the
+            batch, and in_pool True to pack without a pool of its own
 
     Returns:
-        Dict[
-            'package_contents': List[Dict[
-                items_packed: Dict[item, quantity]
-                total_weight: float
-                'best_box': Dict[
-                    weight: float
-                    height: float
-                    length: float
-                    width: float
-                    dimension_units: ('inches', 'centimeters', 'feet', 'meters')
-                    weight_units: ('grams', 'pounds', 'kilograms', 'onces')
-                    name: String
-                ]
-            ]
-        ]
+        Dict: one entry of the list batch_packing_algorithm returns
     '''
-    boxes = []
-    items = []
-    if len(set(box['name'] for box in boxes_info)) < len(boxes_info):
-        # non-unique names for the boxes have been used.
-        raise BoxError('Please use unique boxes with unique names')
-    min_box_dimensions = [None, None, None]
-    for item in items_info:
-        dimensions = sorted([float(item['width']), float(item['height']),
-                             float(item['length'])])
-        weight_units = item['weight_units']
-        item_weight = convert_mass_units(float(item['weight']), weight_units,
-                                        to_unit='grams')
-        items += ([ItemTuple(item['product_name'], dimensions, item_weight)] *
-                 item['quantity'])
-        min_box_dimensions = [max(a, b) for a, b in izip(dimensions,
-                                                         min_box_dimensions)]
-    if options is not None:
-        max_weight = int(options.get('max_weight', 31710))
-    else:
-        max_weight = 31710
-    for box in boxes_info:
-        dimension_units = box.get('dimension_units', units.CENTIMETERS)
-        dimensions = sorted([dim_to_cm(box['width'], dimension_units),
-                             dim_to_cm(box['length'], dimension_units),
-                             dim_to_cm(box['height'], dimension_units)])
-        if does_it_fit(min_box_dimensions, dimensions):
-            box_weight_g = convert_mass_units(float(box['weight']),
-                                              box['weight_units'],
-                                              to_unit='grams')
-            boxes.append({
-                'box': ShippingBox(box['name'], box['name'],
-                                   box.get('description', ''), None,
-                                   box_weight_g, dimensions[0], dimensions[1],
-                                   dimensions[2], 0),
-                'dimensions': dimensions
-            })
-    if len(boxes) == 0:
-        raise BoxError('Some of your products are too big for your boxes. '
-                       'Please provide larger boxes.')
-    # sort boxes by volume
-    boxes = sorted(boxes, key=lambda box: volume(box['dimensions']))
-    # send everything through the packing algorithm
-    box_dictionary = packing_algorithm(items, boxes, max_weight)
-    # only return the package, because these boxes don't have description so
-    # flat_rate boxes won't be a thing - at least for now
-    package_info = box_dictionary['package']
-    package_contents_dict = [get_item_dictionary_from_list(parcel)
-                             for parcel in package_info.items_per_box]
-    package_contents = []
-    best_box = [box for box in boxes_info
-                if box['name'] == package_info.box.name][0]
-    if package_info.last_parcel is not None:
-        last_parcel = [box for box in boxes_info
-                       if box['name'] == package_info.last_parcel.name][0]
-    else:
-        last_parcel = None
-    for i, parcel in enumerate(package_contents_dict):
-        if i == len(package_contents_dict) - 1 and last_parcel is not None:
-            selected_box = last_parcel
-            total_weight = package_info.last_parcel.weight_g
-        else:
-            selected_box = best_box
-            total_weight = package_info.box.weight_g
-        items_packed = {}
-        for item, info in parcel.iteritems():
-            items_packed[item] = info['quantity']
-            total_weight += info['quantity'] * info['item'].weight
-        package_contents.append({
-            'packed_products': items_packed,
-            'total_weight': total_weight,
-            'box': selected_box
-        })
-
-    return {
-        'packages': package_contents
-    }
+    catalog, order, options, team_id, in_pool = args
+    if not isinstance(order, dict):
+        return {'order_id': None, 'error': msg.invalid_data}
+    order_id = order.get('order_id')
+    try:
+        if 'order_id' not in order:
+            raise KeyError('order_id')
+        order_options = dict(options or {})
+        order_options.update(order.get('options') or {})
+        if in_pool:
+            order_options['parallel'] = False
+        packing = _pack_order(catalog, order['products_info'], order_options,
+                              team_id)
+    except KeyError as e:
+        return {'order_id': order_id,
+                'error': msg.missing_value_for(e.message)}
+    except (AttributeError, IndexError, TypeError):
+        # products_info, or one of its products, is not of the right shape
+        return {'order_id': order_id, 'error': msg.invalid_data}
+    except ValueError as e:
+        value = e.message.split(' ')[-1]
+        return {'order_id': order_id,
+                'error': ('Invalid data in request. Check value {}'
+                          .format(value))}
+    except (APIError, BoxError, packing_errors.APIError,
+            packing_errors.BoxError) as e:
+        # packing_algorithm raises the errors of the box_packing package
+        return {'order_id': order_id, 'error': e.message}
+    except Exception:
+        # anything else is a bug, but still only this order's. Raising it
+        # would lose the packings of the other orders
+        logger.exception('Packing order %r failed', order_id)
+        return {'order_id': order_id, 'error': msg.invalid_data}
+    packing['order_id'] = order_id
+    return packing
+
+
+def stream_packing_algorithm(lines, team_id=None, default_options=None):
+    '''
+    packs a stream of newline delimited json orders one at a time, so memory
+    use does not grow with the number of orders
 
+    the first line holds the boxes shared by every order, every line after it
+    holds one order. Orders are read as they are packed, so a client sending
+    faster than they are packed is held back by the connection. order_ids
+    are not checked for uniqueness, that would mean keeping every one of them
 
-def pre_pack_boxes(box_info, items_info, options):
-    '''
-    returns the packed items of one specific box based on item_info
-    the item info input does not require a db call
-
-    Args
-        boxes_info (Dict[
-                weight: float
-                height: float
-                length: float
-                width: float
-                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
-                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
-                name: String
-            ])
-        products_info (List[Dict[
-                weight: float
-                height: float
-                length: float
-                width: float
-                dimension_units: ('inches', 'centimeters', 'feet', 'meters')
-                weight_units: ('grams', 'pounds', 'kilograms', 'onces')
-                product_name: String
-            ])
-        options (Dict[
-                max_weight: float
-            ])
-
-    Returns
-        List[Dict[{
-            packed_products: Dict[item, qty],
-            total_weight: float
-        }]]
+    Args:
+        lines (Iterable[str]): {"boxes_info": [...], "options": {...}} then
+            one {"order_id": ..., "products_info": [...], "options": {...}}
+            per line, as for batch_packing_algorithm. Blank lines are skipped
+        team_id (int): the packing_cache namespace the results are cached in
+        default_options (Dict): options for every order, those of the first
+            line take their place
+
+    Raises:
+        the errors of normalize_boxes, KeyError and ValueError, for the first
+            line only. They are raised before any order is read, so the
+            request can still be answered with an error
+
+    Returns:
+        Iterator[str]: one json line per order, as the entries of
+            batch_packing_algorithm, or {"line": int, "error": String} for a
+            line that is not an order
     '''
-    dimension_units = box_info['dimension_units']
-    box_dims = sorted([dim_to_cm(box_info['width'], dimension_units),
-                       dim_to_cm(box_info['length'], dimension_units),
-                       dim_to_cm(box_info['height'], dimension_units)])
-    items_to_pack = []
-    weight_units = box_info['weight_units']
-    box_weight = convert_mass_units(box_info['weight'], weight_units,
-                                    to_unit='grams')
-    total_weight = box_weight
-    max_weight = options.get('max_weight', 31710)  # given max weight or 70lbs
-    for item in items_info:
-        dimension_units = item['dimension_units']
-        weight_units = item['weight_units']
-        sorted_dims = sorted([dim_to_cm(item['height'], dimension_units),
-                              dim_to_cm(item['length'], dimension_units),
-                              dim_to_cm(item['width'], dimension_units)])
-        if not does_it_fit(sorted_dims, box_dims):
-            raise BoxError('Some of your items are too big for the box you\'ve'
-                           ' selected. Please select a bigger box or contact'
-                           ' ops@shotput.com.')
-        item['weight_g'] = convert_mass_units(item['weight'], weight_units,
-                                             to_unit='grams')
-        items_to_pack += [ItemTuple(item['product_name'], sorted_dims,
-                         int(item['weight_g']))] * int(item['quantity'])
-        total_weight += item['weight_g'] * int(item['quantity'])
-    items_to_pack = sorted(items_to_pack, key=lambda item: item.dimensions[2],
-                          reverse=True)
-    box_dims = sorted(box_dims)
-    items_packed = pack_boxes(box_dims, items_to_pack)
-    if math.ceil(float(total_weight) / max_weight) > len(items_packed):
-        additional_box = []
-        for items in items_packed:
-            while weight_of_box_contents(items) + box_weight > max_weight:
-                if (weight_of_box_contents(additional_box) +
-                        items[-1].weight <= max_weight):
-                    additional_box.append(items.pop())
-                else:
-                    items_packed.append(list(additional_box))
-                    additional_box = [items.pop()]
-        items_packed.append(additional_box)
-
-    parcel_shipments = []
-    for items in items_packed:
-        item_qty = Counter()
-        parcel_weight = box_weight
-        for item in items:
-            item_qty[item.item_number] += 1
-            parcel_weight += item.weight
-        parcel_shipments.append({'packed_products': dict(item_qty),
-                                 'total_weight': parcel_weight})
-    return parcel_shipments
+    lines = ((line_number, line)
+             for line_number, line in enumerate(lines, 1) if line.strip())
+    _, header = next(lines, (0, '{}'))
+    header = json_loads(header)
+    catalog = normalize_boxes(header['boxes_info'])
+    options = dict(default_options or {})
+    options.update(header.get('options') or {})
+    return _stream_orders(catalog, lines, options, team_id)
+
+
+def _stream_orders(catalog, lines, options, team_id):
+    for line_number, line in lines:
+        try:
+            order = json_loads(line)
+        except ValueError:
+            order = None
+        if not isinstance(order, dict):
+            result = {'line': line_number, 'error': msg.invalid_data}
+        elif 'order_id' not in order:
+            result = {'line': line_number,
+                      'error': msg.missing_value_for('order_id')}
+        else:
+            result = _pack_batch_order((catalog, order, options, team_id,
+                                        False))
+        yield json_dumps(result) + '\n'
 
 
 def compare_1000_times(trials=None):
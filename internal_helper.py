@@ -1,12 +1,14 @@
-from fulfillment_api.authentication.shipping_box import ShippingBox
-from fulfillment_api.constants import usps_shipping, units
+from fulfillment_api.constants import units
 from fulfillment_api.errors import BoxError
 import fulfillment_api.messages as msg
+from .box_catalog import box_catalog, query_useable_boxes
+from .fit_matrix import fits_into
 from .helper import api_packing_algorithm
-from .packing_algorithm import does_it_fit, packing_algorithm, ItemTuple
+from .packing_algorithm import packing_algorithm, ItemGroup, ItemTuple
+from .quantize import quantize_dims
+from .boxes import Box
 
 from itertools import izip
-from sqlalchemy import or_
 
 
 def is_packing_valid(item_quantities, box):
@@ -34,43 +36,50 @@ def is_packing_valid(item_quantities, box):
 
 
 def select_useable_boxes(session, min_box_dimensions, team,
-                         flat_rate_okay=False):
+                         flat_rate_okay=False, use_catalog=True):
     '''
-    queries the database for boxes that match criteria team, flat_rate, and size
+    selects the boxes that match criteria team, flat_rate, and size from the
+    boxes of the team kept by box_catalog, so no query is needed once they
+    are kept
 
     Args:
         session (sqlalchemy.orm.session.Session)
-        min_box_dimensions (List[int, int, int])
+        min_box_dimensions (List[int, int, int]): quantized
         team (Team),
         flat_rate_okay (Boolean)
+        use_catalog (Boolean): False to select the boxes in the database
+            with query_useable_boxes rather than from the ones kept
 
     Returns:
         List[Dict[{'box': ShippingBox,
                    'dimensions': List[int, int, int]}]]: a list of useable
-            shipping boxes and their dimensions
+            shipping boxes and their quantized dimensions, smallest volume
+            first
     '''
+    if not use_catalog:
+        boxes = query_useable_boxes(session, team.id, min_box_dimensions,
+                                    flat_rate_okay).all()
+        return [{'box': box,
+                 'dimensions': quantize_dims([box.width_cm, box.height_cm,
+                                              box.length_cm])}
+                for box in boxes]
+    catalog = box_catalog.get(session, team.id)
     useable_boxes = []
-    shipping_query = session.query(ShippingBox).filter(
-        or_(ShippingBox.width_cm >= min_box_dimensions[2],
-            ShippingBox.height_cm >= min_box_dimensions[2],
-            ShippingBox.length_cm >= min_box_dimensions[2]),
-        ShippingBox.is_available.is_(True),
-        or_(ShippingBox.team_id == team.id,
-            ShippingBox.team_id.is_(None)))
-    if not flat_rate_okay:
+    # make sure we only look at boxes where every item will fit
+    fitting_boxes = fits_into(min_box_dimensions, catalog.fit_dimensions)
+    for box, box_dims, flat_rate, fits in izip(catalog.boxes,
+                                               catalog.dimensions,
+                                               catalog.flat_rate,
+                                               fitting_boxes):
         # only select boxes that are not flat or regional rate
-        shipping_query = shipping_query.filter(
-            ~ShippingBox.description.in_(usps_shipping.USPS_BOXES))
-
-    boxes = shipping_query.all()
-
-    for box in boxes:
-        box_dims = sorted([box.width_cm, box.height_cm, box.length_cm])
-        # make sure we only look at boxes where every item will fit
-        if does_it_fit(min_box_dimensions, box_dims):
-            useable_boxes.append({'box': box, 'dimensions': box_dims})
-    # sort boxes by volume, smallest first and return
-    return sorted(useable_boxes, key=lambda box: box['box'].total_cubic_cm)
+        if fits and (flat_rate_okay or not flat_rate):
+            useable_boxes.append({
+                # attach the kept box to this session without a query
+                'box': session.merge(box, load=False),
+                'dimensions': list(box_dims)
+            })
+    # the catalog is sorted by volume, smallest first
+    return useable_boxes
 
 
 def shotput_packing_algorithm(session, team, qty_per_item, flat_rate_okay=False,
@@ -116,14 +125,15 @@ def shotput_packing_algorithm(session, team, qty_per_item, flat_rate_okay=False,
 
     for item_number, item_data in qty_per_item.iteritems():
 
-        dimensions = sorted([item_data['item'].width_cm,
-                             item_data['item'].height_cm,
-                             item_data['item'].length_cm])
+        dimensions = quantize_dims([item_data['item'].width_cm,
+                                    item_data['item'].height_cm,
+                                    item_data['item'].length_cm])
         min_box_dimensions = [max(a, b) for a, b in izip(dimensions,
                                                          min_box_dimensions)]
-        unordered_items += ([ItemTuple(item_data['item'], dimensions,
-                            item_data['item'].weight_g)] *
-                           int(item_data['quantity']))
+        unordered_items.append(ItemGroup(
+            ItemTuple(item_data['item'], dimensions,
+                      item_data['item'].weight_g),
+            int(item_data['quantity'])))
 
     useable_boxes = select_useable_boxes(session, min_box_dimensions, team,
                                          flat_rate_okay)
@@ -133,17 +143,23 @@ def shotput_packing_algorithm(session, team, qty_per_item, flat_rate_okay=False,
     if len(useable_boxes) == 0:
         raise BoxError(msg.boxes_too_small)
 
-    box_dictionary = packing_algorithm(unordered_items, useable_boxes,
+    # pack plain Boxes, and hand back the ShippingBoxes they were made from
+    shipping_boxes = {}
+    packed_boxes = []
+    for box_dict in useable_boxes:
+        box = Box.from_shipping_box(box_dict['box'])
+        shipping_boxes[box] = box_dict['box']
+        packed_boxes.append({'box': box, 'dimensions': box_dict['dimensions']})
+
+    box_dictionary = packing_algorithm(unordered_items, packed_boxes,
                                        max_weight, zone)
-    if box_dictionary['package'] is not None:
-        items_per_box = [[item.item_number for item in parcel]
-                        for parcel in box_dictionary['package'].items_per_box]
-        box_dictionary['package'] = box_dictionary['package']._replace(
-            items_per_box=items_per_box)
-    if box_dictionary['flat_rate'] is not None:
-        items_per_box = [[item.item_number for item in parcel]
-                        for parcel in box_dictionary['flat_rate'].items_per_box]
-        box_dictionary['flat_rate'] = box_dictionary['flat_rate']._replace(
-            items_per_box=items_per_box)
+    for key in ('package', 'flat_rate'):
+        if box_dictionary[key] is not None:
+            package = box_dictionary[key]
+            box_dictionary[key] = package._replace(
+                box=shipping_boxes[package.box],
+                items_per_box=[[item.item_number for item in parcel]
+                               for parcel in package.items_per_box],
+                last_parcel=shipping_boxes.get(package.last_parcel))
 
     return box_dictionary
@@ -0,0 +1,104 @@
+'''
+This module finds lower bounds on the number of parcels a box needs
+
+packing_algorithm packs the boxes smallest first and keeps the fewest parcels
+any box has needed so far. If a bound shows a box needs more parcels than
+that, the box cannot be the best box and does not need to be packed.
+
+Every bound holds for any packing, so a box is never skipped when it could
+have been chosen:
+--- volume: the items cannot take up more room than the box has, per parcel
+--- weight: every parcel holds at most max_weight less the weight of the box
+--- large items: two items that each take up more than half of the box
+    cannot share a parcel
+'''
+import math
+
+
+# allowance for float error when dividing, so 3.0000000001 parcels is 3
+_TOLERANCE = 1e-9
+
+
+def _ceil(value):
+    return int(math.ceil(value - _TOLERANCE))
+
+
+def _volume(dimensions):
+    return dimensions[0] * dimensions[1] * dimensions[2]
+
+
+def volume_bound(items, box_dims):
+    '''
+    fewest parcels needed to hold the volume of the items
+
+    Args:
+        items (List[ItemGroup])
+        box_dims (List[int, int, int])
+
+    Returns:
+        int
+    '''
+    items_volume = sum(_volume(group.item.dimensions) * group.quantity
+                       for group in items)
+    return _ceil(float(items_volume) / _volume(box_dims))
+
+
+def weight_bound(items, box_weight, max_weight):
+    '''
+    fewest parcels needed to hold the weight of the items
+
+    Args:
+        items (List[ItemGroup])
+        box_weight (float): weight of the empty box
+        max_weight (int)
+
+    Returns:
+        int: 0 when the empty box is already too heavy, packing the box will
+            raise the error for that
+    '''
+    payload = max_weight - box_weight
+    if payload <= 0:
+        return 0
+    items_weight = sum(float(group.item.weight) * group.quantity
+                       for group in items)
+    return _ceil(items_weight / payload)
+
+
+def large_item_bound(items, box_dims):
+    '''
+    number of items that take up more than half of the box, each one needs a
+    parcel of its own
+
+    Args:
+        items (List[ItemGroup])
+        box_dims (List[int, int, int])
+
+    Returns:
+        int
+    '''
+    half_volume = _volume(box_dims) / 2.0
+    return sum(group.quantity for group in items
+               if _volume(group.item.dimensions) > half_volume)
+
+
+def parcel_lower_bound(items, box_dims, box_weight, max_weight):
+    '''
+    fewest parcels of a box the items could possibly be packed into
+
+    Args:
+        items (List[ItemGroup])
+        box_dims (List[int, int, int])
+        box_weight (float): weight of the empty box
+        max_weight (int)
+
+    Returns:
+        int
+
+    Example:
+        >>> parcel_lower_bound([ItemGroup(ItemTuple('A', [2, 2, 2], 10), 9)],
+                               [2, 4, 4], 0, 100)
+        3
+    '''
+    return max(volume_bound(items, box_dims),
+               weight_bound(items, box_weight, max_weight),
+               large_item_bound(items, box_dims))
@@ -27,7 +27,8 @@ data path:
         largest possible volume left over
     --- using the remaining_dimensions, if the smallest item does not fit,
         disgard the block.
-    --- move the item packed into a list representing the box
+    --- move the item packed into a list representing the box, only items
+        light enough to keep the box under max_weight are packed into it
     --- iterate through the remaining_dimensions until either there are no
         items left to pack, or there are no remaining dimensions large enough
         for the items
@@ -49,14 +50,69 @@ data path:
 '''
 
 # from . import usps_shipping
-from errors import APIError, BoxError
-
-from collections import namedtuple
+from cache import LRUCache
+from errors import BoxError, ItemTooHeavyError, UnpackableItemsError
+from fit_matrix import anything_fits, dims_array
+from lower_bounds import parcel_lower_bound
+from quantize import dequantize
+
+from array import array
+from collections import Counter, namedtuple
 from itertools import izip
+from time import time
+
 
+# number of item and block sizes cached_best_fit remembers
+BEST_FIT_CACHE_SIZE = 4096
+# bump this whenever a change here changes how items end up packed or what is
+# returned for a packing, packings cached on disk by an older version are then
+# thrown away
+PACKING_VERSION = 5
+# most passes pack_boxes makes through its blocks before giving up, None for
+# no limit
+MAX_PACKING_ITERATIONS = None
 
 Packaging = namedtuple('Package', 'box, items_per_box, last_parcel')
 ItemTuple = namedtuple('ItemTuple', 'item_number, dimensions, weight')
+ItemGroup = namedtuple('ItemGroup', 'item, quantity')
+CandidatePacking = namedtuple(
+    'CandidatePacking',
+    'packed_boxes, boxes_evaluated, boxes_pruned, timed_out')
+
+
+def group_items(items):
+    '''
+    collapses runs of identical items into ItemGroups, keeping the order the
+    items were given in
+
+    items can be given one unit at a time as ItemTuples, already grouped as
+    ItemGroups, or a mix of both. An order of 5,000 units of one SKU is then
+    carried around as a single entry rather than 5,000 of them
+
+    Args:
+        items (List[ItemTuple|ItemGroup])
+
+    Returns:
+        List[ItemGroup]: the items and how many of each there are
+
+    Example:
+        >>> group_items([item1, item1, ItemGroup(item1, 3), item2])
+        [ItemGroup(item=item1, quantity=5), ItemGroup(item=item2, quantity=1)]
+    '''
+    grouped = []
+    for entry in items:
+        if isinstance(entry, ItemGroup):
+            item, quantity = entry.item, int(entry.quantity)
+        else:
+            item, quantity = entry, 1
+        if quantity <= 0:
+            continue
+        if len(grouped) > 0 and grouped[-1].item == item:
+            grouped[-1] = grouped[-1]._replace(
+                quantity=grouped[-1].quantity + quantity)
+        else:
+            grouped.append(ItemGroup(item, quantity))
+    return grouped
 
 
 def does_it_fit(item_dims, box_dims):
@@ -74,23 +130,346 @@ def does_it_fit(item_dims, box_dims):
         bool: whether or not the item will fit in the box
 
     '''
-    return all(box_dim >= item_dim
-               for box_dim, item_dim in izip(box_dims, item_dims))
+    return (item_dims[0] <= box_dims[0] and item_dims[1] <= box_dims[1] and
+            item_dims[2] <= box_dims[2])
 
 
-def _something_fits(items, box_dims):
+class DimensionFrontier(object):
     '''
-    iterates through all items to see if one of them will fit in the dimensions
-    given
+    the minimal dimensions of the items left to pack
+
+    an item is on the frontier when no other item is at most as big as it in
+    every sorted dimension. If anything fits into a block, something on the
+    frontier fits too, so checking whether any item is left that fits only
+    has to look at the frontier, which usually holds a handful of shapes
+    even when thousands of items remain.
 
     Args:
-        items (List[ItemTuple])
-        box_dims (List[int, int, int])
+        dimensions (List[List[int, int, int]]): sorted item dimensions, one
+            entry per item
 
-    Returns
-        bool: whether or not any of the items fit into the box
+    Example:
+        >>> frontier = DimensionFrontier([[1, 2, 3], [2, 2, 3], [1, 1, 4]])
+        >>> sorted(frontier.frontier)
+        [(1, 1, 4), (1, 2, 3)]
+        >>> frontier.remove([1, 2, 3])
+        >>> sorted(frontier.frontier)
+        [(1, 1, 4), (2, 2, 3)]
+    '''
+
+    def __init__(self, dimensions):
+        self.counts = Counter(tuple(dims) for dims in dimensions)
+        self.frontier = _minimal_dimensions(self.counts)
+        # the frontier as checked by anything_fits, rebuilt when it changes
+        self._frontier_dims = None
+
+    def something_fits(self, box_dims):
+        '''
+        checks if any of the items left will fit into box_dims
+
+        Args:
+            box_dims (List[int, int, int])
+
+        Returns:
+            bool
+        '''
+        if self._frontier_dims is None:
+            self._frontier_dims = dims_array(list(self.frontier))
+        return anything_fits(self._frontier_dims, box_dims)
+
+    def remove(self, dims):
+        '''
+        removes one item with the given dimensions, bringing up the items it
+        was the only one smaller than onto the frontier
+
+        Args:
+            dims (List[int, int, int])
+        '''
+        dims = tuple(dims)
+        self.counts[dims] -= 1
+        if self.counts[dims] > 0:
+            return
+        del self.counts[dims]
+        if dims not in self.frontier:
+            return
+        self.frontier.remove(dims)
+        self._frontier_dims = None
+        # only shapes that the removed shape was smaller than can be new to
+        # the frontier, and only if nothing still on it is smaller than them
+        uncovered = [shape for shape in self.counts
+                     if does_it_fit(dims, shape) and
+                     not any(does_it_fit(minimal, shape)
+                             for minimal in self.frontier)]
+        self.frontier |= _minimal_dimensions(uncovered)
+
+
+def _minimal_dimensions(shapes):
+    '''
+    finds the shapes that no other shape is at most as big as in every
+    dimension
+
+    Args:
+        shapes (Iterable[Tuple[int, int, int]]): distinct sorted dimensions
+
+    Returns:
+        Set[Tuple[int, int, int]]
+    '''
+    minimal = set()
+    # a shape can only be smaller than another if its dimensions add up to
+    # less, so smaller shapes are always seen first
+    for shape in sorted(shapes, key=sum):
+        if not any(does_it_fit(other, shape) for other in minimal):
+            minimal.add(shape)
+    return minimal
+
+
+class ItemPool(object):
+    '''
+    the items left to pack, in the order they should be packed in
+
+    keeps a segment tree over the item groups where every node holds the
+    smallest of each dimension found underneath it. A node whose smallest
+    dimensions do not fit a block cannot hold anything that fits, so finding
+    the first item that fits a block only walks down the branches that might
+    fit rather than scanning every item, and removing an item only updates
+    the nodes above it. Every node also holds the lightest weight underneath
+    it, so the branches too heavy for what a parcel can still hold are
+    skipped the same way. Whether anything fits a block at all is answered by
+    a DimensionFrontier of the items left.
+
+    Args:
+        items (List[ItemTuple|ItemGroup]): sorted by longest dimension
+
+    Example:
+        >>> pool = ItemPool([ItemGroup(item1, 2), ItemGroup(item2, 1)])
+        >>> pool.first_fit([5, 5, 10])
+        1
+        >>> pool.take(1)
+        item2
+        >>> len(pool)
+        2
+    '''
+
+    def __init__(self, items):
+        self.groups = group_items(items)
+        # the item of each group, shared by the parcels packed from the pool
+        self.table = [group.item for group in self.groups]
+        self.quantities = [group.quantity for group in self.groups]
+        self.remaining = sum(self.quantities)
+        self.frontier = DimensionFrontier(group.item.dimensions
+                                          for group in self.groups)
+        size = 1
+        while size < len(self.groups):
+            size *= 2
+        self._size = size
+        self._tree = [_NOTHING] * (2 * size)
+        self._weights = [float('inf')] * (2 * size)
+        for i, group in enumerate(self.groups):
+            self._tree[size + i] = tuple(group.item.dimensions)
+            self._weights[size + i] = float(group.item.weight)
+        for node in xrange(size - 1, 0, -1):
+            self._tree[node] = _smallest_dims(self._tree[2 * node],
+                                              self._tree[2 * node + 1])
+            self._weights[node] = min(self._weights[2 * node],
+                                      self._weights[2 * node + 1])
+
+    def __len__(self):
+        return self.remaining
+
+    def first_fit(self, box_dims, max_weight=None):
+        '''
+        finds the first item, in packing order, that fits into box_dims
+
+        Args:
+            box_dims (List[int, int, int]): sorted block dimensions
+            max_weight (float): most the item can weigh, no limit when not
+                given
+
+        Returns:
+            int: index of the item group, or None if nothing fits
+        '''
+        tree = self._tree
+        weights = self._weights
+        if max_weight is None:
+            max_weight = float('inf')
+        if not (does_it_fit(tree[1], box_dims) and weights[1] <= max_weight):
+            return None
+        # depth first, left before right, so the first leaf reached is the
+        # first item in packing order that fits
+        nodes = [1]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            if node >= self._size:
+                return node - self._size
+            right = 2 * node + 1
+            if (does_it_fit(tree[right], box_dims) and
+                    weights[right] <= max_weight):
+                nodes.append(right)
+            if (does_it_fit(tree[right - 1], box_dims) and
+                    weights[right - 1] <= max_weight):
+                nodes.append(right - 1)
+        return None
+
+    def lightest(self):
+        '''
+        Returns:
+            float: weight of the lightest item left, inf when none are left
+        '''
+        return self._weights[1]
+
+    def something_fits(self, box_dims):
+        '''
+        checks if any of the items left will fit into box_dims
+
+        Args:
+            box_dims (List[int, int, int])
+
+        Returns:
+            bool
+        '''
+        return self.frontier.something_fits(box_dims)
+
+    def take(self, index):
+        '''
+        removes one unit of the item group at index from the pool
+
+        Args:
+            index (int): index of the item group, as given by first_fit
+
+        Returns:
+            ItemTuple: the item removed
+        '''
+        self.quantities[index] -= 1
+        self.remaining -= 1
+        if self.quantities[index] == 0:
+            self.frontier.remove(self.groups[index].item.dimensions)
+            tree = self._tree
+            weights = self._weights
+            node = self._size + index
+            tree[node] = _NOTHING
+            weights[node] = float('inf')
+            node //= 2
+            while node > 0:
+                tree[node] = _smallest_dims(tree[2 * node], tree[2 * node + 1])
+                weights[node] = min(weights[2 * node], weights[2 * node + 1])
+                node //= 2
+        return self.groups[index].item
+
+    def items(self):
+        '''
+        the item groups left in the pool, in packing order
+
+        Returns:
+            List[ItemGroup]
+        '''
+        return [group._replace(quantity=quantity)
+                for group, quantity in izip(self.groups, self.quantities)
+                if quantity > 0]
+
+
+# dimensions no block can hold, used for the empty slots of an ItemPool
+_NOTHING = (float('inf'), float('inf'), float('inf'))
+
+
+# most items a Parcel can index with 2 byte indices
+MAX_SHORT_INDEX = 0xFFFF
+
+
+class Parcel(object):
+    '''
+    the items packed into one parcel
+
+    every unit packed is kept as a 2 byte index into a table of the distinct
+    items, which all the parcels of a packing share, rather than as an 8 byte
+    reference in a list of its own. A parcel of 5,000 units of one SKU is
+    then 10KB of indices and nothing else.
+    Tables of more than MAX_SHORT_INDEX items take 4 byte indices.
+    Iterating a parcel gives its ItemTuples, and a parcel is equal to a list
+    of the same ItemTuples
+
+    Args:
+        items (List[ItemTuple]): the distinct items, as ItemPool.table
+        indices (Iterable[int]): the index into items of each unit packed
+
+    Example:
+        >>> parcel = Parcel([item1, item2])
+        >>> parcel.add(1)
+        >>> parcel.add(1)
+        >>> parcel == [item2, item2]
+        True
+        >>> parcel.quantities()
+        [(item2, 2)]
     '''
-    return any(does_it_fit(item[1], box_dims) for item in items)
+    __slots__ = ('items', 'indices')
+
+    def __init__(self, items, indices=()):
+        self.items = items
+        self.indices = array('H' if len(items) <= MAX_SHORT_INDEX else 'i',
+                             indices)
+
+    def add(self, index):
+        '''
+        packs one unit of the item at index into the parcel
+
+        Args:
+            index (int): index into items
+        '''
+        self.indices.append(index)
+
+    def quantities(self):
+        '''
+        how many units of each item the parcel holds, counted without going
+        through the units one ItemTuple at a time
+
+        Returns:
+            List[Tuple[ItemTuple, int]]: in the order of the items table
+        '''
+        counts = Counter(self.indices)
+        return [(self.items[index], counts[index])
+                for index in sorted(counts)]
+
+    def weight(self):
+        '''
+        Returns:
+            float: the weight of the items in the parcel, without the box
+        '''
+        return sum(float(item.weight) * quantity
+                   for item, quantity in self.quantities())
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        items = self.items
+        return (items[index] for index in self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.items[i] for i in self.indices[index]]
+        return self.items[self.indices[index]]
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (Parcel, (self.items, self.indices))
+
+    def __repr__(self):
+        return 'Parcel({!r})'.format(list(self))
+
+
+def _smallest_dims(dims_1, dims_2):
+    return (min(dims_1[0], dims_2[0]), min(dims_1[1], dims_2[1]),
+            min(dims_1[2], dims_2[2]))
 
 
 def _get_side_2_side_3(item_dims, box_dims, side_1):
@@ -137,7 +516,35 @@ def volume(dimensions):
     Returns:
         int: volume
     '''
-    return reduce(lambda x, y: x * y, dimensions)
+    return dimensions[0] * dimensions[1] * dimensions[2]
+
+
+def _sorted_block(dim_1, dim_2, dim_3):
+    '''
+    sorts the three dimensions of a block, smallest to largest, with at most
+    three comparisons and without building a list
+    '''
+    if dim_1 > dim_2:
+        dim_1, dim_2 = dim_2, dim_1
+    if dim_2 > dim_3:
+        dim_2, dim_3 = dim_3, dim_2
+        if dim_1 > dim_2:
+            dim_1, dim_2 = dim_2, dim_1
+    return (dim_1, dim_2, dim_3)
+
+
+def _add_block(blocks, volumes, block, block_volume):
+    '''
+    adds a block with volume to blocks, after every block no larger than it,
+    as sorting the blocks by volume would. Blocks without volume are left out
+    '''
+    if block[0] == 0:
+        return
+    i = len(volumes)
+    while i > 0 and volumes[i - 1] > block_volume:
+        i -= 1
+    blocks.insert(i, block)
+    volumes.insert(i, block_volume)
 
 
 def best_fit(item_dims, box_dims):
@@ -163,106 +570,159 @@ def best_fit(item_dims, box_dims):
         >>> best_fit([5,5,5], [10,10,10])
         [[5,5,5], [5,5,10], [5,10,10]]
     '''
+    return [list(block) for block in _best_fit_blocks(item_dims, box_dims)]
+
+
+def _best_fit_blocks(item_dims, box_dims):
+    '''
+    best_fit, with the blocks as tuples. It runs once for every item packed,
+    so the blocks are sorted and their volumes worked out by hand rather than
+    with sorted and volume
 
+    Returns:
+        List[Tuple[int, int, int]]: the dimensions left in the box, smallest
+            volume first
+    '''
+    item_0, item_1, item_2 = item_dims
     side_1 = None  # side of the box that we lay longest dimension of item on
-    blocks = []  # potential remaining dimensions
+    block_1 = None  # the block left along side_1, if any
     # rotate box until we can set the items longest side
     box_dims = list(box_dims)
-    for i, b_dim in enumerate(box_dims):
+    for i in xrange(3):
+        b_dim = box_dims[i]
         # choose the shortest side of the box we can stack the item twice
         # on its longest side
         # based on theory of if b_dim / 2 >= s_dim, don't open a new bin
         #   (or don't rotate the box)
-        if b_dim >= item_dims[2] * 2:
+        if b_dim >= item_2 * 2:
             side_1 = i
             # block_1 is the upper layer of the box
-            block_1 = sorted([box_dims[side_1] - item_dims[2],
-                              box_dims[i - 1], box_dims[i - 2]])
-            blocks.append(block_1)
+            block_1 = _sorted_block(b_dim - item_2, box_dims[i - 1],
+                                    box_dims[i - 2])
+            volume_1 = (b_dim - item_2) * box_dims[i - 1] * box_dims[i - 2]
             # reset the box dimensions to being the height of the item
-            box_dims[i] = item_dims[2]
+            box_dims[i] = item_2
             break
 
-        elif b_dim == item_dims[2]:
+        elif b_dim == item_2:
             # exact fit, move to next block
             side_1 = i
             break
 
     if side_1 is None:
-        for i, b_dim in enumerate(box_dims):
+        for i in xrange(3):
+            b_dim = box_dims[i]
             # if we can't do that, chose the shortest side of the box we can
             # stack the item once on it's longest side
-            if b_dim >= item_dims[2]:
+            if b_dim >= item_2:
                 side_1 = i
-                block_1 = sorted([box_dims[side_1] - item_dims[2],
-                                  item_dims[1], item_dims[0]])
-                blocks.append(block_1)
+                block_1 = _sorted_block(b_dim - item_2, item_1, item_0)
+                volume_1 = (b_dim - item_2) * item_1 * item_0
                 break
 
     side_2, side_3 = _get_side_2_side_3(item_dims, box_dims, side_1)
-
-    # option one for remaining dimensions
-    block_2a = sorted([box_dims[side_1],
-                       box_dims[side_2],
-                       box_dims[side_3] - item_dims[0]])
-    block_3a = sorted([box_dims[side_1],
-                       box_dims[side_2] - item_dims[1],
-                       item_dims[0]])
-
-    # option two for remaining dimensions
-    block_2b = sorted([box_dims[side_1],
-                       box_dims[side_2] - item_dims[1],
-                       box_dims[side_3]])
-    block_3b = sorted([box_dims[side_1],
-                       box_dims[side_3] - item_dims[0],
-                       item_dims[1]])
-
+    dim_1 = box_dims[side_1]
+    dim_2 = box_dims[side_2]
+    dim_3 = box_dims[side_3]
+
+    # option one for remaining dimensions is
+    #     block_2a: dim_1, dim_2, dim_3 - item_0
+    #     block_3a: dim_1, dim_2 - item_1, item_0
+    # option two for remaining dimensions is
+    #     block_2b: dim_1, dim_2 - item_1, dim_3
+    #     block_3b: dim_1, dim_3 - item_0, item_1
+    volume_2a = dim_1 * dim_2 * (dim_3 - item_0)
+    volume_2b = dim_1 * (dim_2 - item_1) * dim_3
+
+    blocks = []
+    volumes = []
+    if block_1 is not None:
+        _add_block(blocks, volumes, block_1, volume_1)
     # select the option where block_2 and block_3 are closest in size
     # this operator has been tested and is 5-15% more accurate than
     # if volume(block_2a) > volume(block_2b)
     # DO NOT REVERT
-    if volume(block_2a) < volume(block_2b):
-        blocks.append(block_2a)
-        blocks.append(block_3a)
+    if volume_2a < volume_2b:
+        _add_block(blocks, volumes,
+                   _sorted_block(dim_1, dim_2, dim_3 - item_0), volume_2a)
+        _add_block(blocks, volumes,
+                   _sorted_block(dim_1, dim_2 - item_1, item_0),
+                   dim_1 * (dim_2 - item_1) * item_0)
     else:
-        blocks.append(block_2b)
-        blocks.append(block_3b)
+        _add_block(blocks, volumes,
+                   _sorted_block(dim_1, dim_2 - item_1, dim_3), volume_2b)
+        _add_block(blocks, volumes,
+                   _sorted_block(dim_1, dim_3 - item_0, item_1),
+                   dim_1 * (dim_3 - item_0) * item_1)
+    return blocks
 
-    remaining_dimensions = []
-    for block in blocks:
-        # if the blocks smallest dimension is not 0, it has volume
-        # and the block should be appended
-        if block[0] != 0:
-            remaining_dimensions.append(block)
-    # sort unsorted_remaining_dimensions by volume
-    remaining_dimensions = sorted(remaining_dimensions,
-                                  key=lambda block: volume(block))
+
+best_fit_cache = LRUCache(BEST_FIT_CACHE_SIZE)
+
+
+def cached_best_fit(item_dims, box_dims):
+    '''
+    best_fit, remembered for the most recently used item and block sizes
+
+    the same SKUs keep landing in the same boxes and the same left over
+    blocks, so most calls have been answered before. The blocks are returned
+    as tuples so the cached answer cannot be changed by the caller.
+    best_fit_cache.info() gives the hits and misses, and
+    best_fit_cache.resize sets how many answers are kept
+
+    Args:
+        item_dims (List[int, int, int]): sorted item dimensions
+        box_dims (List[int, int, int]): sorted box dimensions
+
+    Returns:
+        Tuple[Tuple[int, int, int]]: the dimensions left in the box after the
+            item has been placed inside of it
+    '''
+    key = (tuple(item_dims), tuple(box_dims))
+    remaining_dimensions = best_fit_cache.get(key)
+    if remaining_dimensions is None:
+        remaining_dimensions = tuple(_best_fit_blocks(item_dims, box_dims))
+        best_fit_cache.put(key, remaining_dimensions)
     return remaining_dimensions
 
 
 def insert_items_into_dimensions(remaining_dimensions, items_to_pack,
-                                items_packed):
+                                items_packed, max_weight=None):
+    '''
+    packs the first item that fits into the first remaining block
+
+    Args:
+        remaining_dimensions (List[List[int, int, int]])
+        items_to_pack (ItemPool): the items left to pack, updated in place
+        items_packed (List[Parcel]): parcels over the table of items_to_pack
+        max_weight (float): most the item packed can weigh, no limit when not
+            given
+
+    Returns:
+        List[List[int, int, int]], List[Parcel]: the remaining dimensions and
+            the items packed
+    '''
     block = remaining_dimensions[0]
-    for item in items_to_pack:
-        if does_it_fit(item.dimensions, block):
-            # if the item fits, pack it, remove it from the items to pack
-            items_packed[-1].append(item)
-            items_to_pack.remove(item)
-            # find the remaining dimensions in the box after packing
-            left_over_dimensions = best_fit(item.dimensions, block)
-            for left_over_block in left_over_dimensions:
-                # only append left over block if at least one item fits
-                if _something_fits(items_to_pack, left_over_block):
-                    remaining_dimensions.append(left_over_block)
-            # if a item fits, remaining dimensions will have changed
-            # break out of loop
-            break
+    index = items_to_pack.first_fit(block, max_weight)
+    if index is not None:
+        # if the item fits, pack it, remove it from the items to pack
+        item = items_to_pack.take(index)
+        items_packed[-1].add(index)
+        # find the remaining dimensions in the box after packing, a lookup
+        # in best_fit_cache costs as much as working them out
+        left_over_dimensions = _best_fit_blocks(item.dimensions, block)
+        for left_over_block in left_over_dimensions:
+            # only append left over block if at least one item fits
+            if items_to_pack.something_fits(left_over_block):
+                remaining_dimensions.append(left_over_block)
     # remove the block from that remaining dimensions
     remaining_dimensions.pop(0)
     return remaining_dimensions, items_packed
 
 
-def pack_boxes(box_dimensions, items_to_pack):
+def pack_boxes(box_dimensions, items_to_pack, max_parcels=None,
+               deadline=None, max_iterations=None, max_weight=None,
+               box_weight=0):
     '''
     while loop to pack boxes
     The first available dimension to pack is the box itself.
@@ -272,16 +732,32 @@ def pack_boxes(box_dimensions, items_to_pack):
         least one of the items, it will continue to pack the same box
     If there is no remaining space in the box large enough for a item, a new
         dimension will be added to available
+    When a max_weight is given, an item only goes into a parcel if the parcel
+        stays within max_weight, and a parcel is closed as soon as none of the
+        items left is light enough to join it
     After there are no more items needing to be packed, returns a list lists of
         the items in there 'boxes' (first box is first nested list, second is
         the second, etc.)
     Args:
         box_dimensions (List[int, int, int]): sorted list of box dimensions
-        items_to_pack (List[ItemTuple]): list of items to pack as ItemTuples
-            sorted by longest dimension
+        items_to_pack (List[ItemTuple|ItemGroup]): list of items to pack as
+            ItemTuples, or as ItemGroups of identical items, sorted by longest
+            dimension
+        max_parcels (int): give up once more parcels than this are needed
+        deadline (float): give up if a parcel is started after this time, as
+            returned by time.time()
+        max_iterations (int): most passes through the blocks before raising a
+            BoxError, MAX_PACKING_ITERATIONS when not given
+        max_weight (float): most a parcel can weigh, box included, no limit
+            when not given
+        box_weight (float): weight of the empty box
+    raises:
+        UnpackableItemsError when some items do not fit into the empty box
+        ItemTooHeavyError when a single SKU is heavier than max_weight allows
+        BoxError after max_iterations passes
     returns:
-        List[List[SimpleItem]]: list of lists including the items in the
-            number of boxes the are arranged into
+        List[Parcel]: the items in each of the parcels they are arranged
+            into, or None if it gave up
     example:
     >>> pack_boxes([5,5,10], [[item1, [5,5,10]], item2, [5,5,6],
                    [item3, [5,5,4]])
@@ -292,19 +768,65 @@ def pack_boxes(box_dimensions, items_to_pack):
     # block where space remains to be filled.
     remaining_dimensions = []
     items_packed = []  # the items that have been packed
-    items_to_pack_copy = list(items_to_pack)
+    # the pool works on groups of identical items, so the work done scales
+    # with the number of distinct items rather than the number of units
+    items_to_pack_copy = ItemPool(items_to_pack)
+    # an item that does not fit into the empty box would open a new parcel
+    # forever
+    unpackable = [group.item.item_number for group in items_to_pack_copy.groups
+                  if not does_it_fit(group.item.dimensions, box_dimensions)]
+    if unpackable:
+        raise UnpackableItemsError(unpackable, [dequantize(dim)
+                                                for dim in box_dimensions])
+    # weight the items of a parcel can add up to
+    payload = (float('inf') if max_weight is None else
+               float(max_weight) - float(box_weight))
+    too_heavy = [group.item.item_number for group in items_to_pack_copy.groups
+                 if float(group.item.weight) > payload]
+    if too_heavy:
+        # a parcel of that item alone would be too heavy
+        raise ItemTooHeavyError(too_heavy[0])
+    if max_iterations is None:
+        max_iterations = MAX_PACKING_ITERATIONS
+    iterations = 0
     while len(items_to_pack_copy) > 0:
         # keep going until there are no more items to pack
         if len(remaining_dimensions) == 0:
+            if items_packed and not items_packed[-1]:
+                # nothing went into the last parcel, nothing ever will
+                raise UnpackableItemsError(
+                    [group.item.item_number
+                     for group in items_to_pack_copy.items()],
+                    [dequantize(dim) for dim in box_dimensions])
+            if len(items_packed) == max_parcels:
+                # another parcel would be more than we were allowed
+                return None
+            if deadline is not None and time() > deadline:
+                return None
             # if there is no room for more items in the last parcel,
             # append an empty parcel with the full box dimensions
             # and append an empty parcel to the list of items packed
             remaining_dimensions = [box_dimensions]
-            items_packed.append([])
+            items_packed.append(Parcel(items_to_pack_copy.table))
+            payload_left = payload
         # iterate through remaining dimensions to pack boxes
         for block in remaining_dimensions:
+            iterations += 1
+            if max_iterations is not None and iterations > max_iterations:
+                raise BoxError('Packing gave up after {} iterations'
+                               .format(max_iterations))
+            # the indices of the parcel, read directly in this hot loop
+            indices = items_packed[-1].indices
+            parcel_size = len(indices)
             remaining_dimensions, items_packed = insert_items_into_dimensions(
-                remaining_dimensions, items_to_pack_copy, items_packed)
+                remaining_dimensions, items_to_pack_copy, items_packed,
+                payload_left)
+            if len(indices) > parcel_size:
+                payload_left -= float(
+                    items_to_pack_copy.table[indices[-1]].weight)
+                if payload_left < items_to_pack_copy.lightest():
+                    # nothing left is light enough to join this parcel
+                    del remaining_dimensions[:]
     return items_packed
 
 
@@ -346,24 +868,161 @@ def setup_packages(packed_boxes, zone=None):
     return None
 
 
+def pack_box(box_dimensions, box_weight, items_to_pack, max_weight,
+             max_parcels=None, deadline=None):
+    '''
+    packs the items into as many parcels of one box as needed, none of them
+    heavier than max_weight
+
+    Args:
+        box_dimensions (List[int, int, int]): sorted box dimensions
+        box_weight (float): weight of the empty box
+        items_to_pack (List[ItemTuple|ItemGroup]): sorted by longest dimension
+        max_weight (int)
+        max_parcels (int): give up once more parcels than this are needed
+        deadline (float): give up if a parcel is started after this time
+
+    Raises:
+        APIError when a single SKU is heavier than max_weight
+
+    Returns:
+        List[Parcel]: the items in each parcel, or None if it gave up
+    '''
+    return pack_boxes(box_dimensions, items_to_pack, max_parcels, deadline,
+                      max_weight=max_weight, box_weight=box_weight)
+
+
+def pack_candidate_boxes(items_to_pack, candidate_boxes, max_weight,
+                         deadline=None):
+    '''
+    packs the items into each candidate box, skipping the boxes that can be
+    shown to need more parcels than the best box packed so far
+
+    a box is skipped without being packed when the lower bound on its parcels
+    is already more than the fewest parcels so far, and packing a box gives
+    up as soon as it goes over that number. Neither box could have been
+    chosen by setup_packages, which picks the fewest parcels first. The boxes
+    are packed in order of their lower bound, but returned in the order given
+
+    once the deadline has passed no more boxes are packed. The first box is
+    always packed to the end, so there is always a packing to return
+
+    Args:
+        items_to_pack (List[ItemGroup]): sorted by longest dimension
+        candidate_boxes (List[Tuple[List[int, int, int], float]]): dimensions
+            and weight of each box, smallest first
+        max_weight (int)
+        deadline (float): time to stop packing boxes, as returned by
+            time.time()
+
+    Raises:
+        APIError when a single SKU is heavier than max_weight
+
+    Returns:
+        CandidatePacking: packed_boxes holds the items in each parcel for
+            each box, or None for the boxes that were skipped or not reached.
+            boxes_evaluated counts the boxes that were packed or given up on,
+            boxes_pruned the boxes shown to need more parcels than the best
+            box, and timed_out whether the deadline stopped the packing
+    '''
+    lower_bounds = [parcel_lower_bound(items_to_pack, box_dimensions,
+                                       box_weight, max_weight)
+                    for box_dimensions, box_weight in candidate_boxes]
+    # pack the most promising boxes first, so the fewest parcels so far drops
+    # quickly and more of the other boxes can be skipped
+    order = sorted(xrange(len(candidate_boxes)),
+                   key=lambda i: (lower_bounds[i],
+                                  -volume(candidate_boxes[i][0])))
+    fewest_parcels = None
+    packed_boxes = [None] * len(candidate_boxes)
+    boxes_evaluated = 0
+    boxes_pruned = 0
+    timed_out = False
+    for position, i in enumerate(order):
+        if fewest_parcels is not None and lower_bounds[i] > fewest_parcels:
+            boxes_pruned += len(order) - position
+            break
+        box_dimensions, box_weight = candidate_boxes[i]
+        # only hold the first box to the deadline once another is packed
+        box_deadline = deadline if fewest_parcels is not None else None
+        if box_deadline is not None and time() > box_deadline:
+            timed_out = True
+            break
+        packed_items = pack_box(box_dimensions, box_weight, items_to_pack,
+                                max_weight, fewest_parcels, box_deadline)
+        if packed_items is not None:
+            fewest_parcels = len(packed_items)
+        elif box_deadline is not None and time() > box_deadline:
+            timed_out = True
+            break
+        else:
+            boxes_pruned += 1
+        boxes_evaluated += 1
+        packed_boxes[i] = packed_items
+    return CandidatePacking(packed_boxes, boxes_evaluated, boxes_pruned,
+                            timed_out)
+
+
+def boxes_light_enough(items_to_pack, useable_boxes, max_weight):
+    '''
+    leaves out the boxes too heavy to hold the heaviest item within
+    max_weight. Packing one of them would raise, or not, depending on whether
+    it is pruned first, so they are left out before any box is packed, the
+    same way however the boxes are packed
+
+    Args:
+        items_to_pack (List[ItemGroup])
+        useable_boxes (List(Dict[{
+            'dimensions': List(int, int, int)
+            'box': ShippingBox
+        }]))
+        max_weight (int)
+
+    Raises:
+        ItemTooHeavyError when no box is light enough, naming the heaviest
+            item
+
+    Returns:
+        List[Dict]: the useable_boxes light enough, in order
+    '''
+    if not items_to_pack or max_weight is None:
+        return useable_boxes
+    heaviest = max(items_to_pack, key=lambda group: float(group.item.weight))
+    # the same test pack_boxes makes
+    light_enough = [box_dict for box_dict in useable_boxes
+                    if float(heaviest.item.weight) <=
+                    float(max_weight) - float(box_dict['box'].weight_g)]
+    if useable_boxes and not light_enough:
+        raise ItemTooHeavyError(heaviest.item.item_number)
+    return light_enough
+
+
 def packing_algorithm(unordered_items, useable_boxes, max_weight,
-                      zone=None):
+                      zone=None, parallel=False, deadline=None):
     '''
     from items provided, and boxes available, pack boxes with items
 
     - returns a dictionary of boxes with an 2D array of items packed
         in each parcel
     Args:
-        unordered_items (List[ItemTuple])
+        unordered_items (List[ItemTuple|ItemGroup])
         useable_boxes (List(Dict[{
             'dimensions': List(int, int, int)
             'box': ShippingBox
         }]))
         max_weight (Int)
         zone (Int?)
+        parallel (bool): whether to pack the boxes in a pool of processes, see
+            parallel.pack_candidate_boxes
+        deadline (float): time to stop packing more boxes and return the best
+            box so far, as returned by time.time()
 
     Raises:
         BoxError when no box could fit some SKU.
+        UnpackableItemsError when a useable box is too small for some SKU
+        ItemTooHeavyError when some SKU is too heavy for every box, boxes too
+            heavy for it but not for the others are left out, see
+            boxes_light_enough
 
     Example:
     >>> packing_algorithm([item1, item2], [], {item1: 1, item2: 3}, True)
@@ -373,55 +1032,47 @@ def packing_algorithm(unordered_items, useable_boxes, max_weight,
                     last_parcel=<smaller_box object>),
         'flat_rate': (box=<best_flat_rate object>,
                       items_per_box=[[ItemTuple], [ItemTuple, ItemTuple, ItemTuple]],
-                      last_parcel=None)
+                      last_parcel=None),
+        'boxes_pruned': 0,
+        'boxes_evaluated': 2,
+        'timed_out': False
     }
 
     Note: useable_boxes refers to boxes that you already know are big enough to
         fit at least ONE of each of the items. If you send in a box that is too
-        small, you will be stuck in an infinite loop.
+        small, an UnpackableItemsError is raised.
     '''
-    packed_boxes = {}
     # sort items by longest dimension, longest first
-    items_to_pack = sorted(unordered_items, key=lambda item: item.dimensions[2],
-                          reverse=True)
+    items_to_pack = sorted(group_items(unordered_items),
+                           key=lambda group: group.item.dimensions[2],
+                           reverse=True)
+    useable_boxes = boxes_light_enough(items_to_pack, useable_boxes,
+                                       max_weight)
     # pack the biggest items first then progressively pack the smaller ones
-    for box_dict in useable_boxes:
-        box = box_dict['box']
-        packed_items = pack_boxes(box_dict['dimensions'], items_to_pack)
-        # additional box starts as the last parcel
-
-        additional_boxes = []
-        additional_box = []
-        for items in packed_items:
-            # if the weight of the contents of the box are greater than the
-            # given max weight
-            while sum(item.weight for item in items) + box.weight_g > max_weight:
-                if len(items) == 1:
-                    raise APIError('SKU is too heavy: {}'
-                                   .format(items[0].item_number))
-
-                # TODO: Instead of removing the last SKU, remove the lightest
-                # SKU, or the SKU that is closest in weight to the difference
-                # between the current weight and the maximum weight.
-                popped_item = items.pop()
-
-                if ((sum(item.weight for item in additional_box) +
-                        float(popped_item.weight) + box.weight_g) > max_weight):
-                    # if the additional box weight + the last item is more than
-                    # the max weight, start a new box
-                    additional_boxes.append(additional_box)
-                    additional_box = []
-
-                additional_box.append(popped_item)
-
-        if len(additional_box) > 0:
-            additional_boxes.append(additional_box)
-
-        packed_items += additional_boxes
-
-        packed_boxes[box_dict['box']] = packed_items
-
-    box_dictionary = setup_box_dictionary(packed_boxes, zone)
+    if parallel:
+        # imported here, the parallel module imports this one
+        from parallel import pack_useable_boxes
+        packing = pack_useable_boxes(items_to_pack, useable_boxes,
+                                     max_weight, deadline)
+    else:
+        packing = pack_candidate_boxes(
+            items_to_pack,
+            [(box_dict['dimensions'], box_dict['box'].weight_g)
+             for box_dict in useable_boxes],
+            max_weight, deadline)
+        packing = packing._replace(packed_boxes=dict(
+            (box_dict['box'], packed_items)
+            for box_dict, packed_items in izip(useable_boxes,
+                                               packing.packed_boxes)
+            if packed_items is not None))
+
+    box_dictionary = {
+        'package': setup_packages(packing.packed_boxes, zone),
+        'flat_rate': None,
+        'boxes_pruned': packing.boxes_pruned,
+        'boxes_evaluated': packing.boxes_evaluated,
+        'timed_out': packing.timed_out
+    }
 
     # repack the last parcel into a smaller box
     if (box_dictionary['package'] is not None and
@@ -429,11 +1080,16 @@ def packing_algorithm(unordered_items, useable_boxes, max_weight,
         package = box_dictionary['package']
         # repack the last parcels, see if they should go in a smaller box
         smallest_items_to_pack = package.items_per_box[-1]
+        items_weight = sum(float(item.weight)
+                           for item in smallest_items_to_pack)
         for box_dict in useable_boxes:
+            if deadline is not None and time() > deadline:
+                break
             # using non-flat rate boxes and those already smaller than the
-            # currently set box
+            # currently set box, and light enough to hold the last parcel
             smaller_box = box_dict['box']
-            if (smaller_box.total_cubic_cm < package.box.total_cubic_cm):
+            if (smaller_box.total_cubic_cm < package.box.total_cubic_cm and
+                    items_weight + smaller_box.weight_g <= max_weight):
                 packed_items = pack_boxes(box_dict['dimensions'],
                                          smallest_items_to_pack)
                 if len(packed_items) == 1:
@@ -0,0 +1,188 @@
+'''
+This module packs the candidate boxes of packing_algorithm in a pool of
+processes
+
+Every candidate box is packed independently of the others, so a catalog of
+40 boxes is 40 calls to pack_box that can run side by side. The pool is
+created the first time it is needed and kept for the life of the process.
+
+data path:
+--- the boxes are split into one chunk per process
+--- each chunk is sent to a process along with the items, so the items are
+    sent once per process rather than once per box. Items are sent as their
+    index, dimensions and weight only, item numbers can be database objects
+    that should not be pickled. The errors raised in a process name items by
+    index too, they are raised again with the item numbers
+--- each process packs its boxes with pack_candidate_boxes and sends back the
+    index of every item in every parcel, as an array. Each process only skips
+    boxes against the best box of its own chunk, and packs the first box of
+    its chunk to the end whatever the deadline
+--- the parcels are put back together as Parcels over the original items,
+    keyed by box, ready for setup_packages
+'''
+from errors import ItemTooHeavyError, UnpackableItemsError
+from packing_algorithm import (pack_candidate_boxes, CandidatePacking,
+                               ItemGroup, ItemTuple, Parcel)
+
+from array import array
+from itertools import izip
+
+from multiprocessing import cpu_count, Pool
+import atexit
+
+
+# number of processes in the pool, None uses one per cpu
+PROCESSES = None
+# below this many candidate boxes the boxes are packed in this process, it is
+# not worth sending the items to the pool
+MIN_BOXES = 8
+
+_pool = None
+
+
+# the default of the arguments of configure that can be set to None
+_UNCHANGED = object()
+
+
+def configure(processes=_UNCHANGED, min_boxes=None):
+    '''
+    sets the size of the pool and how many boxes it takes to use it. Takes
+    effect the next time the pool is created. Only the settings given are
+    changed
+
+    Args:
+        processes (int): number of processes, None for one per cpu
+        min_boxes (int): fewest candidate boxes to pack in the pool
+    '''
+    global PROCESSES, MIN_BOXES
+    if processes is not _UNCHANGED:
+        PROCESSES = processes
+    if min_boxes is not None:
+        MIN_BOXES = min_boxes
+
+
+def get_pool():
+    '''
+    returns the process pool, creating it if it does not exist yet
+
+    Returns:
+        multiprocessing.Pool
+    '''
+    global _pool
+    if _pool is None:
+        _pool = Pool(PROCESSES)
+    return _pool
+
+
+@atexit.register
+def close_pool():
+    '''
+    shuts the process pool down, the next call to get_pool creates a new one
+    '''
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def _pack_chunk(args):
+    '''
+    packs a chunk of boxes inside a pool process
+
+    Args:
+        args (Tuple[
+            List[ItemGroup]: items with their index as item_number,
+            List[Tuple[List[int, int, int], float]]: dimensions and weight of
+                each box,
+            int: max weight,
+            float: deadline
+        ])
+
+    Returns:
+        CandidatePacking: with the index of each item packed in each parcel,
+            for each box, or None for the boxes that were skipped
+    '''
+    items_to_pack, candidate_boxes, max_weight, deadline = args
+    packing = pack_candidate_boxes(items_to_pack, candidate_boxes, max_weight,
+                                   deadline)
+    return packing._replace(packed_boxes=[
+        [array(parcel.indices.typecode,
+               (item.item_number for item in parcel))
+         for parcel in packed_items]
+        if packed_items is not None else None
+        for packed_items in packing.packed_boxes])
+
+
+def pack_useable_boxes(items_to_pack, useable_boxes, max_weight,
+                       deadline=None):
+    '''
+    packs the items into every useable box, in the process pool when there
+    are at least MIN_BOXES boxes
+
+    Args:
+        items_to_pack (List[ItemGroup]): sorted by longest dimension
+        useable_boxes (List(Dict[{
+            'dimensions': List(int, int, int)
+            'box': ShippingBox
+        }]))
+        max_weight (int)
+        deadline (float): time to stop packing boxes, as returned by
+            time.time()
+
+    Raises:
+        APIError when a single SKU is heavier than max_weight
+
+    Returns:
+        CandidatePacking: with packed_boxes as Dict[ShippingBox,
+            List[Parcel]], the items in each parcel for each box that was
+            packed, as passed to setup_packages
+    '''
+    if len(useable_boxes) < MIN_BOXES:
+        chunks = [useable_boxes]
+        results = [pack_candidate_boxes(
+            items_to_pack,
+            [(box_dict['dimensions'], box_dict['box'].weight_g)
+             for box_dict in useable_boxes],
+            max_weight, deadline)]
+    else:
+        shipped_items = [ItemGroup(ItemTuple(i, group.item.dimensions,
+                                             group.item.weight),
+                                   group.quantity)
+                         for i, group in enumerate(items_to_pack)]
+        pool = get_pool()
+        num_chunks = min(len(useable_boxes), PROCESSES or cpu_count())
+        # boxes are sorted by volume, deal them out so every chunk gets a mix
+        # of small boxes, which take many parcels, and large ones
+        chunks = [useable_boxes[i::num_chunks] for i in xrange(num_chunks)]
+        table = [group.item for group in items_to_pack]
+        try:
+            results = pool.map(_pack_chunk, [
+                (shipped_items,
+                 [(box_dict['dimensions'], box_dict['box'].weight_g)
+                  for box_dict in chunk],
+                 max_weight, deadline)
+                for chunk in chunks])
+        except ItemTooHeavyError as e:
+            # the processes only know the items by index
+            raise ItemTooHeavyError(table[e.item_number].item_number)
+        except UnpackableItemsError as e:
+            raise UnpackableItemsError(
+                [table[i].item_number for i in e.item_numbers],
+                e.box_dimensions)
+        results = [packing._replace(packed_boxes=[
+                       [Parcel(table, parcel) for parcel in packed_items]
+                       if packed_items is not None else None
+                       for packed_items in packing.packed_boxes])
+                   for packing in results]
+
+    packed_boxes = {}
+    for chunk, packing in izip(chunks, results):
+        for box_dict, packed_items in izip(chunk, packing.packed_boxes):
+            if packed_items is not None:
+                packed_boxes[box_dict['box']] = packed_items
+    return CandidatePacking(
+        packed_boxes,
+        sum(packing.boxes_evaluated for packing in results),
+        sum(packing.boxes_pruned for packing in results),
+        any(packing.timed_out for packing in results))
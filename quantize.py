@@ -0,0 +1,106 @@
+'''
+This module turns dimensions into integers before they are packed
+
+Dimensions arrive as floats, in centimeters once dim_to_cm has converted
+them. Subtracting floats leaves residue: a 0.3cm block less a 0.1cm item
+leaves 0.19999999999999998cm, so an item of exactly 0.2cm no longer fits, and
+the same block reached two ways makes two cache keys. Rounded once, on the
+way in, to whole steps of 1 / DIMENSION_SCALE of a unit, best_fit, volume
+and does_it_fit only add, subtract, multiply and compare integers, which is
+exact and cheaper.
+
+data path:
+--- quantize_dims turns the dimensions of every item and box into sorted
+    integers as a request is read
+--- the packing runs on the integers
+--- dequantize and dequantize_volume turn dimensions and volumes back into
+    the units they were given in, for the few outputs that hold them
+'''
+
+# integer steps per unit, 100 per centimeter is a tenth of a millimeter
+DIMENSION_SCALE = 100
+
+
+def quantize(dimension):
+    '''
+    Args:
+        dimension (float)
+
+    Returns:
+        int: the dimension in steps of 1 / DIMENSION_SCALE, rounded
+
+    Example:
+        >>> quantize(6.1)
+        610
+    '''
+    return int(round(float(dimension) * DIMENSION_SCALE))
+
+
+def quantize_dims(dimensions):
+    '''
+    Args:
+        dimensions (Iterable[float]): the dimensions of an item or a box
+
+    Returns:
+        List[int, int, int]: quantized, sorted smallest to largest
+
+    Example:
+        >>> quantize_dims([10, 2.54, 6.1])
+        [254, 610, 1000]
+    '''
+    return sorted([int(round(float(dimension) * DIMENSION_SCALE))
+                   for dimension in dimensions])
+
+
+def unquantized_lower_bound(value):
+    '''
+    the smallest dimension that quantizes to at least value, to compare
+    dimensions that were never quantized, such as in a database query
+
+    Args:
+        value (int): a quantized dimension
+
+    Returns:
+        float
+
+    Example:
+        >>> unquantized_lower_bound(390)
+        3.895
+    '''
+    return (value - 0.5) / DIMENSION_SCALE
+
+
+def _dequantize(value, scale):
+    whole, remainder = divmod(value, scale)
+    # whole numbers go back as ints, the way they were most likely given
+    if remainder == 0:
+        return int(whole)
+    return float(value) / scale
+
+
+def dequantize(value):
+    '''
+    Args:
+        value (int): a quantized dimension
+
+    Returns:
+        int|float: the dimension in the units it was given in
+
+    Example:
+        >>> dequantize(390)
+        3.9
+        >>> dequantize(400)
+        4
+    '''
+    return _dequantize(value, DIMENSION_SCALE)
+
+
+def dequantize_volume(value):
+    '''
+    Args:
+        value (int): the volume of quantized dimensions
+
+    Returns:
+        int|float: the volume in the units the dimensions were given in
+    '''
+    return _dequantize(value, DIMENSION_SCALE ** 3)
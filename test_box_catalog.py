@@ -0,0 +1,145 @@
+from fulfillment_api.authentication.shipping_box import ShippingBox
+from fulfillment_api.box_packing.box_catalog import (box_catalog,
+                                                     query_useable_boxes,
+                                                     BoxCatalogCache)
+from fulfillment_api.box_packing.internal_helper import select_useable_boxes
+
+from testing.shotput_tests import BaseShotputTestCaseWithData
+from testing.test_data import require_data
+
+
+class BoxCatalogCacheTest(BaseShotputTestCaseWithData):
+
+    def setUp(self):
+        super(BoxCatalogCacheTest, self).setUp()
+        box_catalog.invalidate()
+
+    def make_box(self, name, dimensions, team_id=None, is_available=True):
+        width, height, length = dimensions
+        box = ShippingBox(name=name, description=name, width_cm=width,
+                          height_cm=height, length_cm=length, weight_g=100,
+                          total_cubic_cm=width * height * length,
+                          team_id=team_id, is_available=is_available)
+        self.session.add(box)
+        self.session.commit()
+        return box
+
+    def box_ids(self, catalog):
+        return [box.id for box in catalog.boxes]
+
+    @require_data(users='rect')
+    def test_boxes_of_team(self):
+        team_id = self.data.users['rect'].team_id
+        large = self.make_box('Catalog Large', [10, 20, 30], team_id)
+        small = self.make_box('Catalog Small', [3, 2, 1])
+        unavailable = self.make_box('Catalog Gone', [1, 1, 1],
+                                    is_available=False)
+        catalog = box_catalog.get(self.session, team_id)
+        ids = self.box_ids(catalog)
+        self.assertLess(ids.index(small.id), ids.index(large.id))
+        self.assertNotIn(unavailable.id, ids)
+        self.assertEqual(sorted(catalog.volumes), catalog.volumes)
+        self.assertEqual([1, 2, 3], list(catalog.dimensions[ids.index(
+            small.id)]))
+
+    @require_data(users='rect')
+    def test_query_useable_boxes(self):
+        team_id = self.data.users['rect'].team_id
+        large = self.make_box('Query Large', [10, 20, 30], team_id)
+        small = self.make_box('Query Small', [3, 2, 1])
+        unavailable = self.make_box('Query Gone', [1, 1, 1],
+                                    is_available=False)
+        boxes = query_useable_boxes(self.session, team_id).all()
+        self.assertIn(large, boxes)
+        self.assertNotIn(unavailable, boxes)
+        self.assertLess(boxes.index(small), boxes.index(large))
+        volumes = [box.total_cubic_cm for box in boxes]
+        self.assertEqual(sorted(volumes), volumes)
+
+    @require_data(users='rect')
+    def test_select_without_catalog(self):
+        '''
+        tests that the query selects the same boxes as the kept catalog
+        '''
+        user = self.data.users['rect']
+        self.make_box('Select Long', [1, 1, 40], user.team_id)
+        self.make_box('Select Flat', [30, 30, 2], user.team_id)
+        for min_box_dimensions in ([100, 100, 3000], [100, 1000, 1000]):
+            kept = select_useable_boxes(self.session, min_box_dimensions,
+                                        user.team)
+            read = select_useable_boxes(self.session, min_box_dimensions,
+                                        user.team, use_catalog=False)
+            # boxes of the same volume may come back in either order
+            self.assertEqual(sorted((box['box'].id, box['dimensions'])
+                                    for box in kept),
+                             sorted((box['box'].id, box['dimensions'])
+                                    for box in read))
+            self.assertTrue(kept)
+
+    @require_data(users='rect')
+    def test_session_left_alone(self):
+        '''
+        tests that the boxes the caller's session holds stay attached to it
+        '''
+        team_id = self.data.users['rect'].team_id
+        box = self.make_box('Catalog Kept', [2, 2, 2], team_id)
+        box = self.session.query(ShippingBox).get(box.id)
+        box_catalog.get(self.session, team_id)
+        self.assertIn(box, self.session)
+        self.assertEqual('Catalog Kept', box.name)
+
+    @require_data(users='rect')
+    def test_ttl(self):
+        team_id = self.data.users['rect'].team_id
+        catalog = BoxCatalogCache(ttl=60)
+        catalog.get(self.session, team_id)
+        catalog.get(self.session, team_id)
+        self.assertEqual({'hits': 1, 'misses': 1, 'teams': 1},
+                         catalog.info())
+        expired = BoxCatalogCache(ttl=-1)
+        expired.get(self.session, team_id)
+        expired.get(self.session, team_id)
+        self.assertEqual({'hits': 0, 'misses': 2, 'teams': 1},
+                         expired.info())
+
+    @require_data(users='rect')
+    def test_invalidated_on_change(self):
+        team_id = self.data.users['rect'].team_id
+        box_catalog.get(self.session, team_id)
+        box = self.make_box('Catalog New', [4, 4, 4], team_id)
+        self.assertIn(box.id, self.box_ids(box_catalog.get(self.session,
+                                                           team_id)))
+        box.is_available = False
+        self.session.commit()
+        self.assertNotIn(box.id, self.box_ids(box_catalog.get(self.session,
+                                                              team_id)))
+        box.is_available = True
+        self.session.commit()
+        self.assertIn(box.id, self.box_ids(box_catalog.get(self.session,
+                                                           team_id)))
+        box_id = box.id
+        self.session.delete(box)
+        self.session.commit()
+        self.assertNotIn(box_id, self.box_ids(box_catalog.get(self.session,
+                                                              team_id)))
+
+    @require_data(users='rect')
+    def test_changed_while_read(self):
+        '''
+        tests that boxes read while a box changed are returned but not kept
+        '''
+        team_id = self.data.users['rect'].team_id
+        catalog = BoxCatalogCache()
+        read = catalog.read
+
+        def read_while_changed(session, team_id):
+            boxes = read(session, team_id)
+            catalog.invalidate()
+            return boxes
+
+        catalog.read = read_while_changed
+        self.assertIsNotNone(catalog.get(self.session, team_id))
+        self.assertEqual(0, catalog.info()['teams'])
+        del catalog.read
+        catalog.get(self.session, team_id)
+        self.assertEqual(1, catalog.info()['teams'])
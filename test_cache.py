@@ -0,0 +1,184 @@
+from cache import fingerprint, LRUCache, ResultCache, SQLiteResultCache
+from time import sleep
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_dropped(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2},
+                         cache.info())
+
+    def test_resize(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache.put(key, key)
+        cache.resize(1)
+        self.assertEqual(1, len(cache))
+        self.assertEqual('c', cache.get('c'))
+
+    def test_clear(self):
+        cache = LRUCache(3)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual({'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 3},
+                         cache.info())
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = ResultCache(maxsize=2)
+        cache.put(1, 'a', {'packages': []})
+        self.assertEqual({'packages': []}, cache.get(1, 'a'))
+        self.assertEqual(None, cache.get(2, 'a'))
+        info = cache.info()
+        self.assertEqual(0.5, info['hit_rate'])
+        self.assertEqual(len('{"packages": []}'), info['bytes'])
+
+    def test_least_recently_used_dropped(self):
+        cache = ResultCache(maxsize=2)
+        cache.put(1, 'a', 1)
+        cache.put(1, 'b', 2)
+        cache.get(1, 'a')
+        cache.put(2, 'c', 3)
+        self.assertEqual(None, cache.get(1, 'b'))
+        self.assertEqual(1, cache.get(1, 'a'))
+
+    def test_max_bytes(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put(1, 'a', 'abcd')
+        cache.put(1, 'b', 'efgh')
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual('efgh', cache.get(1, 'b'))
+        cache.put(1, 'c', 'far too long to cache')
+        self.assertEqual(None, cache.get(1, 'c'))
+        self.assertEqual(6, cache.info()['bytes'])
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.01)
+        cache.put(1, 'a', 1)
+        sleep(0.02)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual(0, len(cache))
+
+    def test_flush_team(self):
+        cache = ResultCache()
+        cache.put(1, 'a', 1)
+        cache.put(2, 'a', 2)
+        cache.flush(1)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual(2, cache.get(2, 'a'))
+        cache.flush()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.info()['bytes'])
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint([{'b': 1, 'a': [1.5, 'x']}]),
+                         fingerprint([{'a': [1.5, u'x'], 'b': 1}]))
+        self.assertNotEqual(fingerprint([1, 2]), fingerprint([2, 1]))
+
+
+class SQLiteResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'packing.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        cache = SQLiteResultCache(self.path, 1)
+        cache.put(1, 'a', {'packages': [{'TEST': 2}]})
+        self.assertEqual({'packages': [{'TEST': 2}]}, cache.get(1, 'a'))
+        self.assertEqual(None, cache.get(2, 'a'))
+        info = cache.info()
+        self.assertEqual(0.5, info['hit_rate'])
+        self.assertEqual(1, info['size'])
+
+    def test_shared_between_caches(self):
+        '''
+        tests that an entry put by one process is found by another, and that
+        entries from another packing version are dropped
+        '''
+        SQLiteResultCache(self.path, 1).put(1, 'a', 1)
+        self.assertEqual(1, SQLiteResultCache(self.path, 1).get(1, 'a'))
+        cache = SQLiteResultCache(self.path, 2)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual(0, cache.info()['size'])
+
+    def test_max_bytes(self):
+        cache = SQLiteResultCache(self.path, 1, max_bytes=10)
+        cache.put(1, 'a', 'abcd')
+        cache.put(1, 'b', 'efgh')
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual('efgh', cache.get(1, 'b'))
+        cache.put(1, 'c', 'far too long to cache')
+        self.assertEqual(None, cache.get(1, 'c'))
+        self.assertEqual(6, cache.info()['bytes'])
+
+    def test_bytes_counted_when_needed(self):
+        '''
+        tests that the bytes in the file are only counted again once the
+        puts of this process may have taken it over max_bytes
+        '''
+        cache = SQLiteResultCache(self.path, 1, max_bytes=20)
+        counts = []
+        evict = cache._evict
+
+        def counted_evict(connection, now):
+            counts.append(now)
+            evict(connection, now)
+        cache._evict = counted_evict
+        for key in 'abcd':
+            cache.put(1, key, 'ab')
+        self.assertEqual(1, len(counts))
+        cache.put(1, 'e', 'abcdefgh')
+        self.assertEqual(2, len(counts))
+        self.assertEqual(18, cache.info()['bytes'])
+        self.assertEqual(None, cache.get(1, 'a'))
+
+    def test_opened_when_used(self):
+        cache = SQLiteResultCache(self.path, 1)
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+        cache.put(1, 'a', 1)
+        self.assertEqual(0o700, os.stat(os.path.dirname(self.path)).st_mode &
+                         0o777)
+
+    def test_ttl(self):
+        cache = SQLiteResultCache(self.path, 1, ttl=0.01)
+        cache.put(1, 'a', 1)
+        sleep(0.02)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual(0, cache.info()['size'])
+
+    def test_flush_team(self):
+        cache = SQLiteResultCache(self.path, 1)
+        cache.put(1, 'a', 1)
+        cache.put(2, 'a', 2)
+        cache.flush(1)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertEqual(2, cache.get(2, 'a'))
+        cache.flush()
+        self.assertEqual(0, cache.info()['size'])
+
+    def test_unwritable_path_misses(self):
+        path = os.path.join(self.directory, 'file')
+        open(path, 'w').close()
+        cache = SQLiteResultCache(os.path.join(path, 'packing.sqlite'), 1)
+        cache.put(1, 'a', 1)
+        self.assertEqual(None, cache.get(1, 'a'))
+        self.assertTrue(cache.info()['errors'] > 0)
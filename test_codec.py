@@ -0,0 +1,56 @@
+import codec
+import unittest
+
+
+ORDER = {
+    'boxes_info': [{'name': '4x4x8', 'width': 4, 'height': 4, 'length': 8.5,
+                    'weight': 0.1, 'weight_units': 'grams'}],
+    'products_info': [{'product_name': u'SKU-\xe9/1', 'quantity': 3}]
+}
+
+
+class JsonTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(ORDER, codec.loads(codec.dumps(ORDER)))
+        self.assertEqual(ORDER, codec.loads(codec.dumps(ORDER),
+                                            'text/plain'))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            codec.loads('{"boxes_info": [')
+
+
+class WithoutMsgpackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.msgpack = codec.msgpack
+        codec.msgpack = None
+
+    def tearDown(self):
+        codec.msgpack = self.msgpack
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            codec.loads('\x80', codec.MSGPACK_MIMETYPE)
+
+
+@unittest.skipIf(codec.msgpack is None, 'msgpack is not installed')
+class MsgpackTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        self.assertIn(codec.MSGPACK_MIMETYPE, codec.MIMETYPES)
+        data = codec.dumps(ORDER, codec.MSGPACK_MIMETYPE)
+        self.assertEqual(ORDER, codec.loads(data, codec.MSGPACK_MIMETYPE))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            codec.loads('\xc1', codec.MSGPACK_MIMETYPE)
+
+    def test_strings(self):
+        '''
+        tests that str keys and values are packed as msgpack str, not bin
+        '''
+        data = codec.dumps({'packages': [{'box': 'Box-1'}]},
+                           codec.MSGPACK_MIMETYPE)
+        self.assertEqual('\x81\xa8packages\x91\x81\xa3box\xa5Box-1', data)
@@ -0,0 +1,160 @@
+from core import (api_packing_algorithm, compact_parcels, dim_to_cm,
+                  make_packing_cache, mass_to_g, normalize_boxes,
+                  normalize_items, pre_pack_boxes, set_packing_cache)
+from errors import BoxError
+import os
+import subprocess
+import sys
+import unittest
+
+
+def setUpModule():
+    set_packing_cache(make_packing_cache('memory'))
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_no_application_imported(self):
+        '''
+        tests that core imports none of flask, sqlalchemy or fulfillment_api
+        '''
+        imported = subprocess.check_output(
+            [sys.executable, '-c',
+             'import core, sys; print sorted(name for name in sys.modules '
+             'if name.split(".")[0] in '
+             '("flask", "sqlalchemy", "fulfillment_api"))'],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual('[]', imported.strip())
+
+
+class UnitsTest(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(25.4, dim_to_cm('10', 'inches'))
+        self.assertEqual(100, dim_to_cm(1, 'meters'))
+        self.assertEqual(2000, mass_to_g(2, 'kilograms'))
+        self.assertAlmostEqual(453.59237, mass_to_g(1, 'pounds'))
+
+    def test_unknown_unit(self):
+        with self.assertRaises(ValueError) as context:
+            dim_to_cm(1, 'furlongs')
+        self.assertEqual('Unknown unit furlongs', context.exception.message)
+
+
+class ApiPackingAlgorithmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.boxes_info = [{
+            'name': 'Small', 'width': 2, 'height': 2, 'length': 2,
+            'weight': 100, 'dimension_units': 'inches', 'weight_units': 'grams'
+        }, {
+            'name': 'Large', 'width': 10, 'height': 10, 'length': 10,
+            'weight': 1, 'dimension_units': 'inches',
+            'weight_units': 'pounds'
+        }]
+        self.items_info = [{
+            'product_name': 'Item1', 'width': 5, 'height': 5, 'length': 5,
+            'weight': 200, 'weight_units': 'grams', 'quantity': 2
+        }]
+
+    def test_pack(self):
+        packing = api_packing_algorithm(self.boxes_info, self.items_info,
+                                        {'use_cache': False})
+        self.assertEqual([{
+            'packed_products': {'Item1': 2},
+            'total_weight': 400 + 453.59237,
+            'box': self.boxes_info[1]
+        }], packing['packages'])
+
+    def test_request_unchanged(self):
+        '''
+        tests that the dimensions of products are converted like those of
+        boxes, and that the dicts of the request are left as they were
+        '''
+        items_info = [dict(self.items_info[0], width=2, height=2, length=2,
+                           dimension_units='inches')]
+        given = [dict(item) for item in items_info]
+        packing = api_packing_algorithm(self.boxes_info[:1], items_info,
+                                        {'use_cache': False})
+        self.assertEqual(2, len(packing['packages']))
+        parcels = pre_pack_boxes(self.boxes_info[1], items_info,
+                                 {'use_cache': False})
+        self.assertEqual([{'Item1': 2}],
+                         [parcel['packed_products'] for parcel in parcels])
+        self.assertAlmostEqual(400 + 453.59237, parcels[0]['total_weight'])
+        self.assertEqual(given, items_info)
+
+    def test_normalized_records(self):
+        '''
+        tests that the normalized boxes and products hold tuples, and that
+        changing a request or an answer leaves the catalog as it was
+        '''
+        catalog = normalize_boxes(self.boxes_info)
+        self.assertEqual((508, 508, 508), catalog.by_name['Small'].dimensions)
+        items = normalize_items(self.items_info)
+        self.assertEqual((500, 500, 500), items[0].item.dimensions)
+        packing = api_packing_algorithm(self.boxes_info, self.items_info,
+                                        {'use_cache': False})
+        box = packing['packages'][0]['box']
+        self.assertIsNot(self.boxes_info[1], box)
+        box['name'] = 'Changed'
+        self.boxes_info[1]['weight'] = 2
+        self.assertEqual('Large',
+                         dict(catalog.by_name['Large'].info)['name'])
+        self.assertEqual(1, dict(catalog.by_name['Large'].info)['weight'])
+
+    def test_core_errors(self):
+        with self.assertRaises(BoxError):
+            api_packing_algorithm(self.boxes_info[:1], [
+                dict(self.items_info[0], width=20)], {})
+        with self.assertRaises(BoxError):
+            pre_pack_boxes(self.boxes_info[0], [
+                dict(self.items_info[0], width=20, dimension_units='inches')],
+                {})
+
+
+class CompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.box_info = {
+            'name': 'Cube', 'width': 2, 'height': 2, 'length': 2,
+            'weight': 100, 'weight_units': 'grams'
+        }
+        self.items_info = [{
+            'product_name': 'Item1', 'width': 1, 'height': 1, 'length': 1,
+            'weight': 10, 'weight_units': 'grams', 'quantity': 25
+        }]
+
+    def test_compact_parcels(self):
+        parcels = [{'packed_products': {'A': 2}, 'total_weight': 20}] * 3
+        parcels.append({'packed_products': {'A': 1}, 'total_weight': 10})
+        self.assertEqual([
+            {'count': 3, 'packed_products': {'A': 2}, 'total_weight': 20},
+            {'count': 1, 'packed_products': {'A': 1}, 'total_weight': 10}
+        ], compact_parcels(parcels))
+
+    def test_pre_pack_boxes(self):
+        options = {'use_cache': False}
+        parcels = pre_pack_boxes(self.box_info, self.items_info, options)
+        self.assertEqual([
+            {'count': 3, 'packed_products': {'Item1': 8}, 'total_weight': 180},
+            {'count': 1, 'packed_products': {'Item1': 1}, 'total_weight': 110}
+        ], pre_pack_boxes(self.box_info, self.items_info,
+                          dict(options, compact=True)))
+        self.assertEqual(parcels, [
+            {'packed_products': run['packed_products'],
+             'total_weight': run['total_weight']}
+            for run in pre_pack_boxes(self.box_info, self.items_info,
+                                      dict(options, compact=True))
+            for _ in xrange(run['count'])])
+
+    def test_api_packing_algorithm(self):
+        packing = api_packing_algorithm([self.box_info], self.items_info,
+                                        {'compact': True})
+        self.assertEqual([self.box_info], packing['boxes'])
+        self.assertEqual([
+            {'count': 3, 'packed_products': {'Item1': 8}, 'total_weight': 180,
+             'box': 'Cube'},
+            {'count': 1, 'packed_products': {'Item1': 1}, 'total_weight': 110,
+             'box': 'Cube'}
+        ], packing['packages'])
@@ -0,0 +1,74 @@
+from packing_algorithm import does_it_fit
+import fit_matrix
+
+from random import Random
+import unittest
+
+
+def random_dims(random, num_dims):
+    return [sorted(random.randint(1, 10) for _ in xrange(3))
+            for _ in xrange(num_dims)]
+
+
+class ScalarFitMatrixTest(unittest.TestCase):
+    '''
+    tests the checks made without NumPy
+    '''
+
+    def setUp(self):
+        self.numpy = fit_matrix.numpy
+        fit_matrix.numpy = None
+
+    def tearDown(self):
+        fit_matrix.numpy = self.numpy
+
+    def test_fit_matrix(self):
+        self.assertEqual([[True, True], [False, False]],
+                         fit_matrix.fit_matrix([[1, 1, 1], [2, 2, 5]],
+                                               [[2, 2, 2], [3, 3, 3]]))
+
+    def test_fits_into(self):
+        self.assertEqual([False, True],
+                         fit_matrix.fits_into([2, 2, 5],
+                                              [[2, 2, 2], [3, 3, 6]]))
+
+    def test_anything_fits(self):
+        self.assertTrue(fit_matrix.anything_fits([[1, 1, 6], [2, 2, 5]],
+                                                 [3, 3, 5]))
+        self.assertFalse(fit_matrix.anything_fits([[1, 1, 6], [2, 2, 5]],
+                                                  [3, 3, 4]))
+
+    def test_dims_array(self):
+        dims = [[1, 2, 3]] * fit_matrix.MIN_ARRAY_SIZE
+        self.assertIs(dims, fit_matrix.dims_array(dims))
+
+
+@unittest.skipIf(fit_matrix.numpy is None, 'NumPy is not installed')
+class NumpyFitMatrixTest(unittest.TestCase):
+    '''
+    tests that the checks made with NumPy agree with does_it_fit
+    '''
+
+    def setUp(self):
+        random = Random(0)
+        self.items = random_dims(random, 100)
+        self.boxes = random_dims(random, 50)
+
+    def test_fit_matrix(self):
+        matrix = fit_matrix.fit_matrix(self.items, self.boxes)
+        self.assertEqual((100, 50), matrix.shape)
+        self.assertEqual([[does_it_fit(item, box) for box in self.boxes]
+                          for item in self.items], matrix.tolist())
+
+    def test_fits_into(self):
+        for item in self.items:
+            self.assertEqual([does_it_fit(item, box) for box in self.boxes],
+                             fit_matrix.fits_into(item, self.boxes))
+
+    def test_anything_fits(self):
+        items = fit_matrix.dims_array(self.items)
+        self.assertIsInstance(items, fit_matrix.numpy.ndarray)
+        for box in self.boxes:
+            self.assertEqual(
+                any(does_it_fit(item, box) for item in self.items),
+                fit_matrix.anything_fits(items, box))
@@ -1,12 +1,24 @@
+from fulfillment_api.box_packing import core
 from fulfillment_api.box_packing.helper import (space_after_packing,
-    how_many_items_fit, pre_pack_boxes,
-    api_packing_algorithm)
-from fulfillment_api.errors import BoxError
+    how_many_items_fit, pre_pack_boxes, make_packing_cache,
+    set_packing_cache, api_packing_algorithm, batch_packing_algorithm,
+    stream_packing_algorithm, normalize_boxes, _raise_api_errors,
+    MIN_POOL_ORDERS)
+from fulfillment_api.box_packing.boxes import Box
+from fulfillment_api.box_packing.errors import UnpackableItemsError
+from fulfillment_api.errors import APIError, BoxError
+import fulfillment_api.messages as msg
 
 from collections import Counter
+import json
 from testing.shotput_tests import BaseShotputTestCase
 
 
+def setUpModule():
+    # packings cached on disk by an earlier run could answer these tests
+    set_packing_cache(make_packing_cache('memory'))
+
+
 class HowManyItemsFitTest(BaseShotputTestCase):
     def test_exact_fit(self):
         box_info = {
@@ -115,6 +127,27 @@ class SpaceAfterPackingTest(BaseShotputTestCase):
                 {'width': 2, 'height': 4, 'length': 4}]
         }, response)
 
+    def test_decimal_dimensions(self):
+        '''
+        tests that decimal dimensions leave exact blocks, without float error
+        '''
+        box_info = {
+            'height': 1,
+            'width': 1,
+            'length': 10
+        }
+        item_info = {
+            'height': 1,
+            'width': 1,
+            'length': 6.1
+        }
+        response = space_after_packing(item_info, box_info)
+        self.assertEqual({
+            'remaining_volume': 3.9,
+            'remaining_dimensional_blocks': [
+                {'width': 1, 'height': 1, 'length': 3.9}]
+        }, response)
+
 
 class PrePackBoxesTest(BaseShotputTestCase):
 
@@ -184,6 +217,28 @@ class PrePackBoxesTest(BaseShotputTestCase):
             }
         ], response)
 
+    def test_pre_pack_boxes_sku_too_heavy(self):
+        items_info = [dict(CUBE_SKU, weight=9000)]
+        with self.assertRaises(APIError) as context:
+            pre_pack_boxes(CUBE_BOX, items_info, {'max_weight': 8999})
+        self.assertEqual('TEST', context.exception.item_number)
+
+    def test_unpackable_items(self):
+        '''
+        tests that the items an error of the packing names are kept on the
+        error of fulfillment_api raised for it
+        '''
+        @_raise_api_errors
+        def pack():
+            raise UnpackableItemsError(['TEST'], [2, 2, 2])
+
+        with self.assertRaises(BoxError) as context:
+            pack()
+        self.assertEqual(['TEST'], context.exception.item_numbers)
+        self.assertEqual([2, 2, 2], context.exception.box_dimensions)
+        self.assertEqual('Items do not fit in a 2x2x2 box: TEST',
+                         context.exception.message)
+
 
 LONG_BOX = {
     'width': 4,
@@ -300,6 +355,9 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
         items_info = [item]
         packed_products = api_packing_algorithm(boxes_info, items_info, None)
         expected_return = {
+            'boxes_pruned': 0,
+            'boxes_evaluated': 1,
+            'timed_out': False,
             'packages': [{
                 'box': self.boxes['4x4x8'],
                 'packed_products': {'TEST': 2},
@@ -315,6 +373,9 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
         items_info = [item]
         packed_products = api_packing_algorithm(boxes_info, items_info, None)
         expected_return = {
+            'boxes_pruned': 1,
+            'boxes_evaluated': 1,
+            'timed_out': False,
             'packages': [{
                 'box': self.boxes['4x4x8'],
                 'packed_products': {'TEST': 2},
@@ -331,6 +392,9 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
 
         packed_products = api_packing_algorithm(boxes_info, items_info, None)
         expected_return = {
+            'boxes_pruned': 1,
+            'boxes_evaluated': 1,
+            'timed_out': False,
             'packages': [
                 {
                     'packed_products': {'TEST': 2},
@@ -366,6 +430,9 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
         options = {'max_weight': 200}
 
         expected_return = {
+            'boxes_pruned': 0,
+            'boxes_evaluated': 2,
+            'timed_out': False,
             'packages': [
                 {
                     'box': self.boxes['4x4x4'],
@@ -382,6 +449,49 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
         packed_products = api_packing_algorithm(boxes_info, items_info, options)
         self.assertEqual(expected_return, packed_products)
 
+    def test_api_packing_algorithm_cached(self):
+        '''
+        tests that the same order is answered from the cache the second time,
+        with the boxes of the request it was asked in
+        '''
+        packing_cache = make_packing_cache('memory')
+        self.addCleanup(set_packing_cache, core.packing_cache)
+        set_packing_cache(packing_cache)
+        item = dict(self.items['4x4x4'], quantity=3)
+        long_box = dict(self.boxes['4x4x8'], description='first request')
+        packed_products = api_packing_algorithm([long_box], [item], None)
+        self.assertEqual(1, packing_cache.info()['misses'])
+        long_box = dict(self.boxes['4x4x8'])
+        cached_products = api_packing_algorithm([long_box], [item],
+                                                {'use_cache': True})
+        self.assertEqual(1, packing_cache.info()['hits'])
+        self.assertEqual(long_box, cached_products['packages'][0]['box'])
+        self.assertEqual(packed_products['packages'][0]['packed_products'],
+                         cached_products['packages'][0]['packed_products'])
+
+    def test_api_packing_algorithm_deadline(self):
+        '''
+        tests that the best box so far is returned once the deadline passes,
+        and is not cached
+        '''
+        packing_cache = make_packing_cache('memory')
+        self.addCleanup(set_packing_cache, core.packing_cache)
+        set_packing_cache(packing_cache)
+        item = dict(self.items['4x4x4'], quantity=1)
+        boxes_info = [self.boxes['4x4x4'], self.boxes['4x4x8']]
+        # the deadline has already passed, only the first box is packed
+        packed_products = api_packing_algorithm(boxes_info, [item],
+                                                {'deadline_ms': -1})
+        self.assertTrue(packed_products['timed_out'])
+        self.assertEqual(1, packed_products['boxes_evaluated'])
+        self.assertEqual(self.boxes['4x4x8'],
+                         packed_products['packages'][0]['box'])
+        self.assertEqual(0, packing_cache.info()['size'])
+        packed_products = api_packing_algorithm(boxes_info, [item], None)
+        self.assertFalse(packed_products['timed_out'])
+        self.assertEqual(self.boxes['4x4x4'],
+                         packed_products['packages'][0]['box'])
+
     def test_api_packing_non_unique(self):
         boxes_info = [self.boxes['4x4x4'], self.boxes['4x4x4']]
         item = self.items['4x4x4']
@@ -392,3 +502,175 @@ class ApiPackingAlgorithmTest(BaseShotputTestCase):
             api_packing_algorithm(boxes_info, items_info, None)
         self.assertEqual('Please use unique boxes with unique names',
                          context.exception.message)
+
+    def test_normalize_boxes(self):
+        '''
+        tests that the boxes of a request are packed as plain Boxes, in
+        centimeters and grams
+        '''
+        catalog = normalize_boxes([dict(LONG_BOX, dimension_units='inches',
+                                        weight_units='kilograms')])
+        box = catalog.boxes[0].box
+        self.assertIs(catalog.boxes[0], catalog.by_name['4x4x8'])
+        self.assertIsInstance(box, Box)
+        self.assertEqual(Box('4x4x8', '', 10.16, 10.16, 20.32, 4000.0,
+                             10.16 * 10.16 * 20.32, None), box)
+        self.assertEqual(hash(box), hash(Box.from_dimensions(
+            '4x4x8', [10.16, 10.16, 20.32], 4000.0)))
+
+
+class BatchPackingAlgorithmTest(BaseShotputTestCase):
+
+    def test_batch_packing_algorithm(self):
+        '''
+        tests that every order is answered in order, and that an order which
+        cannot be packed does not stop the others
+        '''
+        boxes_info = [CUBE_BOX, LONG_BOX]
+        orders = [
+            {'order_id': 'A', 'products_info': [dict(CUBE_SKU, quantity=2)]},
+            {'order_id': 'B', 'products_info': [dict(CUBE_SKU, quantity=3)],
+             'options': {'max_weight': 50}},
+            {'order_id': 'C', 'products_info': [{'product_name': 'TEST'}]}
+        ]
+        results = batch_packing_algorithm(boxes_info, orders,
+                                          {'use_cache': False})
+        self.assertEqual(['A', 'B', 'C'],
+                         [result['order_id'] for result in results])
+        expected = api_packing_algorithm(boxes_info,
+                                         [dict(CUBE_SKU, quantity=2)], None)
+        self.assertEqual(expected['packages'], results[0]['packages'])
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[2])
+
+    def test_batch_packing_malformed(self):
+        '''
+        tests that an order whose products are not dicts gets an error of its
+        own, in the pool as well
+        '''
+        orders = [{'order_id': i, 'products_info': [dict(CUBE_SKU)]}
+                  for i in xrange(MIN_POOL_ORDERS)]
+        orders[1]['products_info'] = ['x']
+        orders[2]['products_info'] = [dict(CUBE_SKU, width=[1])]
+        for parallel in (False, True):
+            results = batch_packing_algorithm(
+                [CUBE_BOX], orders, {'use_cache': False,
+                                     'parallel': parallel})
+            self.assertIn('packages', results[0])
+            self.assertEqual({'order_id': 1, 'error': msg.invalid_data},
+                             results[1])
+            self.assertIn('error', results[2])
+            self.assertIn('packages', results[3])
+
+    def test_batch_packing_missing_values(self):
+        '''
+        tests that an order without products_info or order_id, or that is
+        not a dict, gets an error of its own
+        '''
+        orders = [{'order_id': 'A', 'products_info': [dict(CUBE_SKU)]},
+                  {'order_id': 'B'},
+                  {'products_info': [dict(CUBE_SKU)]},
+                  'C']
+        results = batch_packing_algorithm([CUBE_BOX], orders,
+                                          {'use_cache': False})
+        self.assertIn('packages', results[0])
+        self.assertEqual([
+            {'order_id': 'B',
+             'error': msg.missing_value_for('products_info')},
+            {'order_id': None, 'error': msg.missing_value_for('order_id')},
+            {'order_id': None, 'error': msg.invalid_data}
+        ], results[1:])
+
+    def test_batch_packing_algorithm_pool(self):
+        boxes_info = [CUBE_BOX, LONG_BOX]
+        orders = [{'order_id': i,
+                   'products_info': [dict(CUBE_SKU, quantity=i + 1)]}
+                  for i in xrange(MIN_POOL_ORDERS)]
+        results = batch_packing_algorithm(boxes_info, orders,
+                                          {'use_cache': False,
+                                           'parallel': True})
+        for order, result in zip(orders, results):
+            expected = api_packing_algorithm(boxes_info,
+                                             order['products_info'], None)
+            expected['order_id'] = order['order_id']
+            self.assertEqual(expected, result)
+
+    def test_batch_packing_non_unique(self):
+        orders = [{'order_id': 'A', 'products_info': []}] * 2
+        with self.assertRaises(BoxError) as context:
+            batch_packing_algorithm([CUBE_BOX], orders, None)
+        self.assertEqual('Please use unique order ids',
+                         context.exception.message)
+
+
+class StreamPackingAlgorithmTest(BaseShotputTestCase):
+
+    def test_stream_packing_algorithm(self):
+        '''
+        tests that orders are packed one line at a time, with an error line
+        for each line that is not an order
+        '''
+        orders = [
+            {'order_id': 'A', 'products_info': [dict(CUBE_SKU, quantity=2)]},
+            {'order_id': 'B', 'products_info': [dict(CUBE_SKU, quantity=3)],
+             'options': {'max_weight': 50}},
+            {'products_info': []}
+        ]
+        lines = ([json.dumps({'boxes_info': [CUBE_BOX, LONG_BOX],
+                              'options': {'use_cache': False}}), '']
+                 + [json.dumps(order) for order in orders] + ['{not json'])
+        read = []
+
+        def stream():
+            for line in lines:
+                read.append(line)
+                yield line + '\n'
+
+        results = stream_packing_algorithm(stream())
+        self.assertEqual(1, len(read))
+        first = json.loads(next(results))
+        self.assertEqual(3, len(read))
+        expected = api_packing_algorithm([CUBE_BOX, LONG_BOX],
+                                         [dict(CUBE_SKU, quantity=2)], None)
+        expected['order_id'] = 'A'
+        self.assertEqual(json.loads(json.dumps(expected)), first)
+        results = [json.loads(line) for line in results]
+        self.assertEqual('B', results[0]['order_id'])
+        self.assertIn('error', results[0])
+        self.assertEqual({'line': 5, 'error': 'missing order_id'}, results[1])
+        self.assertEqual(6, results[2]['line'])
+
+    def test_stream_packing_malformed(self):
+        lines = [json.dumps({'boxes_info': [CUBE_BOX]}),
+                 json.dumps({'order_id': 'A', 'products_info': ['x']}),
+                 json.dumps({'order_id': 'B',
+                             'products_info': [dict(CUBE_SKU)],
+                             'options': {'use_cache': False}})]
+        results = [json.loads(line)
+                   for line in stream_packing_algorithm(iter(lines))]
+        self.assertEqual({'order_id': 'A', 'error': msg.invalid_data},
+                         results[0])
+        self.assertEqual('B', results[1]['order_id'])
+        self.assertIn('packages', results[1])
+
+    def test_stream_packing_default_options(self):
+        '''
+        tests that the default options apply to every order, unless the
+        first line gives the same option
+        '''
+        order = json.dumps({'order_id': 'A',
+                            'products_info': [dict(CUBE_SKU, quantity=2)]})
+        default_options = {'use_cache': False, 'max_weight': 50}
+        results = stream_packing_algorithm(
+            iter([json.dumps({'boxes_info': [CUBE_BOX]}), order]),
+            default_options=default_options)
+        self.assertIn('error', json.loads(next(results)))
+        results = stream_packing_algorithm(
+            iter([json.dumps({'boxes_info': [CUBE_BOX],
+                              'options': {'max_weight': 1000}}), order]),
+            default_options=default_options)
+        self.assertIn('packages', json.loads(next(results)))
+
+    def test_stream_packing_no_boxes(self):
+        with self.assertRaises(KeyError):
+            stream_packing_algorithm(iter([]))
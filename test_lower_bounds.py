@@ -0,0 +1,27 @@
+from lower_bounds import (large_item_bound, parcel_lower_bound, volume_bound,
+    weight_bound)
+from packing_algorithm import ItemGroup, ItemTuple
+import unittest
+
+
+class LowerBoundsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [ItemGroup(ItemTuple('Item1', [2, 2, 2], 100), 9),
+                      ItemGroup(ItemTuple('Item2', [1, 3, 5], 250), 2)]
+
+    def test_volume_bound(self):
+        self.assertEqual(2, volume_bound(self.items, [4, 4, 6]))
+        self.assertEqual(1, volume_bound(self.items, [6, 6, 6]))
+
+    def test_weight_bound(self):
+        self.assertEqual(3, weight_bound(self.items, 200, 800))
+        self.assertEqual(0, weight_bound(self.items, 800, 800))
+
+    def test_large_item_bound(self):
+        self.assertEqual(2, large_item_bound(self.items, [2, 2, 6]))
+        self.assertEqual(0, large_item_bound(self.items, [3, 3, 5]))
+
+    def test_parcel_lower_bound(self):
+        self.assertEqual(4, parcel_lower_bound(self.items, [3, 3, 3], 100,
+                                               800))
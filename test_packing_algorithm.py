@@ -1,7 +1,11 @@
 from collections import namedtuple
-from packing_algorithm import (does_it_fit,
-    best_fit, pack_boxes, ItemTuple, Packaging, setup_packages)
-from errors import BoxError
+from packing_algorithm import (does_it_fit, group_items,
+    best_fit, best_fit_cache, cached_best_fit, pack_box, pack_boxes,
+    packing_algorithm, DimensionFrontier, ItemGroup, ItemPool, ItemTuple,
+    Packaging, Parcel, setup_packages)
+from errors import APIError, BoxError, UnpackableItemsError
+from time import time
+import pickle
 import unittest
 
 
@@ -60,6 +64,30 @@ class BoxSelectionAlgorithmTest(unittest.TestCase):
         remaining_space = best_fit(item_dims, box_dims)
         self.assertEqual(remaining_space, [[7, 13, 31], [7, 20, 31]])
 
+    def test_best_fit_stacked_twice(self):
+        '''
+        assert that a box long enough for two of the item leaves the upper
+        layer as a block, with the blocks sorted by volume
+        '''
+        remaining_space = best_fit([5, 5, 5], [10, 10, 10])
+        self.assertEqual(remaining_space,
+                         [[5, 5, 5], [5, 5, 10], [5, 10, 10]])
+
+    def test_cached_best_fit(self):
+        '''
+        assert that the cached best fit gives the same blocks as tuples, and
+        answers repeated calls from the cache
+        '''
+        best_fit_cache.clear()
+        item_dims = [13, 13, 31]
+        box_dims = [20, 20, 31]
+
+        remaining_space = cached_best_fit(item_dims, box_dims)
+        self.assertEqual(((7, 13, 31), (7, 20, 31)), remaining_space)
+        self.assertIs(remaining_space, cached_best_fit(item_dims, box_dims))
+        self.assertEqual(1, best_fit_cache.hits)
+        self.assertEqual(1, best_fit_cache.misses)
+
     def test_pack_boxes_one_item(self):
         '''
         test exact fit one item
@@ -261,6 +289,133 @@ class BoxSelectionAlgorithmTest(unittest.TestCase):
         self.assertEqual(2, len(packed_items))
         self.assertEqual(2, len(packed_items[0]))
 
+    def test_pack_boxes_item_groups(self):
+        '''
+        tests that grouped items pack the same as the individual units
+        '''
+        item = ItemTuple('Item1', [1, 3, 3], 0)
+        box_dims = [9, 9, 9]
+        packed_items = pack_boxes(box_dims, [ItemGroup(item, 82)])
+        self.assertEqual(pack_boxes(box_dims, [item] * 82), packed_items)
+        self.assertEqual([[item] * 81, [item]], packed_items)
+
+    def test_group_items(self):
+        '''
+        tests that runs of identical items are collapsed into one group
+        '''
+        item1 = ItemTuple('Item1', [1, 2, 3], 0)
+        item2 = ItemTuple('Item2', [1, 2, 3], 0)
+        grouped = group_items([item1, item1, ItemGroup(item1, 3), item2,
+                               ItemGroup(item2, 0), item1])
+        self.assertEqual([ItemGroup(item1, 5), ItemGroup(item2, 1),
+                          ItemGroup(item1, 1)], grouped)
+
+
+class ItemPoolTest(unittest.TestCase):
+
+    def test_first_fit_in_packing_order(self):
+        '''
+        tests that the first item that fits is found, not just any item
+        '''
+        big = ItemTuple('Big', [5, 5, 10], 0)
+        medium = ItemTuple('Medium', [2, 5, 6], 0)
+        small = ItemTuple('Small', [1, 1, 6], 0)
+        pool = ItemPool([big, medium, ItemGroup(small, 2)])
+        self.assertEqual(0, pool.first_fit([5, 5, 10]))
+        self.assertEqual(1, pool.first_fit([3, 5, 6]))
+        self.assertEqual(2, pool.first_fit([1, 4, 6]))
+        self.assertEqual(None, pool.first_fit([1, 1, 5]))
+
+    def test_first_fit_max_weight(self):
+        '''
+        tests that items heavier than max_weight are passed over
+        '''
+        heavy = ItemTuple('Heavy', [2, 5, 6], 50)
+        light = ItemTuple('Light', [1, 1, 6], 10)
+        pool = ItemPool([heavy, light])
+        self.assertEqual(10, pool.lightest())
+        self.assertEqual(0, pool.first_fit([5, 5, 10], 50))
+        self.assertEqual(1, pool.first_fit([5, 5, 10], 49))
+        self.assertEqual(None, pool.first_fit([5, 5, 10], 9))
+        pool.take(1)
+        self.assertEqual(50, pool.lightest())
+
+    def test_take(self):
+        '''
+        tests that taken items are no longer found once none are left
+        '''
+        medium = ItemTuple('Medium', [2, 5, 6], 0)
+        small = ItemTuple('Small', [1, 1, 6], 0)
+        pool = ItemPool([ItemGroup(medium, 2), small])
+        self.assertEqual(3, len(pool))
+        self.assertEqual(medium, pool.take(0))
+        self.assertEqual(0, pool.first_fit([2, 5, 6]))
+        pool.take(0)
+        self.assertEqual(1, pool.first_fit([2, 5, 6]))
+        self.assertEqual(1, len(pool))
+        self.assertEqual([ItemGroup(small, 1)], pool.items())
+        pool.take(1)
+        self.assertEqual(None, pool.first_fit([2, 5, 6]))
+        self.assertEqual(0, len(pool))
+
+
+class ParcelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.item1 = ItemTuple('Item1', [1, 1, 1], 10)
+        self.item2 = ItemTuple('Item2', [1, 1, 2], 25)
+        self.parcel = Parcel([self.item1, self.item2], [1, 0, 1])
+
+    def test_parcel_items(self):
+        '''
+        tests that a parcel reads back as the list of its items
+        '''
+        self.parcel.add(0)
+        self.assertEqual([self.item2, self.item1, self.item2, self.item1],
+                         self.parcel)
+        self.assertEqual(4, len(self.parcel))
+        self.assertEqual(self.item1, self.parcel[-1])
+        self.assertEqual([self.item1, self.item2], self.parcel[1:3])
+
+    def test_parcel_quantities(self):
+        self.assertEqual([(self.item1, 1), (self.item2, 2)],
+                         self.parcel.quantities())
+        self.assertEqual(60, self.parcel.weight())
+
+    def test_parcel_pickle(self):
+        self.assertEqual(self.parcel,
+                         pickle.loads(pickle.dumps(self.parcel)))
+        self.assertEqual(self.parcel,
+                         pickle.loads(pickle.dumps(self.parcel, 2)))
+
+
+class DimensionFrontierTest(unittest.TestCase):
+
+    def test_frontier_minimal_dimensions(self):
+        '''
+        tests that only items nothing else is smaller than are kept
+        '''
+        frontier = DimensionFrontier([[1, 2, 3], [2, 2, 3], [1, 1, 4],
+                                      [1, 2, 3], [3, 3, 3]])
+        self.assertEqual(set([(1, 2, 3), (1, 1, 4)]), frontier.frontier)
+        self.assertTrue(frontier.something_fits([1, 3, 3]))
+        self.assertFalse(frontier.something_fits([1, 1, 3]))
+
+    def test_frontier_remove(self):
+        '''
+        tests that removing the last item of a shape uncovers the items it
+        was smaller than
+        '''
+        frontier = DimensionFrontier([[1, 2, 3], [2, 2, 3], [1, 2, 3],
+                                      [3, 3, 3], [2, 3, 3]])
+        frontier.remove([1, 2, 3])
+        self.assertEqual(set([(1, 2, 3)]), frontier.frontier)
+        frontier.remove([1, 2, 3])
+        self.assertEqual(set([(2, 2, 3)]), frontier.frontier)
+        self.assertFalse(frontier.something_fits([1, 3, 3]))
+        frontier.remove([2, 2, 3])
+        self.assertEqual(set([(2, 3, 3)]), frontier.frontier)
+
 
 class SetupBoxDictionaryTest(unittest.TestCase):
 
@@ -348,3 +503,130 @@ class SetupBoxDictionaryTest(unittest.TestCase):
             setup_packages({})
         self.assertEqual('There are no packed boxes available to return.',
                          context.exception.message)
+
+
+class PackingAlgorithmTest(unittest.TestCase):
+
+    def make_boxes(self, sizes):
+        TestBox = namedtuple('TestBox', 'name, weight_g, total_cubic_cm')
+        return [{
+            'box': TestBox('{}x{}x{}'.format(*dimensions), 10,
+                           dimensions[0] * dimensions[1] * dimensions[2]),
+            'dimensions': dimensions
+        } for dimensions in sizes]
+
+    def test_pack_boxes_max_parcels(self):
+        '''
+        tests that packing gives up once it needs more parcels than allowed
+        '''
+        item = ItemTuple('Item1', [4, 4, 12], 0)
+        self.assertEqual(None, pack_boxes([4, 4, 12], [item] * 3, 2))
+        self.assertEqual([[item]] * 3, pack_boxes([4, 4, 12], [item] * 3, 3))
+
+    def test_packing_algorithm_prunes_boxes(self):
+        '''
+        tests that boxes which cannot need fewer parcels are skipped, and the
+        best box is the same as packing every box
+        '''
+        items = [ItemGroup(ItemTuple('Item2', [1, 2, 3], 50), 4),
+                 ItemGroup(ItemTuple('Item1', [2, 2, 2], 100), 16)]
+        useable_boxes = self.make_boxes([[2, 2, 3], [3, 3, 3], [2, 4, 4],
+                                         [4, 4, 4], [4, 4, 8]])
+        box_dictionary = packing_algorithm(items, useable_boxes, 31710)
+        packed_boxes = dict(
+            (box_dict['box'],
+             pack_box(box_dict['dimensions'], 10, items, 31710))
+            for box_dict in useable_boxes)
+        self.assertEqual(setup_packages(packed_boxes),
+                         box_dictionary['package']._replace(last_parcel=None))
+        self.assertEqual(4, box_dictionary['boxes_pruned'])
+        self.assertEqual(5, box_dictionary['boxes_pruned'] +
+                         box_dictionary['boxes_evaluated'])
+        self.assertFalse(box_dictionary['timed_out'])
+
+    def test_pack_boxes_deadline(self):
+        '''
+        tests that packing gives up when a parcel is started after the
+        deadline
+        '''
+        item = ItemTuple('Item1', [4, 4, 12], 0)
+        self.assertEqual(None, pack_boxes([4, 4, 12], [item] * 3,
+                                          deadline=time() - 1))
+        self.assertEqual([[item]] * 3, pack_boxes([4, 4, 12], [item] * 3,
+                                                  deadline=time() + 60))
+
+    def test_packing_algorithm_deadline(self):
+        '''
+        tests that the first box is packed even when the deadline has passed,
+        and no other box is
+        '''
+        items = [ItemGroup(ItemTuple('Item1', [2, 2, 2], 100), 2)]
+        useable_boxes = self.make_boxes([[2, 2, 4], [2, 4, 4], [4, 4, 4]])
+        box_dictionary = packing_algorithm(items, useable_boxes, 31710,
+                                           deadline=time() - 1)
+        self.assertTrue(box_dictionary['timed_out'])
+        self.assertEqual(1, box_dictionary['boxes_evaluated'])
+        self.assertEqual(0, box_dictionary['boxes_pruned'])
+        self.assertEqual(useable_boxes[2]['box'],
+                         box_dictionary['package'].box)
+
+    def test_pack_boxes_unpackable_items(self):
+        '''
+        tests that items too big for the empty box raise an error naming them
+        rather than opening new parcels forever
+        '''
+        items = [ItemTuple('Item1', [400, 400, 1400], 0),
+                 ItemTuple('Item2', [100, 100, 100], 0),
+                 ItemTuple('Item3', [500, 500, 500], 0)]
+        with self.assertRaises(UnpackableItemsError) as context:
+            pack_boxes([400, 400, 1250], items)
+        self.assertEqual(['Item1', 'Item3'], context.exception.item_numbers)
+        # in centimeters rather than quantized
+        self.assertEqual([4, 4, 12.5], context.exception.box_dimensions)
+        self.assertEqual('Items do not fit in a 4x4x12.5 box: Item1, Item3',
+                         context.exception.message)
+        self.assertIsInstance(context.exception, BoxError)
+
+    def test_pack_boxes_max_iterations(self):
+        item = ItemTuple('Item1', [1, 1, 1], 0)
+        with self.assertRaises(BoxError):
+            pack_boxes([4, 4, 4], [item] * 64, max_iterations=10)
+        self.assertEqual(1, len(pack_boxes([4, 4, 4], [item] * 64,
+                                           max_iterations=1000)))
+
+    def test_pack_boxes_max_weight(self):
+        '''
+        tests that a parcel is closed once the next item would make it too
+        heavy
+        '''
+        a = ItemTuple('A', [1, 1, 1], 60)
+        b = ItemTuple('B', [1, 1, 1], 30)
+        c = ItemTuple('C', [1, 1, 1], 50)
+        self.assertEqual([[a, b], [c]],
+                         pack_boxes([1, 1, 3], [a, b, c], max_weight=100))
+
+    def test_pack_boxes_max_weight_skips_heavy_items(self):
+        '''
+        tests that a lighter item can still join a parcel a heavier item
+        did not fit into
+        '''
+        a = ItemTuple('A', [1, 1, 2], 60)
+        c = ItemTuple('C', [1, 1, 1], 50)
+        b = ItemTuple('B', [1, 1, 1], 30)
+        self.assertEqual([[a, b], [c]],
+                         pack_boxes([1, 1, 4], [a, c, b], max_weight=100))
+
+    def test_pack_boxes_box_weight(self):
+        '''
+        tests that the weight of the box counts towards max_weight
+        '''
+        items = [ItemTuple('Item{}'.format(i), [1, 1, 1], 40)
+                 for i in xrange(5)]
+        self.assertEqual([items[:2], items[2:4], items[4:]],
+                         pack_box([1, 1, 5], 10, items, 100))
+
+    def test_pack_boxes_too_heavy(self):
+        item = ItemTuple('Item1', [1, 1, 1], 101)
+        with self.assertRaises(APIError):
+            pack_boxes([1, 1, 2], [ItemTuple('Item2', [1, 1, 1], 1), item],
+                       max_weight=100)
@@ -0,0 +1,94 @@
+from collections import namedtuple
+from errors import ItemTooHeavyError, UnpackableItemsError
+from packing_algorithm import packing_algorithm, ItemGroup, ItemTuple
+import parallel
+import unittest
+
+
+TestBox = namedtuple('TestBox', 'name, weight_g, total_cubic_cm')
+
+
+class PackCandidateBoxesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [ItemGroup(ItemTuple('Item1', [1, 2, 3], 10), 40),
+                      ItemGroup(ItemTuple('Item2', [2, 2, 5], 20), 15),
+                      ItemGroup(ItemTuple('Item3', [1, 1, 1], 5), 60)]
+        self.boxes = []
+        for size in xrange(5, 15):
+            dimensions = [size, size, size + 2]
+            self.boxes.append({
+                'box': TestBox('{}x{}x{}'.format(*dimensions), 50,
+                               size * size * (size + 2)),
+                'dimensions': dimensions
+            })
+
+    def tearDown(self):
+        parallel.close_pool()
+        parallel.configure(processes=None, min_boxes=8)
+
+    def test_configure(self):
+        '''
+        tests that only the settings given are changed
+        '''
+        parallel.configure(processes=3)
+        parallel.configure(min_boxes=5)
+        self.assertEqual((3, 5), (parallel.PROCESSES, parallel.MIN_BOXES))
+        parallel.configure(processes=None)
+        self.assertEqual((None, 5), (parallel.PROCESSES, parallel.MIN_BOXES))
+
+    def test_parallel_same_as_serial(self):
+        '''
+        tests that packing the boxes in the pool gives the same packing
+        '''
+        parallel.configure(processes=2, min_boxes=2)
+        self.assertEqual(
+            packing_algorithm(self.items, self.boxes, 800)['package'],
+            packing_algorithm(self.items, self.boxes, 800,
+                              parallel=True)['package'])
+        self.assertIsNotNone(parallel._pool)
+
+    def test_few_boxes_packed_serially(self):
+        '''
+        tests that the pool is not used below the minimum number of boxes
+        '''
+        parallel.configure(processes=2, min_boxes=20)
+        packed_boxes = parallel.pack_useable_boxes(self.items, self.boxes,
+                                                   800).packed_boxes
+        best_box = packing_algorithm(self.items, self.boxes,
+                                     800)['package'].box
+        self.assertIn(best_box, packed_boxes)
+        self.assertIsNone(parallel._pool)
+
+    def test_errors_name_items(self):
+        '''
+        tests that the errors raised in the pool name the items, not the
+        indexes they are sent to the pool as
+        '''
+        parallel.configure(processes=2, min_boxes=2)
+        items = [ItemGroup(ItemTuple('Heavy', [1, 1, 1], 2960), 1)]
+        with self.assertRaises(ItemTooHeavyError) as context:
+            parallel.pack_useable_boxes(items, self.boxes[:4], 3000)
+        self.assertEqual('Heavy', context.exception.item_number)
+        self.assertEqual('SKU is too heavy: Heavy', context.exception.message)
+        items = self.items + [ItemGroup(ItemTuple('Long', [1, 1, 20], 1), 1)]
+        with self.assertRaises(UnpackableItemsError) as context:
+            parallel.pack_useable_boxes(items, self.boxes[:4], 800)
+        self.assertEqual(['Long'], context.exception.item_numbers)
+
+    def test_too_heavy_boxes_left_out(self):
+        '''
+        tests that boxes too heavy for a SKU are left out the same way in the
+        pool as in this process, whichever box is pruned first
+        '''
+        parallel.configure(processes=2, min_boxes=2)
+        items = [ItemGroup(ItemTuple('Heavy', [1, 1, 1], 2950), 1)]
+        boxes = [dict(box_dict, box=box_dict['box']._replace(
+                     weight_g=0 if i == 0 else 100))
+                 for i, box_dict in enumerate(self.boxes[:4])]
+        serial = packing_algorithm(items, boxes, 3000)
+        self.assertEqual(boxes[0]['box'], serial['package'].box)
+        self.assertEqual(serial['package'], packing_algorithm(
+            items, boxes, 3000, parallel=True)['package'])
+        with self.assertRaises(ItemTooHeavyError):
+            packing_algorithm(items, boxes[1:], 3000, parallel=True)
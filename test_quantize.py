@@ -0,0 +1,35 @@
+from packing_algorithm import best_fit, does_it_fit, volume
+from quantize import (dequantize, dequantize_volume, quantize,
+                      quantize_dims, unquantized_lower_bound)
+import unittest
+
+
+class QuantizeTest(unittest.TestCase):
+
+    def test_quantize_dims(self):
+        self.assertEqual([254, 610, 1000], quantize_dims([10, 2.54, 6.1]))
+        self.assertEqual(390, quantize(3.8999999999))
+
+    def test_dequantize(self):
+        self.assertEqual(3.9, dequantize(390))
+        self.assertIsInstance(dequantize(400), int)
+        self.assertEqual(6, dequantize_volume(quantize(1) * quantize(2) *
+                                              quantize(3)))
+
+    def test_unquantized_lower_bound(self):
+        bound = unquantized_lower_bound(390)
+        self.assertEqual(390, quantize(bound))
+        self.assertEqual(389, quantize(bound - 0.0001))
+
+    def test_exact_left_over_block(self):
+        '''
+        tests that an item fits exactly into the block left over by another
+        item, where float residue would keep it out
+        '''
+        self.assertFalse(does_it_fit([0.2, 1, 1], best_fit([0.1, 1, 1],
+                                                          [0.3, 1, 1])[0]))
+        block = best_fit(quantize_dims([0.1, 1, 1]),
+                         quantize_dims([0.3, 1, 1]))
+        self.assertEqual([[20, 100, 100]], block)
+        self.assertTrue(does_it_fit(quantize_dims([0.2, 1, 1]), block[0]))
+        self.assertEqual(0.2, dequantize_volume(volume(block[0])))
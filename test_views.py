@@ -63,6 +63,38 @@ class BoxPackingApiTest(BaseShotputTestCaseWithData):
         return self.post_json('/box_packing_api/full{}'.format(api_key), token)
 
 
+class BatchBoxPackingApiTest(BaseShotputTestCaseWithData):
+    @require_data(users='rect')
+    @login_as('rect')
+    @permission_required_test('rect', 'rectangles', 'shotput',
+                              permissions.box_packing_read,
+                              setup=False, success_status=400,
+                              test_api_keys='api_key',
+                              api_type=api_settings.BOX_PACKING)
+    def test_batch_box_packing_api_forbidden(self, token, api_key):
+        token = token if api_key is None else None
+        api_key = ('' if api_key is None
+                   else '?key={}'.format(api_key.get_key()))
+        return self.post_json('/box_packing_api/batch{}'.format(api_key),
+                              token)
+
+
+class StreamBoxPackingApiTest(BaseShotputTestCaseWithData):
+    @require_data(users='rect')
+    @login_as('rect')
+    @permission_required_test('rect', 'rectangles', 'shotput',
+                              permissions.box_packing_read,
+                              setup=False, success_status=400,
+                              test_api_keys='api_key',
+                              api_type=api_settings.BOX_PACKING)
+    def test_stream_box_packing_api_forbidden(self, token, api_key):
+        token = token if api_key is None else None
+        api_key = ('' if api_key is None
+                   else '?key={}'.format(api_key.get_key()))
+        return self.post_json('/box_packing_api/stream{}'.format(api_key),
+                              token)
+
+
 class ComparePackTest(BaseShotputTestCaseWithData):
     def setUp(self):
         super(ComparePackTest, self).setUp()
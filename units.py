@@ -10,6 +10,20 @@ FEET = 'feet'
 METERS = 'meters'
 LENGTH_UNITS = [INCHES, CENTIMETERS, FEET, METERS]
 
+# how many of the unit the packing works in make one of each unit
+GRAMS_PER_UNIT = {
+    KILOGRAMS: 1000.0,
+    GRAMS: 1.0,
+    POUNDS: 453.59237,
+    OUNCES: 28.349523125,
+}
+CENTIMETERS_PER_UNIT = {
+    INCHES: 2.54,
+    CENTIMETERS: 1.0,
+    FEET: 30.48,
+    METERS: 100.0,
+}
+
 HALF_DAY = 12 * 60 * 60
 ONE_DAY = 24 * 60 * 60
 ONE_WEEK = ONE_DAY * 7
@@ -8,13 +8,76 @@ from ..authentication.login_required import (login_required,
 from ..crossdomain import crossdomain
 from ..permissions.decorators import view_requires_team_permission
 
-from .helper import (api_packing_algorithm, compare_1000_times,
-                     how_many_items_fit, pre_pack_boxes, space_after_packing)
+from .codec import (dumps, loads, JSON_MIMETYPE, MIMETYPES, MSGPACK_MIMETYPE,
+                    NDJSON_MIMETYPE)
+from .helper import (api_packing_algorithm, batch_packing_algorithm,
+                     compare_1000_times, how_many_items_fit, pre_pack_boxes,
+                     space_after_packing, stream_packing_algorithm)
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import (abort, Blueprint, current_app, request, Response,
+                   stream_with_context)
+from flask_login import current_user
 
 blueprint = Blueprint('box_packing', __name__)
 
+# header a client can send instead of the deadline_ms option
+DEADLINE_HEADER = 'X-Packing-Deadline-Ms'
+
+
+def _options_with_deadline(options):
+    '''
+    adds the deadline of the DEADLINE_HEADER header to the options, unless
+    they already have a deadline_ms
+    '''
+    deadline_ms = request.headers.get(DEADLINE_HEADER)
+    if deadline_ms is None or 'deadline_ms' in (options or {}):
+        return options
+    return dict(options or {}, deadline_ms=deadline_ms)
+
+
+def _team_id():
+    '''
+    the id of the team making the request, the packing_cache namespace its
+    packings are cached in, so packing_cache.flush(team_id) reaches them.
+    None for a request made without a team
+    '''
+    return getattr(current_user, 'team_id', None)
+
+
+def _request_body():
+    '''
+    reads the body of the request, as MessagePack when it is sent as
+    application/msgpack and as json whatever its Content-Type otherwise
+
+    Raises:
+        UnsupportedMediaType (415) for MessagePack when msgpack is not
+            installed
+        BadRequest (400) when the body cannot be read
+    '''
+    if request.mimetype == MSGPACK_MIMETYPE and \
+            MSGPACK_MIMETYPE not in MIMETYPES:
+        abort(415)
+    try:
+        # the raw bytes go to the decoder, not a unicode copy of them
+        return loads(request.get_data(cache=False), request.mimetype)
+    except ValueError as e:
+        abort(400, e.message)
+
+
+def _respond(*args, **kwargs):
+    '''
+    jsonify, in the mimetype of MIMETYPES the client accepts best. A client
+    accepting any of them is answered in the mimetype it sent
+    '''
+    preferred = sorted(MIMETYPES,
+                       key=lambda mimetype: mimetype != request.mimetype)
+    if request.accept_mimetypes:
+        mimetype = request.accept_mimetypes.best_match(preferred,
+                                                       JSON_MIMETYPE)
+    else:
+        mimetype = preferred[0]
+    return Response(dumps(dict(*args, **kwargs), mimetype), mimetype=mimetype)
+
 
 @blueprint.route('/box_packing_api/basic',
                  methods=['POST', 'OPTIONS'])
@@ -31,8 +94,10 @@ def get_best_fit():
         'packages': List[Dict[
             items_packed: Dict[item, quantity]
             total_weight: float
+            count: int, with the compact option, how many of this parcel
+                there are in a row
     '''
-    json_data = request.get_json(force=True)
+    json_data = _request_body()
     current_app.log.data(json_data)
     try:
         products_info = json_data['products_info']
@@ -40,27 +105,28 @@ def get_best_fit():
         options = json_data.get('options', {})
     except KeyError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.missing_value_for(e)), 400
+        return _respond(error=msg.missing_value_for(e)), 400
     try:
-        items_arrangement = pre_pack_boxes(box_info, products_info, options)
+        items_arrangement = pre_pack_boxes(box_info, products_info, options,
+                                           _team_id())
     except BoxError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), 400
+        return _respond(error=e.message), 400
     except TypeError as e:
         current_app.log.error(e)
-        return jsonify(error='Invalid data in request.'), 400
+        return _respond(error='Invalid data in request.'), 400
     except ValueError as e:
         current_app.log.error(e)
         value = e.message.split(' ')[-1]
-        return jsonify(error=('Invalid data in request. Check value {}'
+        return _respond(error=('Invalid data in request. Check value {}'
                               .format(value))), 400
     except KeyError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.missing_value_for(e.message))
+        return _respond(error=msg.missing_value_for(e.message))
     except APIError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), e.status_code
-    return jsonify(packages=items_arrangement)
+        return _respond(error=e.message), e.status_code
+    return _respond(packages=items_arrangement)
 
 
 @blueprint.route('/box_packing_api/remaining_volume',
@@ -99,7 +165,7 @@ def get_space_after_packing():
     }
 
     '''
-    json_data = request.get_json(force=True)
+    json_data = _request_body()
     current_app.log.data(json_data)
     try:
         item_info = json_data['product_info']
@@ -107,17 +173,17 @@ def get_space_after_packing():
         space = space_after_packing(item_info, box_info)
     except KeyError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.missing_value_for(e.message)), 400
+        return _respond(error=msg.missing_value_for(e.message)), 400
     except TypeError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.invalid_data), 400
+        return _respond(error=msg.invalid_data), 400
     except BoxError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), 400
+        return _respond(error=e.message), 400
     except APIError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), e.status_code
-    return jsonify(space)
+        return _respond(error=e.message), e.status_code
+    return _respond(space)
 
 
 @blueprint.route('/box_packing_api/capacity', methods=['POST', 'OPTIONS'])
@@ -136,30 +202,30 @@ def how_many_fit():
       "total_packed": 1
     }
     '''
-    json_data = request.get_json(force=True)
+    json_data = _request_body()
     current_app.log.data(json_data)
     try:
         item_info = json_data['product_info']
         box_info = json_data['box_info']
         max_packed = json_data.get('max_packed')
-        return jsonify(how_many_items_fit(item_info, box_info, max_packed))
+        return _respond(how_many_items_fit(item_info, box_info, max_packed))
     except KeyError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.missing_value_for(e.message)), 400
+        return _respond(error=msg.missing_value_for(e.message)), 400
     except TypeError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.invalid_data), 400
+        return _respond(error=msg.invalid_data), 400
     except BoxError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message)
+        return _respond(error=e.message)
     except ValueError as e:
         current_app.log.error(e)
         value = e.message.split(' ')[-1]
-        return jsonify(error=('Invalid data in request. Check value {}'
+        return _respond(error=('Invalid data in request. Check value {}'
                               .format(value))), 400
     except APIError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), e.status_code
+        return _respond(error=e.message), e.status_code
 
 
 @blueprint.route('/box_packing_api/compare_packing_efficiency',
@@ -176,7 +242,7 @@ def compare_pack():
     params = request.args.to_dict()
     current_app.log.data(params)
     trials = params.get('trials')
-    return jsonify(compare_1000_times(trials))
+    return _respond(compare_1000_times(trials))
 
 
 @blueprint.route('/box_packing_api/full', methods=['POST', 'OPTIONS'])
@@ -189,6 +255,14 @@ def box_packing_api():
     a full access endpoint to the box algorithm, which accepts boxes and items
     and returns the best box and the items arrangement
 
+    the time spent packing can be limited with the deadline_ms option or the
+    X-Packing-Deadline-Ms header, the best box found by then is returned with
+    timed_out set
+
+    with the compact option each box used is listed once in 'boxes' and
+    parcels name their box, identical parcels in a row are given once with a
+    count. See api_packing_algorithm
+
     Outputs:
         Dict[
            'package_contents': List[Dict[
@@ -204,31 +278,144 @@ def box_packing_api():
                     name: String
                 ]
             ]
+            'boxes_pruned': int
+            'boxes_evaluated': int
+            'timed_out': bool
         ]
     '''
-    json_data = request.get_json(force=True)
+    json_data = _request_body()
     current_app.log.data(json_data)
     try:
         boxes_info = json_data['boxes_info']
         products_info = json_data['products_info']
-        options = json_data.get('options', {})
+        options = _options_with_deadline(json_data.get('options', {}))
         package_contents = api_packing_algorithm(boxes_info, products_info,
-                                                 options)
+                                                 options, _team_id())
+    except KeyError as e:
+        current_app.log.error(e)
+        return _respond(error=msg.missing_value_for(e.message)), 400
+    except TypeError as e:
+        current_app.log.error(e)
+        return _respond(error=msg.invalid_data), 400
+    except BoxError as e:
+        current_app.log.error(e)
+        return _respond(error=e.message)
+    except ValueError as e:
+        current_app.log.error(e)
+        value = e.message.split(' ')[-1]
+        return _respond(error=('Invalid data in request. Check value {}'
+                              .format(value))), 400
+    except APIError as e:
+        current_app.log.error(e)
+        return _respond(error=e.message), e.status_code
+    return _respond(package_contents)
+
+
+@blueprint.route('/box_packing_api/batch', methods=['POST', 'OPTIONS'])
+@crossdomain(api=True)
+@login_required
+@verify_box_api
+@view_requires_team_permission(permissions.box_packing_read)
+def batch_box_packing_api():
+    '''
+    the full endpoint for many orders at once, which packs every order against
+    one shared list of boxes. An order that cannot be packed gets an error of
+    its own, the rest of the batch is still packed
+
+    Input:
+    {
+        "boxes_info": [box, as for /box_packing_api/full],
+        "orders": [
+            {
+                "order_id": "A100",
+                "products_info": [product, as for /box_packing_api/full],
+                "options": {} (optional, overrides options for this order)
+            }
+        ],
+        "options": {} (optional)
+    }
+
+    Outputs:
+        Dict[
+            'orders': List[Dict[
+                'order_id': String
+                'packages': as for /box_packing_api/full
+                'boxes_pruned': int
+            ] or Dict[
+                'order_id': String
+                'error': String
+            ]], in the same order as the request
+        ]
+    '''
+    json_data = _request_body()
+    current_app.log.data(json_data)
+    try:
+        boxes_info = json_data['boxes_info']
+        orders = json_data['orders']
+        options = _options_with_deadline(json_data.get('options', {}))
+        results = batch_packing_algorithm(boxes_info, orders, options,
+                                          _team_id())
+    except KeyError as e:
+        current_app.log.error(e)
+        return _respond(error=msg.missing_value_for(e.message)), 400
+    except TypeError as e:
+        current_app.log.error(e)
+        return _respond(error=msg.invalid_data), 400
+    except BoxError as e:
+        current_app.log.error(e)
+        return _respond(error=e.message), 400
+    except ValueError as e:
+        current_app.log.error(e)
+        value = e.message.split(' ')[-1]
+        return _respond(error=('Invalid data in request. Check value {}'
+                              .format(value))), 400
+    except APIError as e:
+        current_app.log.error(e)
+        return _respond(error=e.message), e.status_code
+    return _respond(orders=results)
+
+
+@blueprint.route('/box_packing_api/stream', methods=['POST', 'OPTIONS'])
+@crossdomain(api=True)
+@login_required
+@verify_box_api
+@view_requires_team_permission(permissions.box_packing_read)
+def stream_box_packing_api():
+    '''
+    the batch endpoint for more orders than fit in one json body. Takes
+    newline delimited json and answers with newline delimited json, packing
+    each order as it is read
+
+    Input (application/x-ndjson), the DEADLINE_HEADER header applies to
+    every order unless the options of the first line have a deadline_ms:
+        {"boxes_info": [...], "options": {...}}
+        {"order_id": "A100", "products_info": [...], "options": {...}}
+        {"order_id": "A101", "products_info": [...]}
+        ...
+
+    Outputs (application/x-ndjson), one line per order, in order:
+        {"order_id": "A100", "packages": [...], "boxes_pruned": 0}
+        {"order_id": "A101", "error": "..."}
+        ...
+    '''
+    try:
+        results = stream_packing_algorithm(request.stream, _team_id(),
+                                           _options_with_deadline({}))
     except KeyError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.missing_value_for(e.message)), 400
+        return _respond(error=msg.missing_value_for(e.message)), 400
     except TypeError as e:
         current_app.log.error(e)
-        return jsonify(error=msg.invalid_data), 400
+        return _respond(error=msg.invalid_data), 400
     except BoxError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message)
+        return _respond(error=e.message), 400
     except ValueError as e:
         current_app.log.error(e)
         value = e.message.split(' ')[-1]
-        return jsonify(error=('Invalid data in request. Check value {}'
+        return _respond(error=('Invalid data in request. Check value {}'
                               .format(value))), 400
     except APIError as e:
         current_app.log.error(e)
-        return jsonify(error=e.message), e.status_code
-    return jsonify(package_contents)
+        return _respond(error=e.message), e.status_code
+    return Response(stream_with_context(results), mimetype=NDJSON_MIMETYPE)